@@ -0,0 +1,166 @@
+"""
+Duplicate patient detection and merging.
+
+Comparing every patient with every other is O(n²). Instead each patient carries a
+blocking key (Patient.blocking_key, indexed; see utils.blocking_key): Soundex of the
+last and first name, sex and birthdate. Likely duplicates share a key, so
+
+- registration looks up one block with an index equality (`find_duplicates`), and
+- the batch report (`duplicate_groups`) only lists blocks with more than one patient,
+  found with one GROUP BY over the index.
+
+Within a block, patients are compared by the similarity of their normalized full names
+(difflib ratio, 0-1); pairs below MIN_SIMILARITY (e.g. "Maria" vs "Mauro", same Soundex)
+are dropped.
+
+`merge_patients` moves a duplicate's readings, queue history and measurement sessions
+to the patient being kept, fills in whatever the kept record is missing, and deletes
+the duplicate. If both records are waiting in the queue, only the earlier entry is kept.
+"""
+
+from difflib import SequenceMatcher
+from itertools import chain, groupby
+
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import MeasurementSession, Patient, QueueEntry, QueueEntryArchive, QueueVersion, VitalSigns
+from .queue_engine import get_queue_engine
+from .rollups import PERIODS, rebuild_period
+from .streaming import keyset_chunks
+from .utils import BLOCKING_FIELDS, blocking_key, words
+
+MIN_SIMILARITY = 0.75
+# What a duplicate check shows staff; never the PIN
+CANDIDATE_FIELDS = ('id', 'patient_id', 'first_name', 'middle_initial', 'last_name', 'sex', 'birthdate', 'contact', 'last_visit')
+# Copied from the duplicate when the kept record has none
+FILL_FIELDS = ('middle_initial', 'birthdate', 'username', 'fingerprint_id', 'address')
+
+
+def full_name(first_name, last_name):
+    return ' '.join(words(first_name) + words(last_name))
+
+
+def name_similarity(a, b):
+    """How alike two (first name, last name) pairs are, 0-1, ignoring case, accents and word order."""
+    a, b = full_name(*a), full_name(*b)
+    return max(
+        SequenceMatcher(None, a, b).ratio(),
+        SequenceMatcher(None, ' '.join(sorted(a.split())), ' '.join(sorted(b.split()))).ratio(),
+    )
+
+
+def find_duplicates(first_name, last_name, sex, birthdate, exclude=None):
+    """Existing patients that are probably the person described, most similar first (one indexed lookup)."""
+    key = blocking_key(first_name, last_name, sex, birthdate)
+    block = Patient.objects.filter(blocking_key=key)
+    if exclude is not None:
+        block = block.exclude(pk=exclude)
+    candidates = []
+    for row in block.values(*CANDIDATE_FIELDS):
+        similarity = name_similarity((first_name, last_name), (row['first_name'], row['last_name']))
+        if similarity >= MIN_SIMILARITY:
+            candidates.append({**row, 'similarity': round(similarity, 3)})
+    candidates.sort(key=lambda row: (-row['similarity'], row['id']))
+    return candidates
+
+
+def duplicate_groups():
+    """
+    Yield every group of probable duplicates: {"blocking_key", "patients": [...]}, oldest
+    patient first, each with its name similarity to the closest earlier one. Rows are
+    read in keyset chunks on (blocking_key, id), a block at a time.
+    """
+    shared = (
+        Patient.objects.exclude(blocking_key='').values('blocking_key')
+        .annotate(patients=Count('id')).filter(patients__gt=1).values('blocking_key')
+    )
+    chunks = keyset_chunks(
+        Patient.objects.filter(blocking_key__in=shared).values('blocking_key', *CANDIDATE_FIELDS),
+        ('blocking_key', 'id'), 2000, key=lambda row: (row['blocking_key'], row['id']),
+    )
+    rows = chain.from_iterable(chunks)
+    for key, block in groupby(rows, key=lambda row: row['blocking_key']):
+        block = list(block)
+        # Link each patient to the most similar earlier one, so A~B~C chains stay together
+        members = [{**_candidate(block[0]), 'similarity': 1.0}]
+        names = [(block[0]['first_name'], block[0]['last_name'])]
+        for row in block[1:]:
+            name = (row['first_name'], row['last_name'])
+            similarity = max(name_similarity(name, other) for other in names)
+            if similarity >= MIN_SIMILARITY:
+                members.append({**_candidate(row), 'similarity': round(similarity, 3)})
+                names.append(name)
+        if len(members) > 1:
+            yield {'blocking_key': key, 'patients': members}
+
+
+def _candidate(row):
+    return {field: row[field] for field in CANDIDATE_FIELDS}
+
+
+def rebuild_blocking_keys(batch_size=1000):
+    """Recompute every patient's key (after bulk imports or raw SQL edits); returns how many changed."""
+    changed = 0
+    last_pk = 0
+    while True:
+        batch = list(Patient.objects.filter(pk__gt=last_pk).order_by('pk').only('pk', 'blocking_key', *BLOCKING_FIELDS)[:batch_size])
+        if not batch:
+            return changed
+        stale = []
+        for patient in batch:
+            key = blocking_key(patient.first_name, patient.last_name, patient.sex, patient.birthdate)
+            if key != patient.blocking_key:
+                patient.blocking_key = key
+                stale.append(patient)
+        Patient.objects.bulk_update(stale, ['blocking_key'])
+        changed += len(stale)
+        last_pk = batch[-1].pk
+
+
+@transaction.atomic
+def merge_patients(keep, duplicate):
+    """
+    Fold `duplicate` into `keep` and delete it. Returns {relation: rows moved}. The
+    blocking keys don't have to match: staff may merge any two records of one person.
+    """
+    if keep.pk == duplicate.pk:
+        raise ValueError("Can't merge a patient into itself")
+    # Row locks, as ingest takes them, so neither record gets queued while we merge
+    list(Patient.objects.select_for_update().filter(pk__in=[keep.pk, duplicate.pk]).order_by('pk'))
+    # A patient waits in the queue once: if both records are waiting, the earlier entry stays
+    # (taking the more urgent of the two priorities) and the other is cancelled
+    waiting = list(QueueEntry.objects.filter(patient__in=[keep, duplicate], status=QueueEntry.WAITING).order_by('entered_at', 'id'))
+    if len(waiting) == 2:
+        first, second = waiting
+        QueueEntry.objects.filter(pk=second.pk).update(status=QueueEntry.CANCELLED, finished_at=timezone.now())
+        if second.priority_rank < first.priority_rank:
+            QueueEntry.objects.filter(pk=first.pk).update(
+                priority=second.priority, priority_rank=second.priority_rank, rule_version=second.rule_version
+            )
+    moved = {
+        'vital_signs': VitalSigns.objects.filter(patient=duplicate).update(patient=keep),
+        'queue_entries': QueueEntry.objects.filter(patient=duplicate).update(patient=keep),
+        'archived_queue_entries': QueueEntryArchive.objects.filter(patient=duplicate).update(patient=keep),
+        'measurement_sessions': MeasurementSession.objects.filter(patient=duplicate).update(patient=keep),
+    }
+    filled = {field: getattr(duplicate, field) for field in FILL_FIELDS if not getattr(keep, field) and getattr(duplicate, field)}
+    if keep.contact in ('', 'N/A') and duplicate.contact not in ('', 'N/A'):
+        filled['contact'] = duplicate.contact
+    last_visit = max(filter(None, (keep.last_visit, duplicate.last_visit)), default=None)
+    duplicate.delete()  # Frees its username and fingerprint_id for the kept record
+
+    for field, value in filled.items():
+        setattr(keep, field, value)
+    keep.last_visit = last_visit
+    keep.save()
+    if moved['vital_signs']:
+        keep.refresh_latest_vitals()
+        for period in PERIODS:
+            rebuild_period(period, [keep.pk])
+    if moved['queue_entries']:
+        # The moved entries were re-pointed with a bulk UPDATE, which the engines don't see
+        QueueVersion.objects.bump()
+        transaction.on_commit(get_queue_engine().reset)
+    return moved
@@ -0,0 +1,140 @@
+"""
+Bulk exports of patients, vitals and queue history as CSV or NDJSON.
+
+Rows come straight from `.values_list(...)` in keyset chunks (streaming.keyset_chunks;
+no model instances, no serializers) and are formatted a chunk at a time, so a year of
+vitals goes out in constant memory. Used by /api/export/<dataset>.<csv|ndjson> (streamed, see
+streaming.py) and `manage.py export_data`.
+
+Each dataset has a date column for ?date_from=/?date_to= (local dates, inclusive) and a
+fixed set of exportable columns, selected with ?columns=a,b,c. The patient PIN is never
+exported.
+"""
+
+import csv
+import io
+import itertools
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .models import Patient, QueueEntry, QueueEntryArchive, VitalSigns
+from .streaming import STREAM_CHUNK_SIZE, keyset_chunks
+
+# querysets: callable returning the querysets to export, one after the other
+Dataset = namedtuple('Dataset', 'querysets date_field ordering columns')
+
+DATASETS = {
+    'patients': Dataset(
+        lambda: [Patient.objects.all()], 'last_visit', ('id',),
+        {
+            'patient_id': 'patient_id', 'first_name': 'first_name', 'middle_initial': 'middle_initial',
+            'last_name': 'last_name', 'sex': 'sex', 'birthdate': 'birthdate', 'contact': 'contact',
+            'address': 'address', 'username': 'username', 'last_visit': 'last_visit',
+        },
+    ),
+    'vitals': Dataset(
+        lambda: [VitalSigns.objects.all()], 'date_time_recorded', ('date_time_recorded', 'id'),
+        {
+            'id': 'id', 'patient_id': 'patient__patient_id', 'recorded_at': 'date_time_recorded',
+            'device_id': 'device_id', 'heart_rate': 'heart_rate', 'temperature': 'temperature',
+            'oxygen_saturation': 'oxygen_saturation', 'blood_pressure_systolic': 'blood_pressure_systolic',
+            'blood_pressure_diastolic': 'blood_pressure_diastolic', 'height': 'height',
+            'weight': 'weight', 'BMI': 'BMI',
+        },
+    ),
+    # Archived (finished) entries first, then whatever is still in the live table
+    'queue': Dataset(
+        lambda: [QueueEntryArchive.objects.all(), QueueEntry.objects.all()], 'entered_at', ('entered_at', 'id'),
+        {
+            'queue_number': 'queue_number', 'patient_id': 'patient__patient_id', 'priority': 'priority',
+            'status': 'status', 'entered_at': 'entered_at', 'finished_at': 'finished_at',
+            'rule_version': 'rule_version',
+        },
+    ),
+}
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def resolve_columns(dataset, names=None):
+    """[(column name, ORM path)] for `names` (default: all of the dataset's columns)."""
+    columns = DATASETS[dataset].columns
+    if not names:
+        return list(columns.items())
+    unknown = [name for name in names if name not in columns]
+    if unknown:
+        raise ExportError(f"Unknown {dataset} columns: {', '.join(unknown)} (available: {', '.join(columns)})")
+    return [(name, columns[name]) for name in names]
+
+
+def export_rows(dataset, columns, date_from=None, date_to=None, chunk_size=STREAM_CHUNK_SIZE):
+    """Value tuples for `columns` (from resolve_columns), read `chunk_size` rows per query."""
+    spec = DATASETS[dataset]
+    paths = [path for _, path in columns]
+    keys = len(spec.ordering)  # The ordering values ride along at the end of each row
+    for queryset in spec.querysets():
+        if date_from:
+            queryset = queryset.filter(**{f'{spec.date_field}__gte': timezone.make_aware(datetime.combine(date_from, time.min))})
+        if date_to:
+            end = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min))
+            queryset = queryset.filter(**{f'{spec.date_field}__lt': end})
+        rows = queryset.values_list(*paths, *(field.lstrip('-') for field in spec.ordering))
+        for chunk in keyset_chunks(rows, spec.ordering, chunk_size, key=lambda row: row[-keys:]):
+            yield from (row[:-keys] for row in chunk)
+
+
+def _cell(value):
+    # ISO 8601 rather than str()'s "2025-01-31 08:00:00+00:00", same as the JSON API
+    return value.isoformat() if isinstance(value, date) else value
+
+
+def _batches(rows, size):
+    while batch := list(itertools.islice(rows, size)):
+        yield batch
+
+
+def render_csv(names, rows, chunk_size=STREAM_CHUNK_SIZE):
+    """Header line, then CSV text in chunks of `chunk_size` rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    for chunk in _batches(rows, chunk_size):
+        writer.writerows([_cell(value) for value in row] for row in chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()  # Header of an empty export
+
+
+def render_ndjson(names, rows, chunk_size=STREAM_CHUNK_SIZE):
+    """One JSON object per line, in chunks of `chunk_size` rows."""
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for chunk in _batches(rows, chunk_size):
+        yield ''.join(
+            encoder.encode(dict(zip(names, (_cell(value) for value in row)))) + '\n' for row in chunk
+        )
+
+
+def export(dataset, fmt, column_names=None, date_from=None, date_to=None):
+    """(content type, iterator of str chunks); raises ExportError for a bad dataset, format or column."""
+    if dataset not in DATASETS:
+        raise ExportError(f"Unknown dataset {dataset!r} (available: {', '.join(DATASETS)})")
+    if fmt not in FORMATS:
+        raise ExportError(f"Unknown format {fmt!r} (available: {', '.join(FORMATS)})")
+    if date_from and date_to and date_from > date_to:
+        raise ExportError("date_from must not be after date_to")
+    columns = resolve_columns(dataset, column_names)
+    names = [name for name, _ in columns]
+    rows = export_rows(dataset, columns, date_from, date_to)
+    render = render_csv if fmt == 'csv' else render_ndjson
+    return FORMATS[fmt], render(names, rows)
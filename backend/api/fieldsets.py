@@ -0,0 +1,215 @@
+"""
+Sparse fieldsets: ?fields= / ?omit= on GET endpoints.
+
+    GET /api/queue/?fields=queue_number,patient.first_name,patient.last_name
+    GET /api/patients/?omit=address,triage_snapshot
+
+Names are the serializer's output keys; nested serializers take dotted names
+(`patient.first_name`), and a bare nested name (`patient`) means all of it. Unknown
+names are a 400.
+
+The projection is applied twice:
+
+- `SparseFieldsMixin` (serializers) drops the fields from the serializer, so they are
+  neither computed nor sent;
+- `SparseFieldsViewMixin` (views) passes what is left to `.only()`, following nested
+  serializers through select_related, so the other columns are never read. A field
+  that isn't a plain column (e.g. Patient.age) lists the columns it needs in
+  `Meta.field_columns`; a serializer with a field whose columns can't be told is
+  left unprojected.
+
+In-memory payloads (the queue engine's) are cut down with `trim` instead.
+"""
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+
+
+def parse_fieldset(value):
+    """"a,patient.b" -> {'a': None, 'patient': {'b': None}} (None: the whole field); None if not given."""
+    if value is None:
+        return None
+    tree = {}
+    for path in (part.strip() for part in value.split(',')):
+        if not path:
+            continue
+        *parents, leaf = path.split('.')
+        node = tree
+        for name in parents:
+            if node.get(name, {}) is None:
+                break  # The whole field is already in
+            node = node.setdefault(name, {})
+        else:
+            node[leaf] = None
+    return tree
+
+
+def requested_fieldsets(request):
+    """(fields, omit) trees from a GET request's query string; (None, None) otherwise."""
+    if request is None or request.method != 'GET':
+        return None, None  # Writes need every field for validation
+    params = request.query_params
+    return parse_fieldset(params.get(FIELDS_PARAM)), parse_fieldset(params.get(OMIT_PARAM))
+
+
+def _nested(serializer, name):
+    field = serializer.fields[name]
+    if isinstance(field, serializers.ListSerializer):
+        field = field.child
+    if not isinstance(field, serializers.Serializer):
+        raise serializers.ValidationError({FIELDS_PARAM: f"{name} has no subfields"})
+    return field
+
+
+def _check(serializer, names, param):
+    unknown = sorted(set(names) - set(serializer.fields))
+    if unknown:
+        raise serializers.ValidationError(
+            {param: f"Unknown field(s): {', '.join(unknown)} (available: {', '.join(serializer.fields)})"}
+        )
+
+
+def restrict(serializer, fields=None, omit=None):
+    """Remove fields from a serializer instance: keep only `fields`, then drop `omit` (trees from parse_fieldset)."""
+    if fields is not None:
+        _check(serializer, fields, FIELDS_PARAM)
+        for name in list(serializer.fields):
+            if name not in fields:
+                serializer.fields.pop(name)
+            elif fields[name] is not None:
+                restrict(_nested(serializer, name), fields[name])
+    if omit:
+        _check(serializer, omit, OMIT_PARAM)
+        for name, sub in omit.items():
+            if sub is None:
+                serializer.fields.pop(name)
+            else:
+                restrict(_nested(serializer, name), omit=sub)
+
+
+def model_columns(serializer, prefix=''):
+    """
+    ORM paths the serializer's fields read (for .only()), nested serializers included, or
+    None if some field's columns can't be told.
+    """
+    meta = serializer.Meta
+    model = meta.model
+    needs = getattr(meta, 'field_columns', {})
+    columns = []
+    for name, field in serializer.fields.items():
+        if name in needs:
+            columns += [prefix + column for column in needs[name]]
+            continue
+        if field.source == '*' or '.' in field.source:
+            return None
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            return None
+        if not model_field.concrete or model_field.many_to_many:
+            return None
+        columns.append(prefix + field.source)
+        if isinstance(field, serializers.Serializer):
+            nested = model_columns(field, f'{prefix}{field.source}__')
+            if nested is None:
+                return None
+            columns += nested
+    return columns
+
+
+def shape(serializer):
+    """{name: nested shape or None} of a serializer's fields, to check names given to `trim`."""
+    return {
+        name: shape(field.child if isinstance(field, serializers.ListSerializer) else field)
+        if isinstance(field, (serializers.Serializer, serializers.ListSerializer)) else None
+        for name, field in serializer.fields.items()
+    }
+
+
+def _check_shape(tree, allowed, param):
+    if not tree:
+        return
+    unknown = sorted(set(tree) - set(allowed))
+    if unknown:
+        raise serializers.ValidationError(
+            {param: f"Unknown field(s): {', '.join(unknown)} (available: {', '.join(allowed)})"}
+        )
+    for name, sub in tree.items():
+        if sub is not None:
+            if allowed[name] is None:
+                raise serializers.ValidationError({param: f"{name} has no subfields"})
+            _check_shape(sub, allowed[name], param)
+
+
+def trim(rows, allowed, fields=None, omit=None):
+    """
+    Cut already-serialized dicts down to `fields` minus `omit` (trees from parse_fieldset),
+    after checking the names against `allowed` (a `shape`).
+    """
+    _check_shape(fields, allowed, FIELDS_PARAM)
+    _check_shape(omit, allowed, OMIT_PARAM)
+
+    def cut(row, fields, omit):
+        if not isinstance(row, dict):
+            return row
+        if fields is not None:
+            row = {name: row[name] if fields[name] is None else cut(row[name], fields[name], None)
+                   for name in fields if name in row}
+        if omit:
+            row = {name: value if name not in omit else cut(value, None, omit[name])
+                   for name, value in row.items() if omit.get(name, {}) is not None}
+        return row
+    return [cut(row, fields, omit) for row in rows]
+
+
+class SparseFieldsMixin:
+    """
+    ModelSerializer mixin: a top-level serializer with a GET request in its context drops
+    the fields ?fields=/?omit= exclude (also for each item of many=True).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields, omit = requested_fieldsets(self.context.get('request'))
+        if fields is not None or omit:
+            restrict(self, fields, omit)
+
+
+def project(queryset, serializer, ordering=()):
+    """
+    `queryset` reading only the columns `serializer` (already restricted by the request)
+    and the `ordering` need; unchanged when nothing was asked for or can't be told.
+    """
+    fields, omit = requested_fieldsets(serializer.context.get('request'))
+    if fields is None and not omit:
+        return queryset
+    columns = model_columns(serializer)
+    if columns is None:
+        return queryset
+    columns += [field.lstrip('-') for field in ordering]  # Pagination reads the last row's keys
+    related = queryset.query.select_related
+    if isinstance(related, dict) and set(related) - set(columns):
+        # A relation that isn't read any more can't stay in select_related
+        keep = [name for name in related if name in columns]
+        queryset = queryset.select_related(None)
+        if keep:
+            queryset = queryset.select_related(*keep)
+    return queryset.only(*columns)
+
+
+class SparseFieldsViewMixin:
+    """
+    ViewSet mixin: reads only the columns the (restricted) serializer needs, on the list
+    and detail querysets (custom actions call `project` themselves).
+    """
+
+    def project(self, queryset, serializer=None):
+        if serializer is None:
+            serializer = self.get_serializer()
+        return project(queryset, serializer, getattr(self, 'keyset_ordering', ()))
+
+    def filter_queryset(self, queryset):
+        return self.project(super().filter_queryset(queryset))
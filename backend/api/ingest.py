@@ -0,0 +1,531 @@
+"""
+Vital signs ingestion shared by the RPi endpoints.
+
+`ingest_batch` takes many readings (possibly for many patients) and writes them with a
+fixed number of queries: one lookup (and row lock) for all patients, one bulk insert for
+the vitals, three for the trend rollups (rollups.py), one patient update (last_visit and
+the latest-vitals pointer), and one read + bulk update/insert for the queue entries (plus
+cancelling entries left waiting on an earlier day, and a QueueVersion bump). Priority is recomputed once per affected patient
+from their newest reading, as kept in Patient.triage_snapshot.
+
+Readings posted to the async endpoint are written to the IngestJob journal instead and
+drained by `manage.py run_ingest_workers`, which calls `process_pending` in a loop.
+
+Devices using the sync protocol go through `sync_device`: every reading carries the
+device's sequence number and timestamp; the Device row's high-water mark and the unique
+(device_id, device_seq) make retried, overlapping or out-of-order uploads idempotent.
+"""
+
+import math
+import threading
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Min, OuterRef, Subquery, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Device, IngestJob, Patient, QueueEntry, QueueVersion, TriageRuleSet, VitalSigns
+from .queue_engine import get_queue_engine
+from .reduction import reduce_reading_samples
+from .rollups import add_reading, add_readings
+from .utils import compute_priority
+
+MAX_BATCH_SIZE = 1000
+MAX_SYNC_CHUNK = 500
+MAX_JOB_ATTEMPTS = 3
+STALE_JOB_AFTER = timedelta(minutes=5)  # PROCESSING this long means the worker died
+READING_QUERIES = 8  # ingest_reading for a patient already in today's queue
+READING_QUERIES_NEW = 14  # ingest_reading that adds the patient to the queue
+
+# Reading field -> type it is stored as
+VITAL_FIELDS = {
+    'heart_rate': int,
+    'temperature': float,
+    'oxygen_saturation': float,
+    'weight': float,
+    'height': float,
+    'blood_pressure_systolic': int,
+    'blood_pressure_diastolic': int,
+}
+
+
+class ReadingError(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def clean_reading(data):
+    """Validate one RPi reading and return {field: value}; raises ReadingError."""
+    if not isinstance(data, dict):
+        raise ReadingError("Reading must be an object")
+    if data.get('_error'):
+        raise ReadingError(data['_error'])  # Already rejected by the compact wire format validator
+    patient_id = data.get('patient_id')
+    if not patient_id:
+        raise ReadingError("patient_id is required")
+
+    # device_seq is never taken from the reading: only sync_device numbers readings
+    cleaned = {'patient_id': str(patient_id), 'device_id': data.get('device_id')}
+
+    # Raw sample series (see reduction.py) are reduced to one value each, overriding any
+    # value the device computed itself
+    if data.get('samples') is not None:
+        try:
+            estimates, quality = reduce_reading_samples(data['samples'])
+        except ValueError as e:
+            raise ReadingError(str(e))
+        data = {**data, **estimates}
+        cleaned['sample_quality'] = quality
+    elif isinstance(data.get('sample_quality'), dict):
+        cleaned['sample_quality'] = data['sample_quality']  # Journaled reading, reduced on arrival
+
+    # Optional: when the reading was taken (ISO 8601, device clock); defaults to arrival time
+    recorded_at = data.get('recorded_at')
+    if recorded_at:
+        parsed = parse_datetime(str(recorded_at))
+        if parsed is None:
+            raise ReadingError("recorded_at must be an ISO 8601 datetime")
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        cleaned['recorded_at'] = parsed.isoformat()  # Kept as a string so it can be journaled
+    for field, cast in VITAL_FIELDS.items():
+        value = data.get(field)
+        if value in (None, ''):
+            cleaned[field] = None
+            continue
+        try:
+            value = cast(float(value)) if cast is int else cast(value)
+        except (TypeError, ValueError):
+            raise ReadingError(f"{field} must be a number")
+        if value < 0 or not math.isfinite(value):
+            raise ReadingError(f"{field} must be a non-negative number")
+        cleaned[field] = value
+    return cleaned
+
+
+def ingest_batch(readings, device_seqs=None):
+    """
+    Validate and store a list of readings in one transaction. `device_seqs` (sync_device
+    only) gives each reading's sequence number on its device.
+
+    Returns one result per input reading, in order:
+    {"index": i, "status": 201, "id": <VitalSigns id>, "patient_id": ...} or
+    {"index": i, "status": 400/404, "error": ...}. Invalid readings are skipped;
+    the valid ones are still saved. On MySQL a bulk INSERT returns no ids, so "id" is
+    null there, except for sync_device's readings (found again by device and seq).
+    """
+    results = [None] * len(readings)
+    cleaned = {}
+    for index, data in enumerate(readings):
+        try:
+            cleaned[index] = clean_reading(data)
+        except ReadingError as e:
+            results[index] = {"index": index, "status": e.status_code, "error": str(e)}
+
+    vitals = {}
+    if cleaned:
+        with transaction.atomic():
+            # Locked until commit, so concurrent batches queue each patient once (the
+            # one-waiting-entry constraint isn't enforced on MySQL)
+            patients = Patient.objects.select_for_update().in_bulk(
+                {r['patient_id'] for r in cleaned.values()}, field_name='patient_id'
+            )
+            for index, reading in cleaned.items():
+                patient = patients.get(reading['patient_id'])
+                if patient is None:
+                    results[index] = {"index": index, "status": 404, "error": "Patient not found",
+                                      "patient_id": reading['patient_id']}
+                    continue
+                vital_signs = VitalSigns(patient=patient, device_id=reading['device_id'],
+                                         device_seq=device_seqs[index] if device_seqs else None,
+                                         sample_quality=reading.get('sample_quality'),
+                                         **{field: reading[field] for field in VITAL_FIELDS})
+                if reading.get('recorded_at'):
+                    vital_signs.date_time_recorded = parse_datetime(reading['recorded_at'])
+                vital_signs.compute_bmi()  # bulk_create skips save()
+                vitals[index] = vital_signs
+
+            if vitals:
+                created = VitalSigns.objects.bulk_create(list(vitals.values()))
+                if device_seqs and not connection.features.can_return_rows_from_bulk_insert:
+                    find_synced_ids(created)
+                add_readings(created)
+                # Newest reading per patient decides their priority. Readings taken before today
+                # (e.g. replayed after an outage) are history only and don't queue anyone, but
+                # can still be the newest one on record.
+                today, now = timezone.localdate(), timezone.now()
+                touched, queued = {}, {}
+                for vital_signs in created:
+                    patient = vital_signs.patient  # One instance per patient (in_bulk above)
+                    if patient.take_latest_vitals(vital_signs):
+                        touched[patient.pk] = patient
+                    if timezone.localdate(vital_signs.date_time_recorded) == today:
+                        patient.last_visit = now
+                        touched[patient.pk] = queued[patient.pk] = patient
+                if touched:
+                    save_latest_vitals(list(touched.values()))
+                if queued:
+                    update_queue(queued)
+
+    for index, vital_signs in vitals.items():
+        results[index] = {
+            "index": index,
+            "status": 201,
+            "id": vital_signs.pk,
+            "patient_id": vital_signs.patient.patient_id,
+        }
+    return results
+
+
+def find_synced_ids(created):
+    """Set the pks of bulk-inserted sync readings by their unique (device_id, device_seq)."""
+    ids = {
+        (device_id, seq): pk
+        for device_id, seq, pk in VitalSigns.objects.filter(
+            device_id__in={v.device_id for v in created}, device_seq__in=[v.device_seq for v in created]
+        ).values_list('device_id', 'device_seq', 'id')
+    }
+    for vital_signs in created:
+        vital_signs.pk = ids.get((vital_signs.device_id, vital_signs.device_seq))
+
+
+def cancel_stale_entries(patient_ids, now):
+    """Cancel entries the patients left waiting on an earlier day, which rollover_queue hasn't archived yet."""
+    QueueEntry.objects.filter(
+        patient_id__in=patient_ids, status=QueueEntry.WAITING, entered_at__date__lt=timezone.localdate()
+    ).update(status=QueueEntry.CANCELLED, finished_at=now)
+
+
+def save_latest_vitals(patients):
+    """Write last_visit and the latest-vitals pointer/snapshot of `patients` in one bulk UPDATE."""
+    if connection.features.can_return_rows_from_bulk_insert:
+        Patient.objects.bulk_update(patients, ['last_visit', 'latest_vitals', 'triage_snapshot'])
+        return
+    # bulk_create gave us no pks to point at: look the newest rows up in the same UPDATE
+    Patient.objects.bulk_update(patients, ['last_visit', 'triage_snapshot'])
+    newest = VitalSigns.objects.filter(patient=OuterRef('pk')).order_by('-date_time_recorded', '-id')
+    Patient.objects.filter(pk__in=[patient.pk for patient in patients]).update(
+        latest_vitals=Subquery(newest.values('id')[:1])
+    )
+
+
+def update_queue(patients):
+    """
+    Bring each patient's waiting queue entry up to date with their newest reading.
+
+    `patients` maps patient pk -> Patient, with last_visit and triage_snapshot already
+    saved (save_latest_vitals). Must run inside a transaction; the queue engine is
+    updated once it commits, and QueueVersion is bumped for the other processes.
+    """
+    now = timezone.now()
+    waiting = {
+        entry.patient_id: entry
+        for entry in QueueEntry.objects.filter(
+            patient_id__in=patients, status=QueueEntry.WAITING, entered_at__date=timezone.localdate()
+        )
+    }
+    rules = TriageRuleSet.objects.current()
+    changed, new = [], []
+    for patient_id, patient in patients.items():
+        priority = compute_priority(patient.latest_reading(), patient.age, rules)
+        entry = waiting.get(patient_id)
+        if entry is None:
+            new.append(QueueEntry(patient=patient, priority=priority, entered_at=now,
+                                  priority_rank=QueueEntry.rank_for(priority), rule_version=rules.version))
+        elif entry.priority != priority or entry.rule_version != rules.version:
+            entry.patient = patient
+            entry.priority = priority
+            entry.priority_rank = QueueEntry.rank_for(priority)
+            entry.rule_version = rules.version
+            changed.append(entry)
+
+    if changed:
+        QueueEntry.objects.bulk_update(changed, ['priority', 'priority_rank', 'rule_version'])
+    if new:
+        cancel_stale_entries([entry.patient_id for entry in new], now)
+        for entry, number in zip(new, QueueEntry.allocate_numbers(len(new))):
+            entry.queue_number = number
+        new = QueueEntry.objects.bulk_create(new)
+
+    # bulk_* skip the post_save signal, so mirror the changes into the engine ourselves,
+    # and have other processes' engines (e.g. the web server's, for the ingest workers) reload
+    if changed or new:
+        QueueVersion.objects.bump()
+    engine = get_queue_engine()
+    if new and not connection.features.can_return_rows_from_bulk_insert:
+        transaction.on_commit(engine.reset)  # No pks to mirror; reload on next read
+        return
+    touched = changed + new
+    if touched:
+        def mirror():
+            for entry in touched:
+                engine.upsert(entry)
+        transaction.on_commit(mirror)
+
+
+def ingest_reading(data):
+    """
+    Store one reading and queue its patient in a single transaction (receive-vitals/).
+    Returns (patient, VitalSigns); raises ReadingError.
+
+    Query budget (READING_QUERIES / READING_QUERIES_NEW, enforced in tests.py), counting
+    BEGIN/COMMIT (savepoints when nested):
+
+        8   patient (locked), insert reading, add it to the trend rollups (create missing
+            buckets, UPDATE), bump last_visit (and the latest-vitals pointer), re-score
+            today's waiting entry
+        14  the patient wasn't queued yet: that UPDATE matches nothing, so any entry left
+            waiting from an earlier day is cancelled, the day's queue counter is bumped
+            (savepoint, UPDATE, SELECT, release) and the entry is inserted; +3 for the
+            first queue number of the day (counter row creation)
+
+    plus one query every TriageRuleSet.objects.RECHECK_SECONDS to check the rule version
+    (and one more to load a new version), see TriageRuleSetManager.current.
+
+    The patient's newest reading is taken from their triage_snapshot (usually the reading
+    just inserted; no latest-vitals query), and nothing is read back before it is
+    written: last_visit and the waiting entry are plain UPDATEs.
+    """
+    reading = clean_reading(data)
+    with transaction.atomic():
+        try:
+            # Locked until commit: two first readings for a patient can't both find them unqueued
+            patient = Patient.objects.select_for_update().get(patient_id=reading['patient_id'])
+        except Patient.DoesNotExist:
+            raise ReadingError("Patient not found", 404)
+
+        vital_signs = VitalSigns(patient=patient, device_id=reading['device_id'],
+                                 sample_quality=reading.get('sample_quality'),
+                                 **{field: reading[field] for field in VITAL_FIELDS})
+        if reading.get('recorded_at'):
+            vital_signs.date_time_recorded = parse_datetime(reading['recorded_at'])
+        vital_signs.save()
+        add_reading(vital_signs)
+        # Out-of-order readings leave the pointer alone
+        pointer = (
+            {'latest_vitals': vital_signs, 'triage_snapshot': patient.triage_snapshot}
+            if patient.take_latest_vitals(vital_signs) else {}
+        )
+
+        # Readings taken before today are history only, same as ingest_batch
+        if timezone.localdate(vital_signs.date_time_recorded) != timezone.localdate():
+            if pointer:
+                Patient.objects.filter(pk=patient.pk).update(**pointer)
+            return patient, vital_signs
+
+        now = timezone.now()
+        Patient.objects.filter(pk=patient.pk).update(last_visit=now, **pointer)
+        patient.last_visit = now
+
+        rules = TriageRuleSet.objects.current()
+        priority = compute_priority(patient.latest_reading(), patient.age, rules)
+        requeued = QueueEntry.objects.filter(
+            patient=patient, status=QueueEntry.WAITING, entered_at__date=timezone.localdate()
+        ).update(priority=priority, priority_rank=QueueEntry.rank_for(priority), rule_version=rules.version)
+        if requeued:
+            # UPDATE skips post_save, so mirror the new tier (and last_visit) ourselves
+            transaction.on_commit(lambda: get_queue_engine().rescore_patient(patient, priority, rules.version))
+        else:
+            cancel_stale_entries([patient.pk], now)
+            # last_visit is already current, so QueueEntry.save() won't save the patient again
+            QueueEntry(patient=patient, priority=priority, entered_at=now, rule_version=rules.version).save()
+    return patient, vital_signs
+
+
+# ---------------------------------------------------------------- write-behind journal
+
+def enqueue_readings(readings):
+    """
+    Validate readings and journal the valid ones for the workers.
+
+    Returns (job or None, errors) where errors are per-item results for rejected readings.
+    Patient existence is checked by the worker, so this never reads the database.
+    """
+    cleaned, errors = [], []
+    for index, data in enumerate(readings):
+        try:
+            cleaned.append(clean_reading(data))
+        except ReadingError as e:
+            errors.append({"index": index, "status": e.status_code, "error": str(e)})
+    if not cleaned:
+        return None, errors
+    now = timezone.now().isoformat()
+    for reading in cleaned:
+        reading.setdefault('recorded_at', now)  # Record arrival time, not when a worker gets to it
+    job = IngestJob.objects.create(readings=cleaned, reading_count=len(cleaned))
+    return job, errors
+
+
+# Serialises job claiming between worker threads when the database can't SKIP LOCKED (SQLite)
+_claim_lock = threading.Lock()
+
+
+def claim_jobs(limit):
+    """Mark up to `limit` pending jobs as PROCESSING for this worker and return them."""
+    skip_locked = connection.features.has_select_for_update_skip_locked
+    with (nullcontext() if skip_locked else _claim_lock), transaction.atomic():
+        pending = IngestJob.objects.filter(status=IngestJob.PENDING).order_by('id')
+        if skip_locked:
+            pending = pending.select_for_update(skip_locked=True)
+        jobs = list(pending[:limit])
+        if jobs:
+            now = timezone.now()
+            IngestJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+                status=IngestJob.PROCESSING, started_at=now, attempts=F('attempts') + 1
+            )
+            for job in jobs:
+                job.started_at = now
+                job.attempts += 1
+    return jobs
+
+
+def process_pending(batch_size=200):
+    """
+    Claim a batch of jobs, ingest all their readings together and record the results.
+    If the batch fails, its jobs are retried one transaction each, so only the job
+    that caused it is put back (and failed after MAX_JOB_ATTEMPTS).
+    """
+    jobs = claim_jobs(batch_size)
+    if not jobs:
+        return 0
+    readings = [reading for job in jobs for reading in job.readings]
+    try:
+        results = ingest_batch(readings)
+    except Exception as e:
+        if len(jobs) == 1:
+            release_jobs(jobs, e)
+            raise
+        return process_one_by_one(jobs)
+
+    offset = 0
+    for job in jobs:
+        finish_job(job, results[offset:offset + job.reading_count])
+        offset += job.reading_count
+    IngestJob.objects.bulk_update(jobs, ['results', 'status', 'finished_at'])
+    return len(readings)
+
+
+def process_one_by_one(jobs):
+    """Ingest each job in its own transaction; returns how many readings were stored."""
+    processed = 0
+    for job in jobs:
+        try:
+            results = ingest_batch(job.readings)
+        except Exception as e:
+            release_jobs([job], e)
+            continue
+        finish_job(job, results)
+        job.save(update_fields=['results', 'status', 'finished_at'])
+        processed += job.reading_count
+    return processed
+
+
+def finish_job(job, results):
+    """Mark a job DONE with its slice of the batch results (not saved)."""
+    base = results[0]['index'] if results else 0
+    for result in results:
+        result['index'] -= base  # Index within the job, not the combined batch
+    job.results = results
+    job.status = IngestJob.DONE
+    job.finished_at = timezone.now()
+
+
+def release_jobs(jobs, error):
+    """Put failed jobs back for the next claim, or give up on them after MAX_JOB_ATTEMPTS."""
+    for job in jobs:
+        job.status = IngestJob.PENDING if job.attempts < MAX_JOB_ATTEMPTS else IngestJob.FAILED
+        job.error = str(error)
+        job.finished_at = timezone.now() if job.status == IngestJob.FAILED else None
+    IngestJob.objects.bulk_update(jobs, ['status', 'error', 'finished_at'])
+
+
+def requeue_stale_jobs():
+    """Hand jobs abandoned by a crashed worker back to the pool."""
+    return IngestJob.objects.filter(
+        status=IngestJob.PROCESSING, started_at__lt=timezone.now() - STALE_JOB_AFTER
+    ).update(status=IngestJob.PENDING)
+
+
+def ingest_metrics(window=timedelta(minutes=5)):
+    """Journal lag and throughput, for /api/ingest/metrics/."""
+    now = timezone.now()
+    backlog = IngestJob.objects.filter(status=IngestJob.PENDING).aggregate(
+        jobs=Count('id'), readings=Sum('reading_count'), oldest=Min('received_at')
+    )
+    recent = IngestJob.objects.filter(status=IngestJob.DONE, finished_at__gte=now - window).aggregate(
+        jobs=Count('id'), readings=Sum('reading_count'), latency=Avg(ExpressionWrapper(F('finished_at') - F('received_at'), output_field=DurationField()))
+    )
+    latency = recent['latency']
+    return {
+        "pending_jobs": backlog['jobs'],
+        "pending_readings": backlog['readings'] or 0,
+        "processing_jobs": IngestJob.objects.filter(status=IngestJob.PROCESSING).count(),
+        "failed_jobs": IngestJob.objects.filter(status=IngestJob.FAILED).count(),
+        # Lag: how long the oldest unprocessed reading has been waiting
+        "lag_seconds": round((now - backlog['oldest']).total_seconds(), 3) if backlog['oldest'] else 0,
+        "window_seconds": int(window.total_seconds()),
+        "processed_jobs": recent['jobs'],
+        "processed_readings": recent['readings'] or 0,
+        "readings_per_second": round((recent['readings'] or 0) / window.total_seconds(), 3),
+        "avg_latency_seconds": round(latency.total_seconds(), 3) if latency is not None else None,
+    }
+
+
+# ------------------------------------------------------------------ device sync protocol
+
+def sync_device(device_id, readings):
+    """
+    Store a chunk of numbered readings from one device.
+
+    Each reading needs a positive integer `seq` (increasing per device) and should carry
+    its own `recorded_at`. The device's high-water mark is the highest seq up to which
+    every reading has been delivered: it only moves over contiguous seqs, so a chunk that
+    arrives out of order leaves it below the gap. Readings at or below it, and readings
+    above it already stored (unique device_id/device_seq), are acknowledged as duplicates
+    without being stored again. Returns (high_water_mark, per-item results).
+    """
+    results = [None] * len(readings)
+    fresh = {}
+    for index, data in enumerate(readings):
+        seq = data.get('seq') if isinstance(data, dict) else None
+        if isinstance(seq, bool) or not isinstance(seq, int) or seq <= 0:
+            results[index] = {"index": index, "status": 400, "error": "seq must be a positive integer"}
+            continue
+        fresh.setdefault(seq, index)  # Same seq twice in one chunk: keep the first
+
+    with transaction.atomic():
+        # Row lock: concurrent uploads from the same device are applied one after the other
+        device, _ = Device.objects.select_for_update().get_or_create(device_id=device_id)
+        mark = device.high_water_mark
+        # Stored past the mark by an earlier chunk that arrived before a lower one
+        stored = set(
+            VitalSigns.objects.filter(device_id=device_id, device_seq__gt=mark).values_list('device_seq', flat=True)
+        )
+
+        to_store = []
+        for seq, index in sorted(fresh.items()):
+            if seq <= mark or seq in stored:
+                results[index] = {"index": index, "seq": seq, "status": 200, "duplicate": True}
+            else:
+                to_store.append((seq, index))
+
+        if to_store:
+            batch = [{**readings[index], 'device_id': device_id} for seq, index in to_store]
+            for (seq, index), result in zip(to_store, ingest_batch(batch, device_seqs=[seq for seq, index in to_store])):
+                results[index] = {**result, "index": index, "seq": seq}
+        # Rejected readings (bad data, unknown patient) count as delivered too: resending won't fix them
+        delivered = stored | set(fresh)
+        while mark + 1 in delivered:
+            mark += 1
+        device.high_water_mark = mark
+
+        device.last_seen_at = timezone.now()
+        device.save(update_fields=['high_water_mark', 'last_seen_at'])
+
+    for index, result in enumerate(results):
+        if result is None:  # Later duplicate of a seq within the same chunk
+            results[index] = {"index": index, "seq": readings[index].get('seq'), "status": 200, "duplicate": True}
+    return device.high_water_mark, results
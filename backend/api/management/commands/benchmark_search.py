@@ -0,0 +1,128 @@
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Q
+
+from api import search
+from api.models import Patient, PatientSearchTrigram
+from api.search import SEARCH_FIELDS, patient_trigrams, search_patient_ids
+from api.utils import words
+
+FIRST_NAMES = [
+    'juan', 'maria', 'jose', 'ana', 'pedro', 'rosa', 'carlos', 'luz', 'miguel', 'elena', 'ramon', 'carmen',
+    'antonio', 'teresa', 'roberto', 'gloria', 'mark', 'angelica', 'john paul', 'kristine', 'jericho', 'niña',
+]
+LAST_NAMES = [
+    'santos', 'reyes', 'cruz', 'bautista', 'ocampo', 'garcia', 'mendoza', 'torres', 'tomas', 'andres',
+    'castillo', 'flores', 'villanueva', 'ramos', 'rivera', 'aquino', 'navarro', 'salazar', 'mercado',
+    'dela cruz', 'de los santos', 'peña', 'dimaculangan', 'macaraeg', 'pangilinan', 'soriano', 'tolentino',
+]
+STREETS = ['rizal', 'mabini', 'bonifacio', 'luna', 'burgos', 'del pilar', 'jacinto', 'quezon']
+TOWNS = [
+    'san jose', 'quezon city', 'manila', 'batangas', 'lipa', 'tanauan', 'calamba', 'santa rosa', 'biñan',
+    'cabuyao', 'los baños', 'bay', 'calauan', 'alaminos', 'san pablo',
+]
+# What the front desk types: label -> query built from a sampled patient
+QUERIES = {
+    'surname': lambda p: p['last_name'],
+    'full name': lambda p: f"{p['first_name']} {p['last_name']}",
+    'surname, first': lambda p: f"{p['last_name']}, {p['first_name'][:3]}",
+    'two letters': lambda p: p['first_name'][:2],
+    'patient id': lambda p: p['patient_id'],
+    'id tail': lambda p: p['patient_id'][-7:],
+    'town': lambda p: ' '.join(words(p['address'])[-2:]),
+    'no match': lambda p: 'qzx',
+}
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time ?search= (api/search.py) on the patients in the database, optionally with N generated "
+        "ones (rolled back afterwards), against the old icontains scan"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=0, help="Patients to generate and index first")
+        parser.add_argument('--samples', type=int, default=20, help="Patients to build each kind of query from")
+        parser.add_argument('--runs', type=int, default=5, help="Timed runs of each query")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                if options['patients']:
+                    self.generate(options['patients'])
+                rows = self.measure(options['samples'], options['runs'])
+                raise _Rollback
+        except _Rollback:
+            pass
+        finally:
+            search._trigram_counts.clear()  # Counts of rows that were just rolled back
+
+        self.stdout.write(f"{Patient.objects.count() + options['patients']} patients, "
+                          f"{options['samples']} queries of each kind, {options['runs']} runs each:")
+        self.stdout.write(f"  {'query':<15} {'results':>7} {'cold ms':>8} {'median':>7} {'p95':>7} {'max':>7} {'icontains':>9}")
+        for label, results, cold, times, scan in rows:
+            p95 = statistics.quantiles(times, n=20)[-1] if len(times) > 1 else times[0]
+            self.stdout.write(
+                f"  {label:<15} {results:>7.1f} {cold:>8.2f} {statistics.median(times):>7.2f} {p95:>7.2f}"
+                f" {max(times):>7.2f} {scan:>9.2f}"
+            )
+
+    def generate(self, count):
+        """`count` patients over consecutive days from 2000 (about 100 a day), and their index rows."""
+        rng = random.Random(0)
+        start = Patient.objects.aggregate(last=Max('pk'))['last'] or 0
+        Patient.objects.bulk_create([
+            Patient(
+                patient_id=f"P-{date(2000, 1, 1) + timedelta(days=n // 100):%Y%m%d}-{n % 100 + 1:03d}",
+                first_name=rng.choice(FIRST_NAMES).title(), last_name=rng.choice(LAST_NAMES).title(),
+                sex=rng.choice(['Male', 'Female']), pin='0000',
+                address=f"{rng.randint(1, 999)} {rng.choice(STREETS).title()} St., {rng.choice(TOWNS).title()}",
+            )
+            for n in range(count)
+        ], batch_size=5000)
+        last = start
+        while batch := list(Patient.objects.filter(pk__gt=last).order_by('pk').values('pk', *SEARCH_FIELDS)[:5000]):
+            PatientSearchTrigram.objects.bulk_create([
+                PatientSearchTrigram(patient_id=values['pk'], trigram=gram, weight=weight)
+                for values in batch
+                for gram, weight in patient_trigrams(values)
+            ], batch_size=5000)
+            last = batch[-1]['pk']
+
+    def measure(self, samples, runs):
+        """[(label, mean results, cold ms, [ms per run], icontains median ms)] per kind of query."""
+        rng = random.Random(1)
+        pks = list(Patient.objects.values_list('pk', flat=True))
+        sampled = list(Patient.objects.filter(pk__in=rng.sample(pks, min(samples, len(pks)))).values(*SEARCH_FIELDS))
+        rows = []
+        for label, build in QUERIES.items():
+            queries = [build(patient) for patient in sampled]
+            search._trigram_counts.clear()
+            start = time.perf_counter()
+            results = [len(search_patient_ids(query) or []) for query in queries]
+            cold = (time.perf_counter() - start) * 1000 / len(queries)
+            times = []
+            for _ in range(runs):
+                for query in queries:
+                    start = time.perf_counter()
+                    search_patient_ids(query)
+                    times.append((time.perf_counter() - start) * 1000)
+            scan = []
+            for query in queries[:5]:
+                start = time.perf_counter()
+                list(Patient.objects.filter(
+                    Q(first_name__icontains=query) | Q(last_name__icontains=query)
+                    | Q(address__icontains=query) | Q(patient_id__icontains=query)
+                ).values_list('pk', flat=True))
+                scan.append((time.perf_counter() - start) * 1000)
+            rows.append((label, statistics.mean(results), cold, times, statistics.median(scan)))
+        return rows
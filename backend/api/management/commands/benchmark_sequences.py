@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import DailySequence, Patient
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Compare the old count()-based patient ID scheme with the DailySequence counter (rolled back afterwards)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--existing', type=int, default=5000, help="Patients already registered today")
+        parser.add_argument('--allocations', type=int, default=500, help="IDs to allocate with each scheme")
+
+    def handle(self, *args, **options):
+        existing, allocations = options['existing'], options['allocations']
+        day = timezone.now().date()
+        yyyymmdd = day.strftime("%Y%m%d")
+
+        try:
+            with transaction.atomic():
+                Patient.objects.bulk_create(
+                    Patient(
+                        patient_id=f"P-{yyyymmdd}-{n:03d}", first_name='Bench', last_name=str(n),
+                        sex='Male', address='-', pin='0000', last_visit=timezone.now(),
+                    )
+                    for n in range(1, existing + 1)
+                )
+
+                # Old scheme: scan today's rows on every insert
+                start = time.perf_counter()
+                for _ in range(allocations):
+                    Patient.objects.filter(patient_id__startswith=f"P-{yyyymmdd}").count() + 1
+                count_based = time.perf_counter() - start
+
+                start = time.perf_counter()
+                for _ in range(allocations):
+                    DailySequence.objects.allocate('BENCH', day)
+                counter = time.perf_counter() - start
+
+                start = time.perf_counter()
+                DailySequence.objects.allocate('BENCH-BLK', day, count=allocations)
+                block = time.perf_counter() - start
+
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        self.stdout.write(f"{existing} patients today, {allocations} allocations each:")
+        for label, seconds in [
+            ("count() scan", count_based),
+            ("DailySequence", counter),
+            ("DailySequence block", block),
+        ]:
+            self.stdout.write(f"  {label:<20} {seconds * 1000:9.2f} ms total  {seconds / allocations * 1e6:9.1f} us/id")
@@ -0,0 +1,88 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+from django.utils import timezone
+
+from api.models import Patient, QueueEntry
+from api.queue_engine import get_queue_engine
+
+# (label, url, sparse query string): what a queue display and a patient picker actually need
+CASES = [
+    ('queue', '/api/queue/', 'fields=queue_number,patient.first_name,patient.last_name'),
+    ('current_queue', '/api/queue/current_queue/', 'fields=queue_number,patient.first_name,patient.last_name'),
+    ('patients', '/api/patients/', 'fields=id,patient_id,first_name,last_name,birthdate'),
+]
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Compare full responses with ?fields= sparse fieldsets (api/fieldsets.py): bytes and time per request"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=500, help="Patients, each waiting in today's queue")
+        parser.add_argument('--requests', type=int, default=50, help="Requests to time per variant")
+
+    def handle(self, *args, **options):
+        count, requests = options['patients'], options['requests']
+        rng = random.Random(0)
+        engine = get_queue_engine()
+
+        try:
+            with transaction.atomic():
+                day = timezone.localdate()
+                patient_ids = Patient.allocate_ids(count)
+                Patient.objects.bulk_create([
+                    Patient(
+                        patient_id=patient_id, first_name=f'Bench{n}', last_name=rng.choice(['Santos', 'Reyes', 'Cruz']),
+                        sex='Female', address=f'{n} Rizal Street, Barangay San Isidro, Santa Rosa, Laguna', pin='0000',
+                        birthdate=day.replace(year=day.year - rng.randint(1, 90)), last_visit=timezone.now(),
+                        triage_snapshot={
+                            'id': n, 'recorded_at': timezone.now().isoformat(), 'heart_rate': rng.randint(55, 120),
+                            'temperature': 36.8, 'oxygen_saturation': 98.0,
+                            'blood_pressure_systolic': 120, 'blood_pressure_diastolic': 80,
+                        },
+                    )
+                    for n, patient_id in enumerate(patient_ids)
+                ])
+                patients = Patient.objects.filter(patient_id__in=patient_ids).order_by('id')  # MySQL's bulk_create returns no pks
+                QueueEntry.objects.bulk_create([
+                    QueueEntry(patient=patient, priority='NORMAL', priority_rank=QueueEntry.rank_for('NORMAL'), queue_number=number)
+                    for patient, number in zip(patients, QueueEntry.allocate_numbers(count))
+                ])
+                engine.reset()
+
+                # Interleave the variants so both see the same database and cache state
+                client = Client()
+                rows = []
+                for label, url, sparse in CASES:
+                    variants = {'full': f'{url}?page_size={count}', 'sparse': f'{url}?page_size={count}&{sparse}'}
+                    elapsed = dict.fromkeys(variants, 0.0)
+                    size = {}
+                    for _ in range(requests):
+                        for name, path in variants.items():
+                            start = time.perf_counter()
+                            response = client.get(path)
+                            elapsed[name] += time.perf_counter() - start
+                            assert response.status_code == 200, response.content[:200]
+                            size[name] = len(response.content)
+                    rows.append((label, size['full'], size['sparse'], elapsed['full'] / requests * 1000,
+                                 elapsed['sparse'] / requests * 1000))
+                raise _Rollback
+        except _Rollback:
+            pass
+        finally:
+            engine.reset()  # It may have mirrored rows that were just rolled back
+
+        self.stdout.write(f"{count} rows per response, {requests} requests per variant ({timezone.now():%Y-%m-%d}):")
+        self.stdout.write(f"  {'endpoint':<14} {'full B':>9} {'sparse B':>9} {'saved':>6} {'full ms':>8} {'sparse ms':>10} {'saved':>6}")
+        for label, full_bytes, sparse_bytes, full_ms, sparse_ms in rows:
+            self.stdout.write(
+                f"  {label:<14} {full_bytes:>9} {sparse_bytes:>9} {1 - sparse_bytes / full_bytes:>6.0%}"
+                f" {full_ms:>8.1f} {sparse_ms:>10.1f} {1 - sparse_ms / full_ms:>6.0%}"
+            )
@@ -0,0 +1,84 @@
+import io
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+
+from api.models import Patient
+from api.wire_format import MEDIA_TYPE, CompactVitalsParser, encode_readings
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Compare JSON and the compact binary format for RPi uploads: bytes on the wire, parse time and requests/second"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readings', type=int, default=50, help="Readings per upload")
+        parser.add_argument('--requests', type=int, default=100, help="Uploads to time per format")
+
+    def handle(self, *args, **options):
+        per_upload, requests = options['readings'], options['requests']
+        rng = random.Random(0)
+
+        try:
+            with transaction.atomic():
+                patients = [
+                    Patient.objects.create(first_name='Bench', last_name=str(n), sex='Female', address='-', pin='0000')
+                    for n in range(20)
+                ]
+                readings = [
+                    {
+                        'patient_id': rng.choice(patients).patient_id,
+                        'device_id': 'bench-rpi',
+                        'heart_rate': rng.randint(55, 120),
+                        'temperature': round(rng.uniform(35.8, 38.8), 1),
+                        'oxygen_saturation': float(rng.randint(90, 100)),
+                        'weight': round(rng.uniform(45, 95), 1),
+                        'height': round(rng.uniform(1.45, 1.85), 2),
+                    }
+                    for _ in range(per_upload)
+                ]
+                bodies = {
+                    'json': (json.dumps({'readings': readings}).encode(), 'application/json', JSONParser()),
+                    'compact': (encode_readings(readings, 'bench-rpi'), MEDIA_TYPE, CompactVitalsParser()),
+                }
+
+                parse_us = {}
+                for name, (body, content_type, parser) in bodies.items():
+                    start = time.perf_counter()
+                    for _ in range(1000):
+                        parser.parse(io.BytesIO(body), content_type)
+                    parse_us[name] = (time.perf_counter() - start) / 1000 * 1e6
+
+                # Interleave the formats so both see the same database state
+                client = Client()
+                elapsed = dict.fromkeys(bodies, 0.0)
+                response_bytes = {}
+                for _ in range(requests):
+                    for name, (body, content_type, _parser) in bodies.items():
+                        start = time.perf_counter()
+                        response = client.post('/api/receive-vitals/batch/', body, content_type=content_type,
+                                               HTTP_ACCEPT=content_type)
+                        elapsed[name] += time.perf_counter() - start
+                        assert response.status_code == 201, response.content[:200]
+                        response_bytes[name] = len(response.content)
+                rows = [
+                    (name, len(bodies[name][0]), response_bytes[name], parse_us[name], requests / elapsed[name])
+                    for name in bodies
+                ]
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        self.stdout.write(f"{per_upload} readings per upload, {requests} uploads per format ({timezone.now():%Y-%m-%d}):")
+        self.stdout.write(f"  {'format':<8} {'request B':>10} {'response B':>11} {'parse us':>9} {'req/s':>8}")
+        for name, request_bytes, response_bytes, parse_us, rate in rows:
+            self.stdout.write(f"  {name:<8} {request_bytes:>10} {response_bytes:>11} {parse_us:>9.1f} {rate:>8.1f}")
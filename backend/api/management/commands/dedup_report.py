@@ -0,0 +1,30 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from api.dedup import duplicate_groups, rebuild_blocking_keys
+
+
+class Command(BaseCommand):
+    help = (
+        "List groups of probably duplicated patients (api/dedup.py), one JSON object per line. "
+        "Merge them with POST /api/patients/<id>/merge/."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild-keys', action='store_true',
+            help="Recompute every blocking key first (after bulk imports, which skip Patient.save)",
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild_keys']:
+            changed = rebuild_blocking_keys()
+            self.stderr.write(f"Updated {changed} blocking keys")
+        groups = patients = 0
+        for group in duplicate_groups():
+            self.stdout.write(json.dumps(group, cls=DjangoJSONEncoder))
+            groups += 1
+            patients += len(group['patients'])
+        self.stderr.write(self.style.SUCCESS(f"{groups} groups of probable duplicates ({patients} patients)"))
@@ -0,0 +1,48 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from api.export import DATASETS, FORMATS, ExportError, export
+
+
+def _date(value):
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = (
+        "Export patients, vitals or queue history as CSV or NDJSON, streamed from a server-side "
+        "cursor in constant memory, e.g. the monthly spreadsheet: "
+        "`python manage.py export_data vitals --date-from 2025-01-01 --date-to 2025-01-31 -o vitals-jan.csv`"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=list(DATASETS))
+        parser.add_argument('--format', choices=list(FORMATS), help="Default: from the output file's extension, else csv")
+        parser.add_argument('--columns', help="Comma-separated column names (default: all)")
+        parser.add_argument('--date-from', type=_date, help="First local date to include (YYYY-MM-DD)")
+        parser.add_argument('--date-to', type=_date, help="Last local date to include (YYYY-MM-DD)")
+        parser.add_argument('-o', '--output', help="File to write (default: stdout)")
+
+    def handle(self, *args, **options):
+        output = options['output']
+        fmt = options['format'] or (output.rsplit('.', 1)[-1] if output and output.endswith(tuple(FORMATS)) else 'csv')
+        columns = [name for name in (options['columns'] or '').split(',') if name]
+        try:
+            _, parts = export(options['dataset'], fmt, columns, options['date_from'], options['date_to'])
+        except ExportError as e:
+            raise CommandError(str(e))
+
+        stream = open(output, 'w', newline='', encoding='utf-8') if output else sys.stdout
+        try:
+            for part in parts:
+                stream.write(part)
+        finally:
+            if output:
+                stream.close()
+        if output:
+            self.stderr.write(self.style.SUCCESS(f"Wrote {options['dataset']} to {output}"))
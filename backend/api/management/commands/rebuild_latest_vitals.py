@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from api.models import Patient, VitalSigns
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every patient's latest_vitals pointer and triage_snapshot from their "
+        "vital signs history (one pass, in batches). Ingestion keeps them current; run this "
+        "after importing or editing readings outside the API."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        newest = VitalSigns.objects.filter(patient=OuterRef('pk')).order_by('-date_time_recorded', '-id')
+        checked = fixed = 0
+        last_pk = 0
+
+        while True:
+            with transaction.atomic():
+                batch = list(
+                    Patient.objects.filter(pk__gt=last_pk).order_by('pk')
+                    .annotate(newest_id=Subquery(newest.values('id')[:1]))
+                    .only('pk', 'latest_vitals', 'triage_snapshot')
+                    .select_for_update()[:batch_size]
+                )
+                if not batch:
+                    break
+                readings = VitalSigns.objects.in_bulk([p.newest_id for p in batch if p.newest_id])
+                stale = []
+                for patient in batch:
+                    reading = readings.get(patient.newest_id)
+                    snapshot = reading.snapshot() if reading else None
+                    if (patient.latest_vitals_id, patient.triage_snapshot) != (patient.newest_id, snapshot):
+                        patient.latest_vitals_id = patient.newest_id
+                        patient.triage_snapshot = snapshot
+                        stale.append(patient)
+                if stale:
+                    Patient.objects.bulk_update(stale, ['latest_vitals', 'triage_snapshot'])
+            checked += len(batch)
+            fixed += len(stale)
+            last_pk = batch[-1].pk
+
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} patients; fixed {fixed}"))
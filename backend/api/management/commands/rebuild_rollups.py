@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import Patient
+from api.rollups import PERIODS, rebuild_period
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the day/week/month vitals rollups behind /vitals/trends/ from the raw "
+        "readings (one aggregate query per period per batch of patients). Ingestion keeps "
+        "them current; run this once to backfill and after importing readings outside the API."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Patients per transaction")
+
+    def handle(self, *args, **options):
+        patient_ids = list(Patient.objects.order_by('pk').values_list('pk', flat=True))
+        batch_size = options['batch_size']
+        written = 0
+        for offset in range(0, len(patient_ids), batch_size):
+            batch = patient_ids[offset:offset + batch_size]
+            with transaction.atomic():
+                for period in PERIODS:
+                    written += rebuild_period(period, batch)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} rollups for {len(patient_ids)} patients"))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import Patient, PatientSearchTrigram
+from api.search import SEARCH_FIELDS, patient_trigrams
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the patient search index (api/search.py) from scratch. Saves through the ORM "
+        "keep it current; run this after bulk imports or raw SQL edits of patients."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Patients per transaction")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        patients = rows = 0
+        last_pk = 0
+        PatientSearchTrigram.objects.all().delete()
+        while True:
+            batch = list(
+                Patient.objects.filter(pk__gt=last_pk).order_by('pk').values('pk', *SEARCH_FIELDS)[:batch_size]
+            )
+            if not batch:
+                break
+            with transaction.atomic():
+                created = PatientSearchTrigram.objects.bulk_create([
+                    PatientSearchTrigram(patient_id=values['pk'], trigram=gram, weight=weight)
+                    for values in batch
+                    for gram, weight in patient_trigrams(values)
+                ], batch_size=5000)
+            patients += len(batch)
+            rows += len(created)
+            last_pk = batch[-1]['pk']
+        self.stdout.write(self.style.SUCCESS(f"Indexed {patients} patients ({rows} trigrams)"))
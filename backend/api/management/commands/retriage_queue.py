@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from api.triage import retriage_queue
+
+
+class Command(BaseCommand):
+    help = (
+        "Rescore every waiting queue entry (except those prioritised by hand) from its patient's latest "
+        "vitals and age, and save the tiers that changed (one query to load, one bulk update). Schedule it at midnight so "
+        "patients who turn 65 move up, e.g. `0 0 * * * python manage.py retriage_queue`, and run "
+        "it after publishing a new triage rule version."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report what would change without saving")
+        parser.add_argument(
+            '--include-manual', action='store_true',
+            help="Also rescore entries whose priority a staff member set by hand (kept by default)",
+        )
+
+    def handle(self, *args, **options):
+        summary = retriage_queue(dry_run=options['dry_run'], include_manual=options['include_manual'])
+        tiers = ', '.join(f"{tier} {count}" for tier, count in summary['tiers'].items())
+        verb = "Would change" if options["dry_run"] else "Changed"
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {summary['checked']} waiting entries with rules v{summary['rule_version']}; "
+            f"{verb} {summary['changed']} ({tiers})"
+        ))
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import QueueEntry, QueueEntryArchive, QueueVersion
+
+
+class Command(BaseCommand):
+    help = (
+        "Move finished queue entries (and anything left over from previous days) into "
+        "QueueEntryArchive so QueueEntry only holds today's active queue. "
+        "Schedule it shortly after midnight, e.g. `5 0 * * * python manage.py rollover_queue`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        today = timezone.localdate()
+        now = timezone.now()
+        archived = 0
+
+        while True:
+            with transaction.atomic():
+                # Everything except today's waiting entries
+                batch = list(
+                    QueueEntry.objects.exclude(status=QueueEntry.WAITING, entered_at__date__gte=today)
+                    .select_for_update().order_by('id')[:batch_size]
+                )
+                if not batch:
+                    break
+                QueueEntryArchive.objects.bulk_create([
+                    QueueEntryArchive(
+                        original_id=entry.pk,
+                        patient_id=entry.patient_id,
+                        priority=entry.priority,
+                        entered_at=entry.entered_at,
+                        queue_number=entry.queue_number,
+                        rule_version=entry.rule_version,
+                        # Still waiting from a previous day: the patient left without being seen
+                        status=entry.status if entry.status != QueueEntry.WAITING else QueueEntry.CANCELLED,
+                        finished_at=entry.finished_at or now,
+                        archived_at=now,
+                    )
+                    for entry in batch
+                ])
+                QueueEntry.objects.filter(pk__in=[entry.pk for entry in batch]).delete()
+                QueueVersion.objects.bump()  # Stale waiting entries may still be in the web server's engines
+            archived += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} queue entries"))
@@ -0,0 +1,54 @@
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from api.ingest import process_pending, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = "Drain the IngestJob journal (readings posted to receive-vitals/async/) with a pool of worker threads"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=200, help="Jobs claimed per batch")
+        parser.add_argument('--poll', type=float, default=0.5, help="Seconds to sleep when the journal is empty")
+        parser.add_argument('--once', action='store_true', help="Exit when the journal is empty")
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} abandoned jobs")
+
+        stop = threading.Event()
+        threads = [
+            threading.Thread(target=self.work, args=(stop, options), name=f"ingest-{n}", daemon=True)
+            for n in range(options['workers'])
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f"Started {len(threads)} ingest workers")
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    def work(self, stop, options):
+        try:
+            while not stop.is_set():
+                close_old_connections()
+                try:
+                    processed = process_pending(options['batch_size'])
+                except Exception as e:
+                    self.stderr.write(f"{threading.current_thread().name}: batch failed: {e}")
+                    processed = 0
+                if not processed:
+                    if options['once']:
+                        return
+                    stop.wait(options['poll'])
+        finally:
+            connection.close()  # Each thread has its own connection
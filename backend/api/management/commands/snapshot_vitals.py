@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from api.snapshot import snapshot_dir, write_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the columnar analytics snapshot (one .npy per column per day of vitals, plus "
+        "patient demographics; see api/snapshot.py). Only days that changed since the last run "
+        "are rewritten, so it can run often, e.g. `*/30 * * * * python manage.py snapshot_vitals`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help="Snapshot directory (default: settings.ANALYTICS_SNAPSHOT_DIR)")
+        parser.add_argument('--rebuild', action='store_true', help="Rewrite every partition, e.g. after editing old readings")
+
+    def handle(self, *args, **options):
+        root = options['dir'] or snapshot_dir()
+        summary = write_snapshot(root, rebuild=options['rebuild'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Snapshot in {root}: rewrote {summary['partitions']} day partitions ({summary['rows']} readings), "
+            f"removed {summary['removed']}, {summary['patients']} patients"
+        ))
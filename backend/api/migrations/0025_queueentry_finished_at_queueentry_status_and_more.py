@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0024_dailysequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queueentry',
+            name='finished_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='queueentry',
+            name='status',
+            field=models.CharField(choices=[('WAITING', 'Waiting'), ('SERVED', 'Served'), ('CANCELLED', 'Cancelled')], default='WAITING', max_length=10),
+        ),
+        migrations.CreateModel(
+            name='QueueEntryArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_id', models.BigIntegerField()),
+                ('priority', models.CharField(blank=True, choices=[('CRITICAL', 'Critical'), ('HIGH', 'High'), ('MEDIUM', 'Medium'), ('NORMAL', 'Normal')], max_length=10, null=True)),
+                ('entered_at', models.DateTimeField(db_index=True)),
+                ('queue_number', models.CharField(blank=True, max_length=10, null=True)),
+                ('status', models.CharField(choices=[('WAITING', 'Waiting'), ('SERVED', 'Served'), ('CANCELLED', 'Cancelled')], max_length=10)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_queue_entries', to='api.patient')),
+            ],
+            options={
+                'ordering': ['-entered_at'],
+            },
+        ),
+    ]
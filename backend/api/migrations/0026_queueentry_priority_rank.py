@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:06
+
+from django.db import migrations, models
+
+
+PRIORITY_RANKS = {'CRITICAL': 1, 'HIGH': 2, 'MEDIUM': 3, 'NORMAL': 4}
+
+
+def backfill_priority_rank(apps, schema_editor):
+    QueueEntry = apps.get_model('api', 'QueueEntry')
+    for priority, rank in PRIORITY_RANKS.items():
+        QueueEntry.objects.filter(priority=priority).update(priority_rank=rank)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0025_queueentry_finished_at_queueentry_status_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queueentry',
+            name='priority_rank',
+            field=models.PositiveSmallIntegerField(default=4),
+        ),
+        migrations.RunPython(backfill_priority_rank, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='queueentry',
+            index=models.Index(fields=['priority_rank', 'entered_at'], name='queue_rank_entered_idx'),
+        ),
+    ]
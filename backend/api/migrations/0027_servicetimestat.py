@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0026_queueentry_priority_rank'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceTimeStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tier', models.PositiveSmallIntegerField(unique=True)),
+                ('mean_seconds', models.FloatField(default=0)),
+                ('samples', models.PositiveIntegerField(default=0)),
+                ('last_served_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
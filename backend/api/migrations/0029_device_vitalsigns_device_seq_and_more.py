@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0028_ingestjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Device',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device_id', models.CharField(max_length=50, unique=True)),
+                ('high_water_mark', models.PositiveBigIntegerField(default=0)),
+                ('last_seen_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='vitalsigns',
+            name='device_seq',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='vitalsigns',
+            name='date_time_recorded',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddConstraint(
+            model_name='vitalsigns',
+            constraint=models.UniqueConstraint(fields=('device_id', 'device_seq'), name='unique_device_reading'),
+        ),
+    ]
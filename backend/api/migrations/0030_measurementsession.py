@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:14
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0029_device_vitalsigns_device_seq_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MeasurementSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device_id', models.CharField(blank=True, max_length=50, null=True)),
+                ('signal', models.CharField(max_length=30)),
+                ('sample_rate', models.FloatField()),
+                ('dtype', models.CharField(choices=[('int16', 'int16'), ('int32', 'int32'), ('float32', 'float32'), ('float64', 'float64')], default='float32', max_length=10)),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('sample_count', models.PositiveBigIntegerField(default=0)),
+                ('closed_at', models.DateTimeField(blank=True, null=True)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='measurement_sessions', to='api.patient')),
+                ('vital_signs', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='measurement_sessions', to='api.vitalsigns')),
+            ],
+            options={
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SampleChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_index', models.PositiveBigIntegerField()),
+                ('sample_count', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='api.measurementsession')),
+            ],
+            options={
+                'ordering': ['start_index'],
+                'constraints': [models.UniqueConstraint(fields=('session', 'start_index'), name='unique_session_chunk')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0030_measurementsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vitalsigns',
+            name='sample_quality',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
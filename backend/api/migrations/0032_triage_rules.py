@@ -0,0 +1,85 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:21
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+# The rules that were hard-coded in utils.compute_priority, plus the blood-pressure rule
+# that was waiting for the BP fields: (group, field, operator, threshold, weight)
+INITIAL_RULES = [
+    ('heart_rate', 'heart_rate', 'lt', 50, 3),
+    ('heart_rate', 'heart_rate', 'gt', 110, 3),
+    ('temperature', 'temperature', 'lt', 35.5, 2),
+    ('temperature', 'temperature', 'gt', 38.5, 2),
+    ('oxygen_saturation', 'oxygen_saturation', 'lt', 92, 4),
+    ('blood_pressure', 'blood_pressure_systolic', 'lt', 90, 3),
+    ('blood_pressure', 'blood_pressure_systolic', 'gt', 140, 3),
+    ('blood_pressure', 'blood_pressure_diastolic', 'lt', 60, 3),
+    ('blood_pressure', 'blood_pressure_diastolic', 'gt', 90, 3),
+    ('senior', 'age', 'ge', 65, 2),
+    ('obesity', 'BMI', 'ge', 30, 1),
+]
+
+
+def create_initial_rules(apps, schema_editor):
+    TriageRuleSet = apps.get_model('api', 'TriageRuleSet')
+    TriageRule = apps.get_model('api', 'TriageRule')
+    rule_set = TriageRuleSet.objects.create(version=1, note='Initial rules', critical_min=6, high_min=3, medium_min=1)
+    TriageRule.objects.bulk_create([
+        TriageRule(rule_set=rule_set, group=group, field=field, operator=op, threshold=threshold, weight=weight)
+        for group, field, op, threshold, weight in INITIAL_RULES
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0031_vitalsigns_sample_quality'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TriageRuleSet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(unique=True)),
+                ('note', models.CharField(blank=True, default='', max_length=200)),
+                ('critical_min', models.PositiveSmallIntegerField(default=6)),
+                ('high_min', models.PositiveSmallIntegerField(default=3)),
+                ('medium_min', models.PositiveSmallIntegerField(default=1)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['-version'],
+            },
+        ),
+        migrations.AddField(
+            model_name='queueentry',
+            name='rule_version',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='vitalsigns',
+            name='blood_pressure_diastolic',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='vitalsigns',
+            name='blood_pressure_systolic',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='TriageRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group', models.CharField(max_length=30)),
+                ('field', models.CharField(choices=[('heart_rate', 'Heart rate'), ('temperature', 'Temperature'), ('oxygen_saturation', 'Oxygen saturation'), ('blood_pressure_systolic', 'Systolic blood pressure'), ('blood_pressure_diastolic', 'Diastolic blood pressure'), ('BMI', 'BMI'), ('weight', 'Weight'), ('height', 'Height'), ('age', 'Age')], max_length=30)),
+                ('operator', models.CharField(choices=[('lt', 'lt'), ('le', 'le'), ('gt', 'gt'), ('ge', 'ge')], max_length=2)),
+                ('threshold', models.FloatField()),
+                ('weight', models.PositiveSmallIntegerField()),
+                ('rule_set', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rules', to='api.triageruleset')),
+            ],
+        ),
+        migrations.RunPython(create_initial_rules, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+# Same as VitalSigns.SNAPSHOT_FIELDS / VitalSigns.snapshot()
+SNAPSHOT_FIELDS = (
+    'heart_rate', 'temperature', 'oxygen_saturation', 'blood_pressure_systolic',
+    'blood_pressure_diastolic', 'height', 'weight', 'BMI',
+)
+
+
+def backfill_latest_vitals(apps, schema_editor):
+    Patient = apps.get_model('api', 'Patient')
+    VitalSigns = apps.get_model('api', 'VitalSigns')
+    newest = VitalSigns.objects.filter(patient=OuterRef('pk')).order_by('-date_time_recorded', '-id')
+    patients = list(
+        Patient.objects.annotate(newest_id=Subquery(newest.values('id')[:1])).filter(newest_id__isnull=False)
+    )
+    readings = VitalSigns.objects.in_bulk([patient.newest_id for patient in patients])
+    for patient in patients:
+        reading = readings[patient.newest_id]
+        patient.latest_vitals_id = reading.pk
+        patient.triage_snapshot = {
+            'id': reading.pk,
+            'recorded_at': reading.date_time_recorded.isoformat(),
+            **{field: getattr(reading, field) for field in SNAPSHOT_FIELDS},
+        }
+    Patient.objects.bulk_update(patients, ['latest_vitals', 'triage_snapshot'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0032_triage_rules'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='latest_vitals',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.vitalsigns'),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='triage_snapshot',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='vitalsigns',
+            index=models.Index(fields=['patient', 'date_time_recorded'], name='vitals_patient_recorded_idx'),
+        ),
+        migrations.RunPython(backfill_latest_vitals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0033_patient_latest_vitals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VitalsRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Day'), ('week', 'Week'), ('month', 'Month')], max_length=5)),
+                ('period_start', models.DateField()),
+                ('readings', models.PositiveIntegerField(default=0)),
+                ('heart_rate_count', models.PositiveIntegerField(default=0)),
+                ('heart_rate_min', models.FloatField(blank=True, null=True)),
+                ('heart_rate_max', models.FloatField(blank=True, null=True)),
+                ('heart_rate_sum', models.FloatField(blank=True, null=True)),
+                ('temperature_count', models.PositiveIntegerField(default=0)),
+                ('temperature_min', models.FloatField(blank=True, null=True)),
+                ('temperature_max', models.FloatField(blank=True, null=True)),
+                ('temperature_sum', models.FloatField(blank=True, null=True)),
+                ('oxygen_saturation_count', models.PositiveIntegerField(default=0)),
+                ('oxygen_saturation_min', models.FloatField(blank=True, null=True)),
+                ('oxygen_saturation_max', models.FloatField(blank=True, null=True)),
+                ('oxygen_saturation_sum', models.FloatField(blank=True, null=True)),
+                ('blood_pressure_systolic_count', models.PositiveIntegerField(default=0)),
+                ('blood_pressure_systolic_min', models.FloatField(blank=True, null=True)),
+                ('blood_pressure_systolic_max', models.FloatField(blank=True, null=True)),
+                ('blood_pressure_systolic_sum', models.FloatField(blank=True, null=True)),
+                ('blood_pressure_diastolic_count', models.PositiveIntegerField(default=0)),
+                ('blood_pressure_diastolic_min', models.FloatField(blank=True, null=True)),
+                ('blood_pressure_diastolic_max', models.FloatField(blank=True, null=True)),
+                ('blood_pressure_diastolic_sum', models.FloatField(blank=True, null=True)),
+                ('weight_count', models.PositiveIntegerField(default=0)),
+                ('weight_min', models.FloatField(blank=True, null=True)),
+                ('weight_max', models.FloatField(blank=True, null=True)),
+                ('weight_sum', models.FloatField(blank=True, null=True)),
+                ('BMI_count', models.PositiveIntegerField(default=0)),
+                ('BMI_min', models.FloatField(blank=True, null=True)),
+                ('BMI_max', models.FloatField(blank=True, null=True)),
+                ('BMI_sum', models.FloatField(blank=True, null=True)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vitals_rollups', to='api.patient')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('patient', 'period', 'period_start'), name='unique_vitals_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def index_existing_patients(apps, schema_editor):
+    from api.search import SEARCH_FIELDS, patient_trigrams  # Pure text functions, no model use
+
+    Patient = apps.get_model('api', 'Patient')
+    PatientSearchTrigram = apps.get_model('api', 'PatientSearchTrigram')
+    rows = [
+        PatientSearchTrigram(patient_id=values['pk'], trigram=gram, weight=weight)
+        for values in Patient.objects.values('pk', *SEARCH_FIELDS).iterator()
+        for gram, weight in patient_trigrams(values)
+    ]
+    PatientSearchTrigram.objects.bulk_create(rows, batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0034_vitalsrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientSearchTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('weight', models.PositiveSmallIntegerField()),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.patient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['trigram', 'patient'], name='search_trigram_patient_idx')],
+                'constraints': [models.UniqueConstraint(fields=('trigram', 'weight', 'patient'), name='unique_patient_trigram')],
+            },
+        ),
+        migrations.RunPython(index_existing_patients, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:55
+
+from django.db import migrations, models
+
+
+def fill_blocking_keys(apps, schema_editor):
+    from api.utils import blocking_key  # Pure function, no model use
+
+    Patient = apps.get_model('api', 'Patient')
+    patients = list(Patient.objects.only('first_name', 'last_name', 'sex', 'birthdate'))
+    for patient in patients:
+        patient.blocking_key = blocking_key(patient.first_name, patient.last_name, patient.sex, patient.birthdate)
+    Patient.objects.bulk_update(patients, ['blocking_key'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0035_patient_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='blocking_key',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=20),
+        ),
+        migrations.RunPython(fill_blocking_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0036_patient_blocking_key'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='measurementsession',
+            index=models.Index(fields=['started_at'], name='session_started_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['last_name', 'first_name'], name='patient_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vitalsigns',
+            index=models.Index(fields=['date_time_recorded'], name='vitals_recorded_idx'),
+        ),
+    ]
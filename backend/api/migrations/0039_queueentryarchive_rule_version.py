@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0038_queueversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queueentryarchive',
+            name='rule_version',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:02
+
+from django.db import migrations
+
+
+TIERS = (1, 2, 3, 4)  # QueueEntry.PRIORITY_RANKS
+
+
+def seed_service_time_stats(apps, schema_editor):
+    # One row per tier up front, so record_serve's SELECT ... FOR UPDATE always has
+    # something to lock (two first serves of a tier would otherwise both insert it)
+    ServiceTimeStat = apps.get_model('api', 'ServiceTimeStat')
+    for tier in TIERS:
+        ServiceTimeStat.objects.get_or_create(tier=tier)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0039_queueentryarchive_rule_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_service_time_stats, migrations.RunPython.noop),
+    ]
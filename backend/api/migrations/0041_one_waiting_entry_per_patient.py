@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:31
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def cancel_extra_waiting_entries(apps, schema_editor):
+    # Keep each patient's newest waiting entry; older ones are leftovers that
+    # rollover_queue would have cancelled
+    QueueEntry = apps.get_model('api', 'QueueEntry')
+    kept = set()
+    extra = []
+    for entry in QueueEntry.objects.filter(status='WAITING').order_by('patient_id', '-entered_at'):
+        if entry.patient_id in kept:
+            extra.append(entry.pk)
+        else:
+            kept.add(entry.patient_id)
+    QueueEntry.objects.filter(pk__in=extra).update(status='CANCELLED', finished_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0040_seed_service_time_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(cancel_extra_waiting_entries, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='queueentry',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'WAITING')), fields=('patient',), name='one_waiting_entry_per_patient'),
+        ),
+    ]
@@ -1,7 +1,12 @@
-from django.db import models
+import threading
+import time
+from types import SimpleNamespace
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Q
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from datetime import date
-from .utils import compute_patient_priority
+from .utils import BLOCKING_FIELDS, DEFAULT_TIERS, DEFAULT_TRIAGE_RULES, RULE_OPERATORS, TriageRules, blocking_key, compute_patient_priority
 
 class HCStaff(models.Model):
     name = models.CharField(max_length=50)
@@ -20,6 +25,18 @@ class Patient(models.Model):
     pin = models.CharField(max_length=4)
     fingerprint_id = models.CharField(max_length=4, null=True, blank=True, unique=True)
     last_visit = models.DateTimeField(null=True, blank=True)
+    # Newest reading and a copy of its values (VitalSigns.snapshot), kept current by ingestion
+    # so triage, the queue and the profile never have to look it up
+    latest_vitals = models.ForeignKey('VitalSigns', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    triage_snapshot = models.JSONField(null=True, blank=True)
+    # Sound-alike name + sex + birthdate (utils.blocking_key); duplicates are looked for within a block (dedup.py)
+    blocking_key = models.CharField(max_length=20, blank=True, default='', db_index=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # List order for pagination (InnoDB and SQLite end every index with the pk, the tie-breaker)
+            models.Index(fields=['last_name', 'first_name'], name='patient_name_idx'),
+        ]
     
     @property
     def age(self):
@@ -33,40 +50,129 @@ class Patient(models.Model):
 
     def save(self, *args, **kwargs):  
         if not self.patient_id:
-            today = timezone.now().date()
-            yyyymmdd = today.strftime("%Y%m%d")
-            count_today = Patient.objects.filter(patient_id__startswith=f"P-{yyyymmdd}").count() + 1
-            self.patient_id = f"P-{yyyymmdd}-{count_today:03d}"
-            pass
+            self.patient_id = Patient.allocate_ids(1)[0]
             
-          # set last_visit on first creation
+        # set last_visit on first creation
         if not self.last_visit:
             self.last_visit = timezone.now()
-            super().save(*args, **kwargs)
+
+        self.blocking_key = blocking_key(self.first_name, self.last_name, self.sex, self.birthdate)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and set(update_fields) & set(BLOCKING_FIELDS):
+            kwargs['update_fields'] = {*update_fields, 'blocking_key'}
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def allocate_ids(count, day=None):
+        """Reserve `count` patient IDs in one counter bump (e.g. before a bulk_create import)."""
+        day = day or timezone.now().date()
+        yyyymmdd = day.strftime("%Y%m%d")
+        first = DailySequence.objects.allocate(
+            'P', day, count=count,
+            seed=lambda: _max_suffix(
+                Patient.objects.filter(patient_id__startswith=f"P-{yyyymmdd}-").values_list('patient_id', flat=True), '-'
+            ),
+        )
+        return [f"P-{yyyymmdd}-{n:03d}" for n in range(first, first + count)]
 
     def is_senior(self):
         """Helper: Check if patient is senior (age >= 65)."""
         return self.age is not None and self.age >= 65
 
+    def latest_reading(self):
+        """The newest reading's values, from triage_snapshot (no query), or None if there are none."""
+        if not self.triage_snapshot:
+            return None
+        return SimpleNamespace(**self.triage_snapshot)
+
+    def take_latest_vitals(self, vital_signs):
+        """
+        Point latest_vitals/triage_snapshot at `vital_signs` if it is at least as new as the
+        current one (readings can arrive out of order after an outage). Doesn't save;
+        returns True if they changed.
+        """
+        current = self.triage_snapshot
+        if current and current.get('recorded_at'):
+            current_key = (parse_datetime(current['recorded_at']), current.get('id') or 0)
+            if current_key > (vital_signs.date_time_recorded, vital_signs.pk or 0):
+                return False
+        self.latest_vitals = vital_signs if vital_signs.pk else None
+        self.triage_snapshot = vital_signs.snapshot()
+        return True
+
+    def refresh_latest_vitals(self):
+        """Recompute latest_vitals/triage_snapshot from the database (after an edit or delete)."""
+        latest = self.vital_signs.order_by('-date_time_recorded', '-id').first()
+        self.latest_vitals = latest
+        self.triage_snapshot = latest.snapshot() if latest else None
+        self.save(update_fields=['latest_vitals', 'triage_snapshot'])
+
+class PatientSearchTrigram(models.Model):
+    """One trigram of a searchable Patient field, with that field's weight (search.py)."""
+    trigram = models.CharField(max_length=3)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='+')
+    weight = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            # Also the scan index: trigram -> patients, best weight first, without touching the table rows
+            models.UniqueConstraint(fields=['trigram', 'weight', 'patient'], name='unique_patient_trigram'),
+        ]
+        indexes = [
+            # Probe: does this patient have that trigram?
+            models.Index(fields=['trigram', 'patient'], name='search_trigram_patient_idx'),
+        ]
+
 class VitalSigns(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='vital_signs')  # Link to Patient model
     device_id = models.CharField(max_length=50, null=True, blank=True)  # Link to the RPi device
-    date_time_recorded = models.DateTimeField(auto_now_add=True)
+    date_time_recorded = models.DateTimeField(default=timezone.now)  # Device time for synced/journaled readings
+    device_seq = models.PositiveBigIntegerField(null=True, blank=True)  # Device's own reading number (sync protocol)
     heart_rate = models.IntegerField(null=True, blank=True)  # bpm; Allow null for optional
     temperature = models.FloatField(null=True, blank=True)  # °C
     oxygen_saturation = models.FloatField(null=True, blank=True)  # %
-    # Optional: Add BP if needed (as per your original query)
-    # blood_pressure_systolic = models.IntegerField(null=True, blank=True)  # mmHg
-    # blood_pressure_diastolic = models.IntegerField(null=True, blank=True)  # mmHg
+    blood_pressure_systolic = models.IntegerField(null=True, blank=True)  # mmHg
+    blood_pressure_diastolic = models.IntegerField(null=True, blank=True)  # mmHg
     height = models.FloatField(null=True, blank=True)  # meters
     weight = models.FloatField(null=True, blank=True)  # kg
     BMI = models.FloatField(null=True, blank=True) 
+    sample_quality = models.JSONField(null=True, blank=True)  # Per-vital reduction stats when raw samples were sent (reduction.py)
     
-    def save(self, *args, **kwargs):  # Fixed: Override save() to auto-compute BMI
+    # Values copied into Patient.triage_snapshot
+    SNAPSHOT_FIELDS = (
+        'heart_rate', 'temperature', 'oxygen_saturation', 'blood_pressure_systolic',
+        'blood_pressure_diastolic', 'height', 'weight', 'BMI',
+    )
+    
+    class Meta:
+        constraints = [
+            # A device never delivers the same reading twice, even if a sync is retried
+            models.UniqueConstraint(fields=['device_id', 'device_seq'], name='unique_device_reading'),
+        ]
+        indexes = [
+            # A patient's history, newest first (profile, charts, rebuild_latest_vitals)
+            models.Index(fields=['patient', 'date_time_recorded'], name='vitals_patient_recorded_idx'),
+            # Everyone's readings, newest first (paginated list, exports)
+            models.Index(fields=['date_time_recorded'], name='vitals_recorded_idx'),
+        ]
+
+    def snapshot(self):
+        """The values triage needs, as stored in Patient.triage_snapshot."""
+        return {
+            'id': self.pk,
+            'recorded_at': self.date_time_recorded.isoformat(),
+            **{field: getattr(self, field) for field in self.SNAPSHOT_FIELDS},
+        }
+
+    def compute_bmi(self):
+        """Fill in BMI from height/weight (also used before bulk_create, which skips save())."""
         # Compute BMI if height and weight are provided
         if self.height and self.weight and self.height > 0:
             self.BMI = round(self.weight / (self.height ** 2), 2)
         # If no height/weight, leave BMI as None
+
+    def save(self, *args, **kwargs):  # Fixed: Override save() to auto-compute BMI
+        self.compute_bmi()
         super().save(*args, **kwargs)
 
 class QueueEntry(models.Model):
@@ -76,26 +182,423 @@ class QueueEntry(models.Model):
         ('MEDIUM', 'Medium'),
         ('NORMAL', 'Normal'),
     ]
+    # Serving order of each tier; stored in priority_rank so the queue can be sorted from an index
+    PRIORITY_RANKS = {
+        'CRITICAL': 1,
+        'HIGH': 2,
+        'MEDIUM': 3,
+        'NORMAL': 4,
+    }
+    DEFAULT_RANK = 4  # Unscored entries sort with NORMAL
+    WAITING = 'WAITING'
+    SERVED = 'SERVED'
+    CANCELLED = 'CANCELLED'
+    STATUS_CHOICES = [
+        (WAITING, 'Waiting'),
+        (SERVED, 'Served'),
+        (CANCELLED, 'Cancelled'),
+    ]
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='queue_entries')
     priority = models.CharField(max_length=10, choices=PRIORITY_CHOICES, null=True, blank=True)
+    priority_rank = models.PositiveSmallIntegerField(default=DEFAULT_RANK)  # Kept in sync with priority by save()
     entered_at = models.DateTimeField(default=timezone.now)
     queue_number = models.CharField(max_length=10, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=WAITING)
+    finished_at = models.DateTimeField(null=True, blank=True)  # When served or cancelled
+    rule_version = models.PositiveIntegerField(null=True, blank=True)  # TriageRuleSet that scored it; null if set by hand
     
     class Meta:
         ordering = ['-entered_at']
+        indexes = [
+            models.Index(fields=['priority_rank', 'entered_at'], name='queue_rank_entered_idx'),
+        ]
+        constraints = [
+            # MySQL has no partial unique indexes, so there ingest also locks the patient row
+            # before queueing them (see ingest.py)
+            models.UniqueConstraint(fields=['patient'], condition=Q(status='WAITING'), name='one_waiting_entry_per_patient'),
+        ]
+
+    @classmethod
+    def rank_for(cls, priority):
+        """Map a priority label to its serving tier (lower is served first)."""
+        return cls.PRIORITY_RANKS.get(priority, cls.DEFAULT_RANK)
     
     def save(self, *args, **kwargs):
-        # UPDATE LAST VISIT when entering queue
-        self.patient.last_visit = timezone.now()
-        self.patient.save()
+        # UPDATE LAST VISIT when entering queue (unless the caller already did, e.g. ingest_reading)
+        if self._state.adding and (self.patient.last_visit is None or self.patient.last_visit < self.entered_at):
+            self.patient.last_visit = timezone.now()
+            self.patient.save(update_fields=['last_visit'])
         
         # Auto-compute priority on save (if not set)
         if not self.priority:
-            self.priority = compute_patient_priority(self.patient)
+            rules = TriageRuleSet.objects.current()
+            self.priority = compute_patient_priority(self.patient, rules)
+            self.rule_version = rules.version
+        
+        self.priority_rank = QueueEntry.rank_for(self.priority)
         
         if not self.queue_number:
-            today = timezone.now().date()
-            count_today = QueueEntry.objects.filter(entered_at__date=today).count() + 1
-            self.queue_number = f"Q{count_today:03d}"
+            self.queue_number = QueueEntry.allocate_numbers(1)[0]
         super().save(*args, **kwargs)
 
+    @staticmethod
+    def allocate_numbers(count, day=None):
+        """Reserve `count` queue numbers for the day in one counter bump."""
+        day = day or timezone.now().date()
+        first = DailySequence.objects.allocate(
+            'Q', day, count=count,
+            seed=lambda: _max_suffix(
+                QueueEntry.objects.filter(entered_at__date=day).values_list('queue_number', flat=True), 'Q'
+            ),
+        )
+        return [f"Q{n:03d}" for n in range(first, first + count)]
+
+    def finish(self, status):
+        """
+        Mark the entry served or cancelled; it stays here until the day rollover archives it.
+        Returns False (and changes nothing) if it was no longer waiting: two stations pressing
+        serve at once get one serve, counted once in the service times.
+        """
+        from .queue_engine import get_queue_engine  # It imports this module
+
+        with transaction.atomic():
+            finished_at = timezone.now()
+            # Conditional UPDATE: the check and the write are one statement, so there is no race
+            if not QueueEntry.objects.filter(pk=self.pk, status=QueueEntry.WAITING).update(
+                status=status, finished_at=finished_at
+            ):
+                return False
+            self.status, self.finished_at = status, finished_at
+            if status == QueueEntry.SERVED:
+                ServiceTimeStat.objects.record_serve(self)
+            transaction.on_commit(lambda: get_queue_engine().upsert(self))  # update() sends no post_save
+        return True
+
+class QueueEntryArchive(models.Model):
+    """Finished queue entries moved out of QueueEntry by `manage.py rollover_queue`, kept for reports."""
+    original_id = models.BigIntegerField()  # QueueEntry.id before archiving
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='archived_queue_entries')
+    priority = models.CharField(max_length=10, choices=QueueEntry.PRIORITY_CHOICES, null=True, blank=True)
+    entered_at = models.DateTimeField(db_index=True)
+    queue_number = models.CharField(max_length=10, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=QueueEntry.STATUS_CHOICES)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    rule_version = models.PositiveIntegerField(null=True, blank=True)  # Copied from QueueEntry.rule_version
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-entered_at']
+
+class DailySequenceManager(models.Manager):
+    def allocate(self, prefix, day=None, count=1, seed=None):
+        """
+        Reserve `count` consecutive numbers for (prefix, day) and return the first one.
+
+        The counter row is bumped with a single UPDATE ... SET last_value = last_value + n,
+        which locks it until the surrounding transaction ends, so concurrent kiosks and
+        RPi posts never get the same number. `seed` is only called the first time a
+        prefix is used on a day, to continue after numbers handed out before the counter
+        existed.
+        """
+        day = day or timezone.now().date()
+        with transaction.atomic():
+            rows = self.filter(prefix=prefix, day=day)
+            if not rows.update(last_value=F('last_value') + count):
+                start = seed() if seed else 0
+                try:
+                    with transaction.atomic():
+                        self.create(prefix=prefix, day=day, last_value=start + count)
+                    return start + 1
+                except IntegrityError:
+                    # Another request created today's row first; fall back to incrementing it
+                    rows.update(last_value=F('last_value') + count)
+            last_value = rows.values_list('last_value', flat=True).get()
+        return last_value - count + 1
+
+class DailySequence(models.Model):
+    """Per-day counter behind patient IDs (P-YYYYMMDD-nnn) and queue numbers (Qnnn)."""
+    prefix = models.CharField(max_length=10)
+    day = models.DateField()
+    last_value = models.PositiveIntegerField(default=0)
+
+    objects = DailySequenceManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['prefix', 'day'], name='unique_daily_sequence'),
+        ]
+
+class QueueVersionManager(models.Manager):
+    def current(self):
+        """The version number (0 before the first bump)."""
+        return self.filter(pk=1).values_list('version', flat=True).first() or 0
+
+    def bump(self):
+        """
+        Tell every process's queue engine that QueueEntry rows changed behind its back.
+        Call it inside the transaction that made the change, so the bump commits with it.
+        """
+        with transaction.atomic():
+            if not self.filter(pk=1).update(version=F('version') + 1):
+                try:
+                    with transaction.atomic():
+                        self.create(pk=1, version=1)
+                except IntegrityError:
+                    self.filter(pk=1).update(version=F('version') + 1)
+
+class QueueVersion(models.Model):
+    """
+    Single-row counter bumped by writes that bypass the queue signals in this process
+    (ingest workers, retriage_queue, rollover_queue, merges); queue engines reload when it changes.
+    """
+    version = models.PositiveBigIntegerField(default=0)
+
+    objects = QueueVersionManager()
+
+def _max_suffix(values, sep):
+    """Largest numeric suffix among existing IDs, used to seed a day's counter."""
+    suffixes = [int(v.rsplit(sep, 1)[-1]) for v in values if v and v.rsplit(sep, 1)[-1].isdigit()]
+    return max(suffixes, default=0)
+
+class ServiceTimeStatManager(models.Manager):
+    # Weight of the newest serve in the rolling mean (exponentially weighted, so O(1) per serve)
+    SMOOTHING = 0.2
+    # Gaps longer than this are breaks or idle time, not service time
+    MAX_SAMPLE_SECONDS = 2 * 60 * 60
+
+    def record_serve(self, entry):
+        """Fold one serve event into its tier's rolling service time."""
+        with transaction.atomic():
+            # One row per tier, seeded by migration 0040, so this locks every tier's row
+            stats = {stat.tier: stat for stat in self.select_for_update()}
+            # Service time: since the previous serve (of any tier) today, or since the patient queued
+            last_served = max((s.last_served_at for s in stats.values() if s.last_served_at), default=None)
+            start = entry.entered_at
+            if last_served and last_served > start and timezone.localdate(last_served) == timezone.localdate(entry.finished_at):
+                start = last_served
+            seconds = min(max((entry.finished_at - start).total_seconds(), 0), self.MAX_SAMPLE_SECONDS)
+
+            stat = stats.get(entry.priority_rank) or self.get_or_create(tier=entry.priority_rank)[0]
+            if stat.samples:
+                stat.mean_seconds += self.SMOOTHING * (seconds - stat.mean_seconds)
+            else:
+                stat.mean_seconds = seconds
+            stat.samples += 1
+            stat.last_served_at = entry.finished_at
+            stat.save()
+        return stat
+
+class ServiceTimeStat(models.Model):
+    """Rolling service time per priority tier, used for the queue's wait-time estimates."""
+    tier = models.PositiveSmallIntegerField(unique=True)  # QueueEntry.priority_rank
+    mean_seconds = models.FloatField(default=0)
+    samples = models.PositiveIntegerField(default=0)
+    last_served_at = models.DateTimeField(null=True, blank=True)
+
+    objects = ServiceTimeStatManager()
+
+class IngestJob(models.Model):
+    """
+    Journal of vitals posted to receive-vitals/async/. The request only validates and
+    inserts a row here; `manage.py run_ingest_workers` drains the journal in batches.
+    """
+    PENDING = 'PENDING'
+    PROCESSING = 'PROCESSING'
+    DONE = 'DONE'
+    FAILED = 'FAILED'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (PROCESSING, 'Processing'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+    readings = models.JSONField()  # Already-validated readings (see ingest.clean_reading)
+    reading_count = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    results = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    received_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='ingestjob_status_idx'),
+            models.Index(fields=['finished_at'], name='ingestjob_finished_idx'),
+        ]
+
+class Device(models.Model):
+    """
+    A vitals station using the sync protocol (POST /api/devices/<device_id>/sync/).
+    Readings are numbered by the device; everything up to high_water_mark has been stored.
+    """
+    device_id = models.CharField(max_length=50, unique=True)
+    high_water_mark = models.PositiveBigIntegerField(default=0)
+    last_seen_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+class MeasurementSession(models.Model):
+    """
+    A high-frequency sample stream from a station (e.g. a 100 Hz pulse-oximeter waveform).
+    Samples are stored as compressed NumPy arrays in SampleChunk rows, see timeseries.py;
+    the summary numbers for the visit stay in VitalSigns.
+    """
+    DTYPE_CHOICES = [
+        ('int16', 'int16'),
+        ('int32', 'int32'),
+        ('float32', 'float32'),
+        ('float64', 'float64'),
+    ]
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='measurement_sessions')
+    vital_signs = models.ForeignKey(
+        VitalSigns, on_delete=models.SET_NULL, null=True, blank=True, related_name='measurement_sessions'
+    )  # Summary reading this stream was taken for
+    device_id = models.CharField(max_length=50, null=True, blank=True)
+    signal = models.CharField(max_length=30)  # e.g. 'ppg', 'heart_rate', 'oxygen_saturation'
+    sample_rate = models.FloatField()  # Hz
+    dtype = models.CharField(max_length=10, choices=DTYPE_CHOICES, default='float32')
+    started_at = models.DateTimeField(default=timezone.now)  # Time of sample 0
+    sample_count = models.PositiveBigIntegerField(default=0)
+    closed_at = models.DateTimeField(null=True, blank=True)  # No more appends after this
+
+    class Meta:
+        ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['started_at'], name='session_started_idx'),  # List order for pagination
+        ]
+
+class SampleChunk(models.Model):
+    """One appended block of a session's samples: zlib-compressed .npy bytes."""
+    session = models.ForeignKey(MeasurementSession, on_delete=models.CASCADE, related_name='chunks')
+    start_index = models.PositiveBigIntegerField()  # Index of the first sample in the session
+    sample_count = models.PositiveIntegerField()
+    data = models.BinaryField()
+
+    class Meta:
+        ordering = ['start_index']
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'start_index'], name='unique_session_chunk'),
+        ]
+
+class VitalsRollup(models.Model):
+    """
+    Count/min/max/sum of each vital in FIELDS over one patient's day, week (from Monday)
+    or month, for trend charts; mean = sum / count. Updated on every insert, see rollups.py.
+    """
+    DAY = 'day'
+    WEEK = 'week'
+    MONTH = 'month'
+    PERIOD_CHOICES = [
+        (DAY, 'Day'),
+        (WEEK, 'Week'),
+        (MONTH, 'Month'),
+    ]
+    FIELDS = (
+        'heart_rate', 'temperature', 'oxygen_saturation', 'blood_pressure_systolic',
+        'blood_pressure_diastolic', 'weight', 'BMI',
+    )
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='vitals_rollups')
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    period_start = models.DateField()  # Local date the bucket starts on
+    readings = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['patient', 'period', 'period_start'], name='unique_vitals_rollup'),
+        ]
+
+# <vital>_count/_min/_max/_sum columns; _count is the number of readings that had the vital
+for _field in VitalsRollup.FIELDS:
+    VitalsRollup.add_to_class(f'{_field}_count', models.PositiveIntegerField(default=0))
+    VitalsRollup.add_to_class(f'{_field}_min', models.FloatField(null=True, blank=True))
+    VitalsRollup.add_to_class(f'{_field}_max', models.FloatField(null=True, blank=True))
+    VitalsRollup.add_to_class(f'{_field}_sum', models.FloatField(null=True, blank=True))
+
+_triage_rules_lock = threading.Lock()
+_triage_rules_cache = {'rules': None, 'expires': 0.0}
+
+class TriageRuleSetManager(models.Manager):
+    # How long a process trusts its compiled rules before checking for a newer version
+    RECHECK_SECONDS = 30
+
+    def current(self):
+        """
+        The newest rule set, compiled (TriageRules) and cached per process. Costs one
+        query per RECHECK_SECONDS to look at the latest version number, plus one to load
+        and recompile when it has changed. Saving a rule set here invalidates the cache at once.
+        """
+        cache = _triage_rules_cache
+        rules = cache['rules']
+        if rules is not None and time.monotonic() < cache['expires']:
+            return rules
+        with _triage_rules_lock:
+            latest = self.order_by('-version').values_list('version', flat=True).first()
+            rules = cache['rules']
+            if latest is None:
+                rules = DEFAULT_TRIAGE_RULES
+            elif rules is None or rules.version != latest:
+                rule_set = self.get(version=latest)
+                rules = rule_set.compile()
+            cache['rules'] = rules
+            cache['expires'] = time.monotonic() + self.RECHECK_SECONDS
+        return rules
+
+    def invalidate(self):
+        _triage_rules_cache['expires'] = 0.0
+
+    def create_version(self, rules, tiers=None, note=''):
+        """
+        Save a new rule set as the next version. `rules` are dicts with group, field,
+        operator, threshold and weight; `tiers` maps CRITICAL/HIGH/MEDIUM to min scores.
+        Existing versions are never edited, so old scores stay reproducible.
+        """
+        tiers = {**dict(DEFAULT_TIERS), **(tiers or {})}
+        with transaction.atomic():
+            latest = self.select_for_update().order_by('-version').values_list('version', flat=True).first()
+            rule_set = self.create(
+                version=(latest or 0) + 1, note=note,
+                critical_min=tiers['CRITICAL'], high_min=tiers['HIGH'], medium_min=tiers['MEDIUM'],
+            )
+            TriageRule.objects.bulk_create([TriageRule(rule_set=rule_set, **rule) for rule in rules])
+        return rule_set
+
+class TriageRuleSet(models.Model):
+    """A version of the triage scoring rules (see utils.TriageRules). The newest one is active."""
+    version = models.PositiveIntegerField(unique=True)
+    note = models.CharField(max_length=200, blank=True, default='')
+    critical_min = models.PositiveSmallIntegerField(default=6)  # Lowest score for each tier
+    high_min = models.PositiveSmallIntegerField(default=3)
+    medium_min = models.PositiveSmallIntegerField(default=1)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    objects = TriageRuleSetManager()
+
+    class Meta:
+        ordering = ['-version']
+
+    def compile(self):
+        rows = self.rules.values_list('group', 'field', 'operator', 'threshold', 'weight')
+        tiers = [('CRITICAL', self.critical_min), ('HIGH', self.high_min), ('MEDIUM', self.medium_min)]
+        return TriageRules(self.version, rows, tiers)
+
+class TriageRule(models.Model):
+    """One condition of a rule set: adds `weight` when `field <operator> threshold` (once per group)."""
+    FIELD_CHOICES = [
+        ('heart_rate', 'Heart rate'),
+        ('temperature', 'Temperature'),
+        ('oxygen_saturation', 'Oxygen saturation'),
+        ('blood_pressure_systolic', 'Systolic blood pressure'),
+        ('blood_pressure_diastolic', 'Diastolic blood pressure'),
+        ('BMI', 'BMI'),
+        ('weight', 'Weight'),
+        ('height', 'Height'),
+        ('age', 'Age'),
+    ]
+    OPERATOR_CHOICES = [(op, op) for op in RULE_OPERATORS]
+    rule_set = models.ForeignKey(TriageRuleSet, on_delete=models.CASCADE, related_name='rules')
+    group = models.CharField(max_length=30)
+    field = models.CharField(max_length=30, choices=FIELD_CHOICES)
+    operator = models.CharField(max_length=2, choices=OPERATOR_CHOICES)
+    threshold = models.FloatField()
+    weight = models.PositiveSmallIntegerField()
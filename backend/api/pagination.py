@@ -0,0 +1,145 @@
+import base64
+import datetime
+import json
+from functools import reduce
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+DEFAULT_PAGE_SIZE = 50  # When REST_FRAMEWORK['PAGE_SIZE'] isn't set
+DEFAULT_MAX_PAGE_SIZE = 500  # When API_MAX_PAGE_SIZE isn't set
+
+
+def encode_cursor(values):
+    """Opaque cursor for a keyset position (the ordering values of the last row on a page)."""
+    # isoformat() keeps microseconds, which DjangoJSONEncoder would truncate
+    values = [v.isoformat() if isinstance(v, (datetime.date, datetime.time)) else v for v in values]
+    raw = json.dumps(values, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise NotFound("Invalid cursor")
+    if not isinstance(values, list):
+        raise NotFound("Invalid cursor")
+    return values
+
+
+def keyset_filter(ordering, values):
+    """
+    Rows strictly after `values` in `ordering`, e.g. for ('priority_rank', 'entered_at', 'id'):
+    rank > r OR (rank = r AND entered_at > e) OR (rank = r AND entered_at = e AND id > i).
+    A leading '-' means descending. Ordering columns must be non-null and end in a unique one.
+    """
+    clauses = []
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        equal = {f.lstrip('-'): v for f, v in zip(ordering[:i], values[:i])}
+        clauses.append(Q(**equal, **{f'{name}__{lookup}': values[i]}))
+    return reduce(lambda a, b: a | b, clauses)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination: each page is an index range scan starting after the last
+    row of the previous page, so deep pages cost the same as the first one.
+
+    The default paginator for every list endpoint (REST_FRAMEWORK in settings.py), so no
+    request can serialize a whole table: a page holds REST_FRAMEWORK['PAGE_SIZE'] rows,
+    or ?page_size=n up to API_MAX_PAGE_SIZE. The view sets `keyset_ordering` (default:
+    newest id first), which should be backed by an index. The body stays a plain list
+    (what the frontend already expects); the next page is advertised in
+    `Link: <...>; rel="next"` and `X-Next-Cursor` headers.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    default_ordering = ('-id',)
+
+    @property
+    def page_size(self):
+        return api_settings.PAGE_SIZE or DEFAULT_PAGE_SIZE
+
+    @property
+    def max_page_size(self):
+        return getattr(settings, 'API_MAX_PAGE_SIZE', DEFAULT_MAX_PAGE_SIZE)
+
+    def is_requested(self, request):
+        """True if the client asked for a page (for views that serve everything otherwise)."""
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def get_ordering(self, view):
+        return tuple(getattr(view, 'keyset_ordering', self.default_ordering))
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            size = self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        return decode_cursor(cursor) if cursor else None
+
+    def cursor_values(self, model, ordering, cursor):
+        """
+        A decoded cursor's values as the ordering columns' Python types; NotFound if they
+        don't fit (a hand-edited cursor must not turn into a database error).
+        """
+        if len(cursor) != len(ordering):
+            raise NotFound("Invalid cursor")
+        values = []
+        for field_name, value in zip(ordering, cursor):
+            name = field_name.lstrip('-')
+            field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+            try:
+                value = field.to_python(value)
+                field.run_validators(value)  # e.g. the database's integer range
+            except (ValidationError, ValueError, TypeError, OverflowError):
+                raise NotFound("Invalid cursor")
+            if value is None:
+                raise NotFound("Invalid cursor")  # Ordering columns are never null
+            values.append(value)
+        return values
+
+    def paginate_queryset(self, queryset, request, view=None, ordering=None):
+        """A page of `queryset` in `ordering` (default: the view's keyset_ordering)."""
+        self.request = request
+        ordering = tuple(ordering or self.get_ordering(view))
+        page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*ordering)
+        cursor = self.get_cursor(request)
+        if cursor is not None:
+            queryset = queryset.filter(keyset_filter(ordering, self.cursor_values(queryset.model, ordering, cursor)))
+
+        rows = list(queryset[:page_size + 1])  # One extra row tells us whether there is a next page
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        self.set_next(request, [getattr(rows[-1], f.lstrip('-')) for f in ordering] if has_next else None)
+        return rows
+
+    def set_next(self, request, values):
+        """Record where the next page starts (None on the last page)."""
+        self.request = request
+        self.next_cursor = encode_cursor(values) if values is not None else None
+
+    def get_paginated_response(self, data):
+        headers = {}
+        if self.next_cursor:
+            url = replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+            headers['Link'] = f'<{url}>; rel="next"'
+            headers['X-Next-Cursor'] = self.next_cursor
+        return Response(data, headers=headers)
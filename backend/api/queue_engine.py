@@ -0,0 +1,360 @@
+"""
+In-memory priority queue for today's waiting QueueEntry rows.
+
+The waiting-room screens and staff stations poll the queue all day, so instead of
+sorting the whole QueueEntry table on every request we keep today's WAITING entries in a
+heap keyed by (priority tier, entered_at). Reads never touch the database.
+
+- Inserts, priority changes and removals are O(log n). Removed or re-prioritised
+  heap items are left in place and skipped lazily (each item carries a token).
+- Writes go through to QueueEntry first; the engine is updated once the
+  transaction commits (see signals.py), so it never shows uncommitted rows.
+- The engine is rebuilt from the database the first time it is used in a
+  process, and again whenever the date changes.
+- Writes that bypass this process's signals (ingest workers, retriage_queue,
+  rollover_queue, merges) bump QueueVersion. Reads look at it at most every
+  RECHECK_SECONDS (one single-row query) and reload when it has moved.
+- Each entry's estimated call time comes from the rolling per-tier service times
+  in ServiceTimeStat (updated on every serve), summed over the entries ahead of it.
+- Every change bumps a version number and is kept in a bounded change log, so
+  the queue stream (views.queue_stream) can send deltas from a client's cursor.
+"""
+
+import bisect
+import collections
+import heapq
+import itertools
+import threading
+import time
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import QueueEntry, QueueVersion, ServiceTimeStat
+from .serializers import QueueEntrySerializer
+
+DEFAULT_SERVICE_SECONDS = 10 * 60  # Used for a tier until it has been served at least once
+CHANGE_LOG_SIZE = 1000  # Deltas kept for resuming streams; older cursors get a snapshot
+RECHECK_SECONDS = 2  # How long reads trust the engine before checking QueueVersion
+
+
+class QueueEngine:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._tokens = itertools.count()
+        self._heap = []        # (rank, entered_at, entry_id, token)
+        self._entries = {}     # entry_id -> (heap item, patient pk, serialized payload)
+        self._by_patient = {}  # patient pk -> set of entry ids
+        self._ordered = None   # cached (sort keys, payloads, waits) in serving order, cleared on every change
+        self._service_times = {}  # priority_rank -> rolling mean service seconds
+        self._day = None       # date the engine was loaded for
+        self._db_version = None  # QueueVersion the engine was loaded at
+        self._recheck_at = 0.0   # monotonic time of the next QueueVersion check
+        self._version = 0
+        self._changes = collections.deque(maxlen=CHANGE_LOG_SIZE)  # (version, event, data)
+        self._floor = 0        # oldest version the change log can resume from
+
+    # ------------------------------------------------------------------ loading
+
+    def _is_current(self):
+        return self._day is not None and self._day == timezone.localdate()
+
+    def needs_reload(self):
+        """True when the next read will have to query the database (to load, or to check QueueVersion)."""
+        return not self._is_current() or time.monotonic() >= self._recheck_at
+
+    def ensure_loaded(self):
+        """
+        Rebuild from the database on first use, when the day has rolled over, or when
+        another process bumped QueueVersion (checked every RECHECK_SECONDS).
+        """
+        if not self.needs_reload():
+            return
+        with self._lock:
+            if not self._is_current():
+                self._load()
+            elif time.monotonic() >= self._recheck_at:
+                if QueueVersion.objects.current() != self._db_version:
+                    self._load()
+                else:
+                    self._recheck_at = time.monotonic() + RECHECK_SECONDS
+
+    def _load(self):
+        today = timezone.localdate()
+        # Read first: a bump made while loading is picked up by the next check
+        self._db_version = QueueVersion.objects.current()
+        entries = QueueEntry.objects.filter(
+            status=QueueEntry.WAITING, entered_at__date=today
+        ).select_related('patient')
+        self._heap = []
+        self._entries = {}
+        self._by_patient = {}
+        self._ordered = None
+        for entry in entries:
+            self._insert(entry.pk, entry.patient_id, entry.priority, entry.entered_at,
+                         QueueEntrySerializer(entry).data)
+        heapq.heapify(self._heap)
+        self._service_times = {
+            stat.tier: stat.mean_seconds for stat in ServiceTimeStat.objects.filter(samples__gt=0)
+        }
+        self._day = today
+        self._recheck_at = time.monotonic() + RECHECK_SECONDS
+        self._reset_changes()
+
+    def reset(self):
+        """Forget everything; the next read reloads from the database."""
+        with self._lock:
+            self._heap = []
+            self._entries = {}
+            self._by_patient = {}
+            self._ordered = None
+            self._day = None
+            self._reset_changes()
+
+    def _reset_changes(self):
+        # Deltas from before a reload cannot be replayed on top of the new state
+        self._version += 1
+        self._changes.clear()
+        self._floor = self._version
+
+    def _record(self, event, data):
+        """Append a delta to the change log. The caller must hold the lock."""
+        self._version += 1
+        self._changes.append((self._version, event, data))
+        if len(self._changes) == self._changes.maxlen:
+            self._floor = self._changes[0][0] - 1
+
+    # ---------------------------------------------------------- heap internals
+
+    def _insert(self, entry_id, patient_id, priority, entered_at, payload):
+        """Add or replace an entry. The caller must hold the lock."""
+        self._drop(entry_id)
+        item = (QueueEntry.rank_for(priority), entered_at, entry_id, next(self._tokens))
+        self._entries[entry_id] = (item, patient_id, payload)
+        self._by_patient.setdefault(patient_id, set()).add(entry_id)
+        heapq.heappush(self._heap, item)
+        self._ordered = None
+        return item
+
+    def _drop(self, entry_id):
+        """Forget an entry; its heap item becomes stale. The caller must hold the lock."""
+        current = self._entries.pop(entry_id, None)
+        if current is None:
+            return None
+        patient_id = current[1]
+        ids = self._by_patient.get(patient_id)
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del self._by_patient[patient_id]
+        self._ordered = None
+        self._compact()
+        return current
+
+    def _is_live(self, item):
+        current = self._entries.get(item[2])
+        return current is not None and current[0][3] == item[3]
+
+    def _compact(self):
+        # Stale items only cost memory; rebuild once they outnumber the live ones
+        if len(self._heap) > 2 * len(self._entries) + 32:
+            self._heap = [current[0] for current in self._entries.values()]
+            heapq.heapify(self._heap)
+
+    # -------------------------------------------------------------- mutations
+
+    def upsert(self, entry):
+        """Mirror a saved QueueEntry. Finished entries and entries from another day are dropped."""
+        if not self._is_current():
+            return  # Not loaded (or stale): the next read rebuilds from the database
+        with self._lock:
+            if entry.status != QueueEntry.WAITING:
+                if self._drop(entry.pk) is not None:
+                    event = 'serve' if entry.status == QueueEntry.SERVED else 'cancel'
+                    self._record(event, {'id': entry.pk, 'queue_number': entry.queue_number})
+                return
+            if timezone.localdate(entry.entered_at) != self._day:
+                if self._drop(entry.pk) is not None:
+                    self._record('remove', {'id': entry.pk})
+                return
+        payload = QueueEntrySerializer(entry).data
+        with self._lock:
+            previous = self._entries.get(entry.pk)
+            self._insert(entry.pk, entry.patient_id, entry.priority, entry.entered_at, payload)
+            if previous is None:
+                event = 'insert'
+            elif previous[0][0] != QueueEntry.rank_for(entry.priority):
+                event = 'reprioritize'
+            else:
+                event = 'update'
+            self._record(event, payload)
+
+    def discard(self, entry_id):
+        """Mirror a deleted QueueEntry."""
+        if not self._is_current():
+            return
+        with self._lock:
+            if self._drop(entry_id) is not None:
+                self._record('remove', {'id': entry_id})
+
+    def set_priority(self, entry_id, priority, rule_version=None):
+        """Mirror a priority change without re-serializing the entry."""
+        if not self._is_current():
+            return
+        with self._lock:
+            current = self._entries.get(entry_id)
+            if current is None:
+                return
+            item, patient_id, payload = current
+            payload = {**payload, 'priority': priority, 'rule_version': rule_version}
+            self._insert(entry_id, patient_id, priority, item[1], payload)
+            self._record('reprioritize', payload)
+
+    def refresh_patient(self, patient):
+        """Re-serialize the nested patient on every entry that belongs to them."""
+        if not self._is_current():
+            return
+        with self._lock:
+            entry_ids = list(self._by_patient.get(patient.pk, ()))
+            if not entry_ids:
+                return
+            patient_data = QueueEntrySerializer().fields['patient'].to_representation(patient)
+            for entry_id in entry_ids:
+                item, patient_id, payload = self._entries[entry_id]
+                payload = {**payload, 'patient': patient_data}
+                self._entries[entry_id] = (item, patient_id, payload)
+                self._record('update', payload)
+            self._ordered = None
+
+    def rescore_patient(self, patient, priority, rule_version=None):
+        """Mirror an UPDATE that re-scored the patient's waiting entry (and bumped last_visit)."""
+        if not self._is_current():
+            return
+        with self._lock:
+            entry_ids = list(self._by_patient.get(patient.pk, ()))
+            if not entry_ids:
+                return
+            patient_data = QueueEntrySerializer().fields['patient'].to_representation(patient)
+            for entry_id in entry_ids:
+                item, patient_id, payload = self._entries[entry_id]
+                payload = {**payload, 'patient': patient_data, 'priority': priority, 'rule_version': rule_version}
+                self._insert(entry_id, patient_id, priority, item[1], payload)
+                self._record('reprioritize' if item[0] != QueueEntry.rank_for(priority) else 'update', payload)
+
+    def set_service_time(self, tier, mean_seconds):
+        """Mirror an updated ServiceTimeStat; shifts every estimate behind that tier."""
+        if not self._is_current():
+            return
+        with self._lock:
+            self._service_times[tier] = mean_seconds
+            self._ordered = None
+
+    # ------------------------------------------------------- write-through API
+
+    def enqueue(self, patient, priority=None):
+        """Create a QueueEntry for the patient; the engine picks it up on commit."""
+        entry = QueueEntry(patient=patient, priority=priority)
+        entry.save()
+        return entry
+
+    def reprioritize(self, entry_id, priority):
+        """Change an entry's tier by hand, in the database and in the heap."""
+        QueueEntry.objects.filter(pk=entry_id).update(
+            priority=priority, priority_rank=QueueEntry.rank_for(priority), rule_version=None
+        )
+        transaction.on_commit(lambda: self.set_priority(entry_id, priority))
+
+    def remove(self, entry_id):
+        """Delete an entry; the post_delete handler drops it from the heap on commit."""
+        QueueEntry.objects.filter(pk=entry_id).delete()
+
+    # ------------------------------------------------------------------- reads
+
+    def peek(self):
+        """Serialized entry that would be served next, or None."""
+        self.ensure_loaded()
+        with self._lock:
+            while self._heap and not self._is_live(self._heap[0]):
+                heapq.heappop(self._heap)
+            if not self._heap:
+                return None
+            return self._entries[self._heap[0][2]][2]
+
+    def _sorted(self):
+        """(keys, payloads, waits) in serving order. The caller must hold the lock."""
+        if self._ordered is None:
+            items = sorted(current[0] for current in self._entries.values())
+            # Expected wait = service times of everyone ahead (prefix sum, once per change)
+            waits, total = [], 0.0
+            for item in items:
+                waits.append(total)
+                total += self._service_times.get(item[0], DEFAULT_SERVICE_SECONDS)
+            self._ordered = (
+                [item[:3] for item in items],  # (rank, entered_at, entry_id)
+                [self._entries[item[2]][2] for item in items],
+                waits,
+            )
+        return self._ordered
+
+    @staticmethod
+    def _with_eta(payloads, waits):
+        now = timezone.now()
+        return [
+            {
+                **payload,
+                'estimated_wait_seconds': round(wait),
+                'estimated_call_time': (now + timedelta(seconds=wait)).isoformat(),
+            }
+            for payload, wait in zip(payloads, waits)
+        ]
+
+    def snapshot(self):
+        """Serialized entries in serving order (cached until the next change)."""
+        self.ensure_loaded()
+        with self._lock:
+            _, payloads, waits = self._sorted()
+        return self._with_eta(payloads, waits)
+
+    def page(self, after=None, limit=20):
+        """
+        Keyset page of the queue: up to `limit` entries after the (rank, entered_at, id)
+        key `after`. Returns (payloads, key of the last one or None if there are no more).
+        """
+        self.ensure_loaded()
+        with self._lock:
+            keys, payloads, waits = self._sorted()
+            start = bisect.bisect_right(keys, tuple(after)) if after else 0
+            end = start + limit
+            last_key = keys[end - 1] if end < len(keys) else None
+        return self._with_eta(payloads[start:end], waits[start:end]), last_key
+
+    def snapshot_with_version(self):
+        """(version, snapshot) read atomically, for seeding a stream."""
+        self.ensure_loaded()
+        with self._lock:
+            return self._version, self.snapshot()
+
+    def changes_since(self, version):
+        """(current version, deltas after `version`), or deltas=None if the log no longer reaches back that far."""
+        self.ensure_loaded()
+        with self._lock:
+            if version < self._floor or version > self._version:
+                return self._version, None
+            if version == self._version:
+                return version, []
+            # Versions are consecutive within the log, so we can slice instead of scanning
+            start = len(self._changes) - (self._version - version)
+            return self._version, list(itertools.islice(self._changes, start, None))
+
+    def __len__(self):
+        self.ensure_loaded()
+        return len(self._entries)
+
+
+_engine = QueueEngine()
+
+
+def get_queue_engine():
+    """Process-wide engine shared by the views and signal handlers."""
+    return _engine
@@ -0,0 +1,142 @@
+"""
+Server-side reduction of raw multi-sample readings.
+
+The vitals pages take many raw samples per measurement (a pulse oximeter settling, a
+thermometer warming up, a patient shifting on the scale). Stations can send them all
+instead of a device-side average:
+
+    {"patient_id": "P001", "samples": {"temperature": [35.1, 35.9, 36.4, 36.6, 36.6, ...],
+                                       "heart_rate": [71, 73, 140, 72, ...]}}
+
+and each series is reduced here to one robust value, with vectorized NumPy steps:
+
+1. Median filter (window `median_window`) to knock out single-sample spikes.
+2. Settling detection: the first window of `settle_window` filtered samples whose
+   range is within `settle_tolerance`; everything before it is warm-up.
+3. Outlier rejection on the settled raw samples: points more than `MAD_CUTOFF`
+   scaled median absolute deviations (but at least the settle tolerance) from the
+   median are dropped, and the estimate is the mean of the rest.
+
+The quality indicators (sample counts, whether and where the signal settled, spread of
+the samples used) are stored with the reading in VitalSigns.sample_quality.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+SampleProfile = namedtuple('SampleProfile', 'median_window settle_window settle_tolerance decimals')
+
+# Per vital: tolerances are in the field's unit (bpm, %, °C, kg, m)
+SAMPLE_PROFILES = {
+    'heart_rate': SampleProfile(5, 10, 3.0, 0),
+    'oxygen_saturation': SampleProfile(5, 10, 1.0, 1),
+    'temperature': SampleProfile(5, 10, 0.1, 2),
+    'weight': SampleProfile(5, 10, 0.2, 1),
+    'height': SampleProfile(5, 10, 0.005, 3),
+}
+MAX_SAMPLES = 10_000  # Per vital per reading
+MAD_CUTOFF = 3.5
+MAD_SCALE = 1.4826  # Makes the MAD comparable to a standard deviation for normal noise
+
+
+def median_filter(values, window):
+    """Running median with edge padding, same length as `values`."""
+    if window < 2 or len(values) < window:
+        return values
+    half, n = window // 2, len(values)
+    padded = np.concatenate((np.full(half, values[0]), values, np.full(window - 1 - half, values[-1])))
+    # Odd-even transposition sort across the `window` shifted copies: whole-array
+    # min/max ops, much faster than sorting each small window on its own
+    rows = [padded[i:i + n] for i in range(window)]
+    for step in range(window):
+        for i in range(step % 2, window - 1, 2):
+            rows[i], rows[i + 1] = np.minimum(rows[i], rows[i + 1]), np.maximum(rows[i], rows[i + 1])
+    return rows[half]
+
+
+def rolling_range(values, window):
+    """max - min of every `window` consecutive values (len(values) - window + 1 of them)."""
+    n = len(values) - window + 1
+    high, low = values[:n].copy(), values[:n].copy()
+    for i in range(1, window):
+        np.maximum(high, values[i:i + n], out=high)
+        np.minimum(low, values[i:i + n], out=low)
+    return high - low
+
+
+def settling_index(filtered, window, tolerance):
+    """Index where the signal first stays within `tolerance` for `window` samples, or None."""
+    stable = rolling_range(filtered, min(window, len(filtered))) <= tolerance
+    return int(stable.argmax()) if stable.any() else None
+
+
+def _median(values):
+    # np.partition alone; np.median adds noticeable overhead for small arrays
+    k = len(values) // 2
+    if len(values) % 2:
+        return np.partition(values, k)[k]
+    part = np.partition(values, (k - 1, k))
+    return (part[k - 1] + part[k]) / 2
+
+
+def reduce_samples(samples, profile):
+    """Reduce one raw series to (estimate, quality dict); raises ValueError on bad input."""
+    try:
+        values = np.asarray(samples, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise ValueError("must be a list of numbers")
+    if values.ndim != 1 or not len(values):
+        raise ValueError("must be a non-empty list of numbers")
+    if len(values) > MAX_SAMPLES:
+        raise ValueError(f"at most {MAX_SAMPLES} samples")
+    finite = np.isfinite(values)
+    invalid = int(len(values) - finite.sum())
+    if invalid:
+        values = values[finite]
+        if not len(values):
+            raise ValueError("has no finite samples")
+
+    filtered = median_filter(values, profile.median_window)
+    settled_at = settling_index(filtered, profile.settle_window, profile.settle_tolerance)
+    # Never settled: fall back to the last window, the closest thing to a final value
+    tail = values[settled_at:] if settled_at is not None else values[-profile.settle_window:]
+
+    median = _median(tail)
+    deviation = np.abs(tail - median)
+    mad = float(_median(deviation)) * MAD_SCALE
+    inliers = tail[deviation <= max(MAD_CUTOFF * mad, profile.settle_tolerance)]
+
+    estimate = round(float(inliers.mean()), profile.decimals)
+    quality = {
+        'samples': len(values) + invalid,
+        'invalid': invalid,
+        'used': len(inliers),
+        'rejected': len(tail) - len(inliers),
+        'settled': settled_at is not None,
+        'settled_at': settled_at,  # Index of the first settled sample (after dropping invalid ones)
+        'spread': round(float(inliers.std()), profile.decimals + 2),
+        'mad': round(mad, profile.decimals + 2),
+    }
+    return estimate, quality
+
+
+def reduce_reading_samples(samples):
+    """
+    Reduce a reading's {"vital": [raw samples]} map.
+    Returns ({vital: estimate}, {vital: quality}); raises ValueError naming the bad vital.
+    """
+    if not isinstance(samples, dict):
+        raise ValueError("samples must be an object of {vital: [values]}")
+    estimates, quality = {}, {}
+    for field, series in samples.items():
+        profile = SAMPLE_PROFILES.get(field)
+        if profile is None:
+            raise ValueError(f"samples.{field} is not a vital that accepts raw samples")
+        if not isinstance(series, list):
+            raise ValueError(f"samples.{field} must be a list of numbers")
+        try:
+            estimates[field], quality[field] = reduce_samples(series, profile)
+        except ValueError as e:
+            raise ValueError(f"samples.{field} {e}")
+    return estimates, quality
@@ -0,0 +1,229 @@
+"""
+Per-patient vitals rollups for trend charts.
+
+VitalsRollup holds count/min/max/sum of each vital per patient per day, week (starting
+Monday) and month, in local dates. Ingestion adds every new reading to its three
+buckets inside the same transaction:
+
+- missing buckets are created empty first (INSERT, conflicts ignored), so concurrent
+  writers never race on creating one;
+- a single reading is then added with one UPDATE of all three buckets
+  (count + 1, sum + value, LEAST/GREATEST for min/max);
+- a batch locks its buckets, merges the readings in Python and writes them back with
+  one bulk_update.
+
+Min and max can't be taken back, so edited or deleted readings rebuild their buckets
+from the raw table (`rebuild_buckets`); `manage.py rebuild_rollups` does the same for
+everything. `trends` reads only VitalsRollup.
+"""
+
+import calendar
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, DateField, F, Max, Min, Q, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, Least, TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import VitalSigns, VitalsRollup
+
+PERIODS = (VitalsRollup.DAY, VitalsRollup.WEEK, VitalsRollup.MONTH)
+STAT_COLUMNS = [
+    f'{field}_{stat}' for field in VitalsRollup.FIELDS for stat in ('count', 'min', 'max', 'sum')
+]
+
+
+def period_start(period, day):
+    """First local date of the `period` bucket containing `day`."""
+    if period == VitalsRollup.DAY:
+        return day
+    if period == VitalsRollup.WEEK:
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def period_end(period, start):
+    """First local date after the bucket starting on `start`."""
+    if period == VitalsRollup.DAY:
+        return start + timedelta(days=1)
+    if period == VitalsRollup.WEEK:
+        return start + timedelta(days=7)
+    return start + timedelta(days=calendar.monthrange(start.year, start.month)[1])
+
+
+def bucket_keys(vital_signs):
+    """[(period, period_start)] of the three buckets a reading belongs to."""
+    day = timezone.localdate(vital_signs.date_time_recorded)
+    return [(period, period_start(period, day)) for period in PERIODS]
+
+
+def _values(vital_signs):
+    return {
+        field: float(value)
+        for field in VitalsRollup.FIELDS
+        if (value := getattr(vital_signs, field)) is not None
+    }
+
+
+def _create_missing(keys):
+    """Create the (patient pk, period, period_start) buckets that don't exist yet, empty."""
+    VitalsRollup.objects.bulk_create(
+        [VitalsRollup(patient_id=patient_id, period=period, period_start=start) for patient_id, period, start in keys],
+        ignore_conflicts=True,
+    )
+
+
+def add_reading(vital_signs):
+    """Add one saved reading to its day/week/month buckets (2 queries). Run inside its transaction."""
+    keys = bucket_keys(vital_signs)
+    _create_missing([(vital_signs.patient_id, period, start) for period, start in keys])
+    updates = {'readings': F('readings') + 1}
+    for field, value in _values(vital_signs).items():
+        value = Value(value)
+        updates[f'{field}_count'] = F(f'{field}_count') + 1
+        updates[f'{field}_sum'] = Coalesce(F(f'{field}_sum'), Value(0.0)) + value
+        updates[f'{field}_min'] = Least(Coalesce(F(f'{field}_min'), value), value)
+        updates[f'{field}_max'] = Greatest(Coalesce(F(f'{field}_max'), value), value)
+    buckets = Q()
+    for period, start in keys:
+        buckets |= Q(period=period, period_start=start)
+    VitalsRollup.objects.filter(buckets, patient_id=vital_signs.patient_id).update(**updates)
+
+
+def add_readings(readings):
+    """Add many readings (any patients) to their buckets (3 queries). Run inside their transaction."""
+    if len(readings) == 1:
+        return add_reading(readings[0])
+    merged = {}  # (patient pk, period, period_start) -> [readings, {field: [count, min, max, sum]}]
+    for vital_signs in readings:
+        values = _values(vital_signs)
+        for period, start in bucket_keys(vital_signs):
+            bucket = merged.setdefault((vital_signs.patient_id, period, start), [0, {}])
+            bucket[0] += 1
+            for field, value in values.items():
+                stats = bucket[1].get(field)
+                if stats is None:
+                    bucket[1][field] = [1, value, value, value]
+                else:
+                    stats[0] += 1
+                    stats[1] = min(stats[1], value)
+                    stats[2] = max(stats[2], value)
+                    stats[3] += value
+    if not merged:
+        return
+
+    _create_missing(merged)
+    rows = VitalsRollup.objects.select_for_update().filter(
+        patient_id__in={key[0] for key in merged}, period_start__in={key[2] for key in merged}
+    )
+    changed = []
+    for row in rows:
+        bucket = merged.get((row.patient_id, row.period, row.period_start))
+        if bucket is None:
+            continue  # Another patient's bucket that happens to start on one of our dates
+        row.readings += bucket[0]
+        for field, (count, low, high, total) in bucket[1].items():
+            current_low, current_high = getattr(row, f'{field}_min'), getattr(row, f'{field}_max')
+            setattr(row, f'{field}_count', getattr(row, f'{field}_count') + count)
+            setattr(row, f'{field}_min', low if current_low is None else min(current_low, low))
+            setattr(row, f'{field}_max', high if current_high is None else max(current_high, high))
+            setattr(row, f'{field}_sum', (getattr(row, f'{field}_sum') or 0.0) + total)
+        changed.append(row)
+    VitalsRollup.objects.bulk_update(changed, ['readings', *STAT_COLUMNS])
+
+
+# ------------------------------------------------------------------------ rebuilding
+
+TRUNCATE = {
+    VitalsRollup.DAY: lambda: TruncDate('date_time_recorded', tzinfo=timezone.get_current_timezone()),
+    VitalsRollup.WEEK: lambda: TruncWeek('date_time_recorded', output_field=DateField(), tzinfo=timezone.get_current_timezone()),
+    VitalsRollup.MONTH: lambda: TruncMonth('date_time_recorded', output_field=DateField(), tzinfo=timezone.get_current_timezone()),
+}
+
+
+def _local_midnight(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def rebuild_period(period, patient_ids=None, start=None, end=None):
+    """
+    Recompute `period` buckets from the raw readings, for the given patients (default:
+    everyone) and buckets starting in [start, end) (default: all). Returns rows written.
+    """
+    readings = VitalSigns.objects.all()
+    rollups = VitalsRollup.objects.filter(period=period)
+    if patient_ids is not None:
+        readings = readings.filter(patient_id__in=patient_ids)
+        rollups = rollups.filter(patient_id__in=patient_ids)
+    if start is not None:
+        readings = readings.filter(date_time_recorded__gte=_local_midnight(start))
+        rollups = rollups.filter(period_start__gte=start)
+    if end is not None:
+        readings = readings.filter(date_time_recorded__lt=_local_midnight(end))
+        rollups = rollups.filter(period_start__lt=end)
+
+    aggregates = {'readings': Count('id')}
+    for field in VitalsRollup.FIELDS:
+        aggregates.update({
+            f'{field}_count': Count(field), f'{field}_min': Min(field),
+            f'{field}_max': Max(field), f'{field}_sum': Sum(field),
+        })
+    rows = (
+        readings.annotate(period_start=TRUNCATE[period]())
+        .values('patient_id', 'period_start')
+        .annotate(**aggregates)
+        .order_by()
+    )
+    rollups.delete()
+    created = VitalsRollup.objects.bulk_create(
+        [VitalsRollup(period=period, **row) for row in rows], batch_size=1000
+    )
+    return len(created)
+
+
+def rebuild_buckets(patient_id, day):
+    """Recompute the three buckets containing local date `day` (after an edit or delete)."""
+    with transaction.atomic():
+        for period in PERIODS:
+            start = period_start(period, day)
+            rebuild_period(period, [patient_id], start, period_end(period, start))
+
+
+# ---------------------------------------------------------------------------- reads
+
+def pick_period(date_from, date_to):
+    """Bucket size for a chart over [date_from, date_to]: at most ~a month of points."""
+    days = (date_to - date_from).days + 1
+    if days <= 31:
+        return VitalsRollup.DAY
+    if days <= 26 * 7:
+        return VitalsRollup.WEEK
+    return VitalsRollup.MONTH
+
+
+def trends(patient, period, date_from, date_to, fields=VitalsRollup.FIELDS):
+    """
+    The patient's `period` buckets overlapping [date_from, date_to], oldest first:
+    [{"period_start": date, "readings": n, "<vital>": {"count", "min", "max", "mean"} or None}].
+    """
+    rows = patient.vitals_rollups.filter(
+        period=period, period_start__gte=period_start(period, date_from), period_start__lte=date_to
+    ).order_by('period_start').values(
+        'period_start', 'readings', *(f'{field}_{stat}' for field in fields for stat in ('count', 'min', 'max', 'sum'))
+    )
+    return [
+        {
+            'period_start': row['period_start'],
+            'readings': row['readings'],
+            **{
+                field: {
+                    'count': row[f'{field}_count'],
+                    'min': row[f'{field}_min'],
+                    'max': row[f'{field}_max'],
+                    'mean': round(row[f'{field}_sum'] / row[f'{field}_count'], 2),
+                } if row[f'{field}_count'] else None
+                for field in fields
+            },
+        }
+        for row in rows
+    ]
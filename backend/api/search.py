@@ -0,0 +1,163 @@
+"""
+Ranked patient search over a trigram index (the front desk's ?search= box).
+
+`icontains` on four columns is a full scan with four LIKE '%x%' per keystroke. Instead,
+PatientSearchTrigram holds every trigram of every word in the searchable fields, tagged
+with the field's weight, and a search is one indexed lookup:
+
+- the query is split into words (lowercased, accents stripped, so "Peña" finds "pena");
+- words of 3+ characters match anywhere inside a word (their inner trigrams), shorter
+  ones match the start of a word (trigrams padded with leading spaces: "jo" -> "  j", " jo");
+- the index range of the rarest query trigram (counts are cached per process) is read
+  best weight first, then newest patient first - a hit in the name counts more than one
+  in the address - and each hit is probed for the other trigrams (the other words'
+  rarest first, they rule out the most), stopping at CANDIDATES hits; so a search costs
+  about the same however common its words are;
+- the candidates' fields come with the hits and are checked (every query word must
+  really occur in a field, trigrams alone can't guarantee it), then words that match a
+  whole word or its start move up; ties go to the newest patient.
+
+Ranking is exact among the candidates, and the walk's order is also the tie-break, so
+the cut only matters when more than CANDIDATES hits match: an older patient past it is
+missed only if a whole-word or word-start bonus would have ranked them above the kept
+ones (e.g. one "Cruz" among hundreds of newer "Cruzado"s). Typing more narrows it.
+
+`manage.py benchmark_search` times it against the old icontains scan.
+
+The index is kept current by a post_save handler (signals.py); `manage.py
+rebuild_search_index` rebuilds it after bulk imports, which skip signals.
+"""
+
+import time
+
+from django.db.models import Count, Exists, OuterRef, Q
+
+from .models import PatientSearchTrigram
+from .utils import words
+
+# Searchable Patient fields and how much a match in each counts
+SEARCH_FIELDS = {
+    'patient_id': 4,
+    'last_name': 3,
+    'first_name': 3,
+    'address': 1,
+}
+SEARCH_RESULTS = 50  # Ranked matches returned for ?search=
+CANDIDATES = 200  # Index hits loaded and checked to find them
+TRIGRAM_COUNT_TTL = 600  # Seconds
+
+_trigram_counts = {}  # trigram -> (index rows, expires at), see trigram_counts
+
+
+def word_trigrams(word):
+    """Trigrams stored for a word: word-start ones (padded) plus every inner one."""
+    padded = '  ' + word
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def query_trigrams(word):
+    """Trigrams a query word needs: inner ones (match anywhere) or, if shorter than 3, word-start ones."""
+    if len(word) >= 3:
+        return {word[i:i + 3] for i in range(len(word) - 2)}
+    padded = '  ' + word
+    return {padded[i:i + 3] for i in range(len(word))}
+
+
+def patient_trigrams(values):
+    """{(trigram, weight)} for a {field: value} dict of the SEARCH_FIELDS."""
+    return {
+        (gram, weight)
+        for field, weight in SEARCH_FIELDS.items()
+        for word in words(values.get(field))
+        for gram in word_trigrams(word)
+    }
+
+
+def index_patient(patient):
+    """Replace the patient's rows in the search index."""
+    PatientSearchTrigram.objects.filter(patient=patient).delete()
+    PatientSearchTrigram.objects.bulk_create([
+        PatientSearchTrigram(patient=patient, trigram=gram, weight=weight)
+        for gram, weight in patient_trigrams({field: getattr(patient, field) for field in SEARCH_FIELDS})
+    ])
+
+
+def _matches(values, query_words):
+    """Ranking bonus if every query word occurs in one of the patient's fields (a values tuple), else None."""
+    # ' word word ': whole words and word starts are then plain substring tests
+    fields = [(weight, f" {' '.join(words(value))} ") for weight, value in zip(SEARCH_FIELDS.values(), values)]
+    bonus = 0
+    for word in query_words:
+        best = None
+        for weight, text in fields:
+            if f' {word} ' in text:
+                score = 2 * weight
+            elif f' {word}' in text:
+                score = weight
+            elif len(word) >= 3 and word in text:
+                score = 0
+            else:
+                continue
+            best = score if best is None else max(best, score)
+        if best is None:
+            return None
+        bonus += best
+    return bonus
+
+
+def trigram_counts(grams):
+    """
+    Approximate number of index rows per trigram, cached for TRIGRAM_COUNT_TTL. Only used to
+    pick which trigram to look up, so a stale count costs speed, never results.
+    """
+    now = time.monotonic()
+    missing = [gram for gram in grams if _trigram_counts.get(gram, (0, 0))[1] < now]
+    if missing:
+        counts = dict(
+            PatientSearchTrigram.objects.filter(trigram__in=missing)
+            .values('trigram').annotate(rows=Count('id')).values_list('trigram', 'rows')
+        )
+        if len(_trigram_counts) > 100_000:
+            _trigram_counts.clear()
+        for gram in missing:
+            _trigram_counts[gram] = (counts.get(gram, 0), now + TRIGRAM_COUNT_TTL)
+    return {gram: _trigram_counts[gram][0] for gram in grams}
+
+
+def search_patient_ids(query, limit=SEARCH_RESULTS):
+    """Pks of the best-matching patients for `query`, best first (None if the query has no words)."""
+    query_words = words(query)
+    if not query_words:
+        return None
+    # Walk the rarest trigram's index range best weight first, probing each hit for the
+    # other trigrams, until there are enough candidates
+    word_grams = [query_trigrams(word) for word in query_words]
+    grams = set().union(*word_grams)
+    counts = trigram_counts(grams)
+    driver = min(grams, key=lambda gram: (counts[gram], gram))
+    # Probes are checked in order and the first miss ends a hit's: the driver's own word
+    # mostly matches along with it, so the other words' rarest trigrams go first
+    driver_word = set().union(*(word for word in word_grams if driver in word))
+    probes = sorted(grams - {driver}, key=lambda gram: (gram in driver_word, counts[gram], gram))
+    hits = PatientSearchTrigram.objects.filter(
+        Q(trigram=driver),
+        *(Exists(PatientSearchTrigram.objects.filter(trigram=gram, patient_id=OuterRef('patient_id'))) for gram in probes),
+    )
+    # The fields come along through the patient FK: tuples, not model instances, and no
+    # second query
+    rows = hits.order_by('-weight', '-patient_id').values_list(
+        'patient_id', 'weight', *(f'patient__{field}' for field in SEARCH_FIELDS)
+    )[:CANDIDATES]
+    seen = set()
+    ranked = []
+    for patient_id, weight, *values in rows:
+        if patient_id in seen:
+            continue  # Best weight comes first
+        seen.add(patient_id)
+        bonus = _matches(values, query_words)
+        if bonus is not None:
+            # Ties go to the newest patient, the index order, so the ranking among them
+            # doesn't depend on where CANDIDATES cut the walk
+            ranked.append((-(weight + bonus), -patient_id))
+    ranked.sort()
+    return [-negated_id for _, negated_id in ranked[:limit]]
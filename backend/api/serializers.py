@@ -1,14 +1,16 @@
-from .models import Patient, QueueEntry, VitalSigns
+from .models import MeasurementSession, Patient, QueueEntry, QueueEntryArchive, TriageRule, TriageRuleSet, VitalSigns
+from .fieldsets import SparseFieldsMixin
 from rest_framework import serializers
 import re 
 from datetime import date
 
-class PatientSerializer(serializers.ModelSerializer):
+class PatientSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     age = serializers.IntegerField(read_only=True)
     class Meta:
         model = Patient
         fields = '__all__'
-        read_only_fields = ('patient_id',)  # Make patient_id read-only
+        read_only_fields = ('patient_id', 'latest_vitals', 'triage_snapshot')  # Kept up to date by ingestion
+        field_columns = {'age': ('birthdate',)}  # ?fields=age still has to read the birthdate (fieldsets.py)
     
     def validate_contact(self, value):
         if not re.match(r'^\d{11}$', value):
@@ -25,17 +27,63 @@ class PatientSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("PIN must be exactly 4 digits.")
         return value
     
-class VitalSignsSerializer(serializers.ModelSerializer): 
+class VitalSignsSerializer(SparseFieldsMixin, serializers.ModelSerializer): 
     class Meta:
         model = VitalSigns
         fields = '__all__'
+        read_only_fields = ('device_seq',)  # Numbered by the device sync protocol (ingest.sync_device)
 
-class QueueEntrySerializer(serializers.ModelSerializer):
+class QueueEntrySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     patient = PatientSerializer(read_only=True)
     class Meta:
         model = QueueEntry
-        fields = ['id', 'patient', 'priority', 'entered_at', 'queue_number']
-  
-        
-    
-    
\ No newline at end of file
+        fields = ['id', 'patient', 'priority', 'entered_at', 'queue_number', 'status', 'finished_at', 'rule_version']
+        read_only_fields = ('status', 'finished_at', 'rule_version')  # Changed through the serve/cancel actions and triage
+
+    def update(self, instance, validated_data):
+        if 'priority' in validated_data and validated_data['priority'] != instance.priority:
+            validated_data['rule_version'] = None  # Set by staff, not by a rule set
+        return super().update(instance, validated_data)
+
+class QueueEntryArchiveSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    patient = PatientSerializer(read_only=True)
+    class Meta:
+        model = QueueEntryArchive
+        fields = ['id', 'original_id', 'patient', 'priority', 'entered_at', 'queue_number', 'status', 'finished_at', 'rule_version', 'archived_at']
+
+class MeasurementSessionSerializer(serializers.ModelSerializer):
+    # RPi stations identify patients by patient_id, same as receive-vitals
+    patient_id = serializers.SlugRelatedField(source='patient', slug_field='patient_id', queryset=Patient.objects.all())
+    class Meta:
+        model = MeasurementSession
+        fields = ['id', 'patient_id', 'vital_signs', 'device_id', 'signal', 'sample_rate', 'dtype', 'started_at', 'sample_count', 'closed_at']
+        read_only_fields = ('sample_count', 'closed_at')  # Changed through the samples/close actions
+
+    def validate_sample_rate(self, value):
+        if not value > 0:
+            raise serializers.ValidationError("sample_rate must be positive.")
+        return value
+
+class TriageRuleSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TriageRule
+        fields = ['group', 'field', 'operator', 'threshold', 'weight']
+
+class TriageRuleSetSerializer(serializers.ModelSerializer):
+    rules = TriageRuleSerializer(many=True)
+    class Meta:
+        model = TriageRuleSet
+        fields = ['version', 'note', 'critical_min', 'high_min', 'medium_min', 'created_at', 'rules']
+        read_only_fields = ('version', 'created_at')  # Assigned when the version is created
+
+    def validate(self, attrs):
+        if not attrs['rules']:
+            raise serializers.ValidationError("A rule set needs at least one rule.")
+        if not attrs.get('critical_min', 6) >= attrs.get('high_min', 3) >= attrs.get('medium_min', 1) >= 1:
+            raise serializers.ValidationError("Tier scores must satisfy critical_min >= high_min >= medium_min >= 1.")
+        return attrs
+
+    def create(self, validated_data):
+        rules = validated_data.pop('rules')
+        tiers = {tier: validated_data[f'{tier.lower()}_min'] for tier in ('CRITICAL', 'HIGH', 'MEDIUM') if f'{tier.lower()}_min' in validated_data}
+        return TriageRuleSet.objects.create_version(rules, tiers, validated_data.get('note', ''))
@@ -0,0 +1,51 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Patient, QueueEntry, ServiceTimeStat, TriageRuleSet
+from .queue_engine import get_queue_engine
+from .search import SEARCH_FIELDS, index_patient
+from .typeahead import PROJECTION, get_prefix_index
+
+
+# Keep the in-memory queue in step with the database. Handlers run on commit so a
+# rolled-back write never shows up on the waiting-room screens.
+
+@receiver(post_save, sender=QueueEntry)
+def queue_entry_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: get_queue_engine().upsert(instance))
+
+@receiver(post_delete, sender=QueueEntry)
+def queue_entry_deleted(sender, instance, **kwargs):
+    entry_id = instance.pk
+    transaction.on_commit(lambda: get_queue_engine().discard(entry_id))
+
+@receiver(post_save, sender=Patient)
+def patient_saved(sender, instance, created, **kwargs):
+    if not created:
+        transaction.on_commit(lambda: get_queue_engine().refresh_patient(instance))
+
+@receiver(post_save, sender=Patient)
+def patient_search_index(sender, instance, created, update_fields=None, **kwargs):
+    # Same transaction as the write; saves that only touch e.g. last_visit skip it
+    if created or update_fields is None or set(update_fields) & set(SEARCH_FIELDS):
+        index_patient(instance)
+
+@receiver(post_save, sender=Patient)
+def patient_typeahead_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created or update_fields is None or set(update_fields) & set(PROJECTION):
+        transaction.on_commit(lambda: get_prefix_index().upsert(instance))
+
+@receiver(post_delete, sender=Patient)
+def patient_typeahead_deleted(sender, instance, **kwargs):
+    patient_pk = instance.pk
+    transaction.on_commit(lambda: get_prefix_index().discard(patient_pk))
+
+@receiver(post_save, sender=ServiceTimeStat)
+def service_time_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: get_queue_engine().set_service_time(instance.tier, instance.mean_seconds))
+
+@receiver(post_save, sender=TriageRuleSet)
+def triage_rules_saved(sender, instance, **kwargs):
+    # After commit, so the new version's rules are there when it is compiled
+    transaction.on_commit(TriageRuleSet.objects.invalidate)
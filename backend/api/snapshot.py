@@ -0,0 +1,258 @@
+"""
+Columnar analytics snapshot of the vitals, for population statistics without database load.
+
+`manage.py snapshot_vitals` writes one directory per local day of readings, with one
+.npy file per column, plus the patient demographics:
+
+    <ANALYTICS_SNAPSHOT_DIR>/
+        vitals/2025-01-31/{id,patient,recorded_at,heart_rate,...}.npy + _meta.json
+        patients/{id,sex,birthdate}.npy + _meta.json
+
+Missing values are NaN (NaT for dates); `patient` is the Patient pk and `recorded_at`
+is UTC. The job is incremental by partition: one aggregate query returns the row count
+and highest id of every day, and only days whose numbers differ from their _meta.json
+are rewritten (pass `rebuild=True` after editing old readings in place). Partitions are
+written to a temporary directory and swapped in, so readers never see half a day.
+
+`SnapshotReader` opens the columns with np.load(mmap_mode='r'): the OS pages in only
+what a scan touches, and aggregates run as NumPy operations over the mapped arrays.
+"""
+
+import json
+import os
+import shutil
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Patient, VitalSigns
+from .streaming import keyset_chunks
+from .triage import ages
+
+VITAL_COLUMNS = (
+    'heart_rate', 'temperature', 'oxygen_saturation', 'blood_pressure_systolic',
+    'blood_pressure_diastolic', 'height', 'weight', 'BMI',
+)
+SEX_CODES = {'Male': 0, 'Female': 1}  # patients/sex.npy; -1 if unknown
+META_FILE = '_meta.json'
+SNAPSHOT_CHUNK_SIZE = 5000
+
+
+def snapshot_dir():
+    return Path(getattr(settings, 'ANALYTICS_SNAPSHOT_DIR', Path(settings.BASE_DIR) / 'analytics'))
+
+
+def _utc64(values):
+    """Aware datetimes -> datetime64[us] in UTC (None -> NaT)."""
+    return np.array(
+        [value.astimezone(dt_timezone.utc).replace(tzinfo=None) if value else None for value in values],
+        dtype='datetime64[us]',
+    )
+
+
+def _write_partition(path, columns, meta):
+    """Write {name: array} + meta to `path`, replacing any previous version in one rename."""
+    tmp = path.with_name(f'{path.name}.tmp-{os.getpid()}')
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    for name, values in columns.items():
+        np.save(tmp / f'{name}.npy', values)
+    (tmp / META_FILE).write_text(json.dumps(meta))
+    old = path.with_name(f'{path.name}.old-{os.getpid()}')
+    if path.exists():
+        path.rename(old)  # Open memory maps keep reading the old files
+    tmp.rename(path)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def _read_meta(path):
+    try:
+        return json.loads((path / META_FILE).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _local_day_range(day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+
+
+def _int64(values):
+    return np.array(values, dtype=np.int64)
+
+
+def _float64(values):
+    return np.array(values, dtype=np.float64)  # None -> NaN
+
+
+def _sex_codes(values):
+    return np.array([SEX_CODES.get(sex, -1) for sex in values], dtype=np.int8)
+
+
+def _days(values):
+    return np.array(values, dtype='datetime64[D]')
+
+
+def _read_columns(queryset, columns):
+    """
+    {name: array} for `columns` [(name, ORM path, convert)], the first being the id, read
+    by id in keyset chunks of SNAPSHOT_CHUNK_SIZE rows and converted a chunk at a time, so
+    only one chunk of row tuples is held.
+    """
+    rows = queryset.values_list(*(path for _, path, _ in columns))
+    parts = [[] for _ in columns]
+    for chunk in keyset_chunks(rows, (columns[0][1],), SNAPSHOT_CHUNK_SIZE, key=lambda row: row[:1]):
+        for part, (_, _, convert), values in zip(parts, columns, zip(*chunk)):
+            part.append(convert(values))
+    return {
+        name: np.concatenate(part) if part else convert(())
+        for part, (name, _, convert) in zip(parts, columns)
+    }
+
+
+def write_vitals_partition(root, day):
+    """Snapshot every reading taken on local date `day`; returns the row count."""
+    start, end = _local_day_range(day)
+    columns = _read_columns(
+        VitalSigns.objects.filter(date_time_recorded__gte=start, date_time_recorded__lt=end),
+        [('id', 'id', _int64), ('patient', 'patient_id', _int64), ('recorded_at', 'date_time_recorded', _utc64),
+         *((name, name, _float64) for name in VITAL_COLUMNS)],
+    )
+    ids = columns['id']
+    meta = {'day': day.isoformat(), 'rows': len(ids), 'max_id': int(ids.max(initial=0)),
+            'written_at': timezone.now().isoformat()}
+    _write_partition(root / 'vitals' / day.isoformat(), columns, meta)
+    return len(ids)
+
+
+def write_patients(root):
+    """Snapshot the demographics of every patient (one small full rewrite); returns the row count."""
+    columns = _read_columns(
+        Patient.objects.all(), [('id', 'id', _int64), ('sex', 'sex', _sex_codes), ('birthdate', 'birthdate', _days)]
+    )
+    rows = len(columns['id'])
+    _write_partition(root / 'patients', columns, {'rows': rows, 'written_at': timezone.now().isoformat()})
+    return rows
+
+
+def write_snapshot(root=None, rebuild=False):
+    """
+    Bring the snapshot up to date. Returns {"partitions": days rewritten, "rows": readings
+    written, "removed": partitions dropped, "patients": n}.
+    """
+    root = Path(root or snapshot_dir())
+    (root / 'vitals').mkdir(parents=True, exist_ok=True)
+    days = {
+        row['day']: row
+        for row in VitalSigns.objects.annotate(day=TruncDate('date_time_recorded', tzinfo=timezone.get_current_timezone()))
+        .values('day').annotate(rows=Count('id'), max_id=Max('id')).order_by()
+    }
+
+    written = rows = 0
+    for day, stats in sorted(days.items()):
+        meta = _read_meta(root / 'vitals' / day.isoformat())
+        if rebuild or meta is None or (meta['rows'], meta['max_id']) != (stats['rows'], stats['max_id']):
+            rows += write_vitals_partition(root, day)
+            written += 1
+
+    # Days whose readings were all deleted
+    removed = 0
+    for path in (root / 'vitals').iterdir():
+        if '.' not in path.name and path.name not in {day.isoformat() for day in days}:
+            shutil.rmtree(path)
+            removed += 1
+
+    return {'partitions': written, 'rows': rows, 'removed': removed, 'patients': write_patients(root)}
+
+
+class SnapshotReader:
+    """
+    Memory-mapped access to a snapshot, e.g. mean heart rate of women over 60 last month:
+
+        snap = SnapshotReader()
+        cols = snap.vitals(['patient', 'heart_rate'], date_from=date(2025, 1, 1), date_to=date(2025, 1, 31))
+        sex = snap.patient_column('sex', cols['patient'])
+        age = snap.ages(cols['patient'], date(2025, 1, 31))
+        np.nanmean(cols['heart_rate'][(sex == 1) & (age >= 60)])
+    """
+
+    def __init__(self, root=None):
+        self.root = Path(root or snapshot_dir())
+        self._patients = None
+
+    def days(self):
+        """Local dates that have a partition, oldest first."""
+        vitals = self.root / 'vitals'
+        if not vitals.exists():
+            return []
+        return sorted(
+            datetime.strptime(path.name, '%Y-%m-%d').date() for path in vitals.iterdir() if '.' not in path.name
+        )
+
+    def partitions(self, columns=None, date_from=None, date_to=None):
+        """Yield (day, {column: memory-mapped array}) for each partition in range."""
+        names = columns or ('id', 'patient', 'recorded_at', *VITAL_COLUMNS)
+        for day in self.days():
+            if (date_from and day < date_from) or (date_to and day > date_to):
+                continue
+            path = self.root / 'vitals' / day.isoformat()
+            yield day, {name: np.load(path / f'{name}.npy', mmap_mode='r') for name in names}
+
+    def vitals(self, columns=None, date_from=None, date_to=None):
+        """{column: array} over the date range. One partition is mapped, not copied; more are concatenated."""
+        parts = [arrays for _, arrays in self.partitions(columns, date_from, date_to)]
+        names = columns or ('id', 'patient', 'recorded_at', *VITAL_COLUMNS)
+        if len(parts) == 1:
+            return parts[0]
+        return {
+            name: np.concatenate([part[name] for part in parts]) if parts else np.array([], dtype=np.float64)
+            for name in names
+        }
+
+    def summary(self, column, date_from=None, date_to=None):
+        """count/mean/min/max/std of one vital, streamed partition by partition (no concatenation)."""
+        count, total, squares, low, high = 0, 0.0, 0.0, np.inf, -np.inf
+        for _, arrays in self.partitions([column], date_from, date_to):
+            values = arrays[column]
+            values = values[~np.isnan(values)]
+            if not len(values):
+                continue
+            count += len(values)
+            total += float(values.sum())
+            squares += float(np.square(values).sum())
+            low, high = min(low, float(values.min())), max(high, float(values.max()))
+        if not count:
+            return {'count': 0, 'mean': None, 'min': None, 'max': None, 'std': None}
+        mean = total / count
+        return {'count': count, 'mean': mean, 'min': low, 'max': high,
+                'std': max(squares / count - mean * mean, 0.0) ** 0.5}
+
+    # ------------------------------------------------------------------ demographics
+
+    def patients(self):
+        """{'id', 'sex', 'birthdate'} arrays sorted by id (memory-mapped)."""
+        if self._patients is None:
+            path = self.root / 'patients'
+            self._patients = {name: np.load(path / f'{name}.npy', mmap_mode='r') for name in ('id', 'sex', 'birthdate')}
+        return self._patients
+
+    def patient_column(self, name, patient_ids):
+        """`name` ('sex' or 'birthdate') for each Patient pk in `patient_ids` (a vitals 'patient' column)."""
+        patients = self.patients()
+        ids = patients['id']
+        # Patients created after the snapshot was taken come back unknown
+        values = np.full(len(patient_ids), -1 if name == 'sex' else np.datetime64('NaT'), dtype=patients[name].dtype)
+        if len(ids):
+            index = np.minimum(np.searchsorted(ids, patient_ids), len(ids) - 1)
+            found = ids[index] == patient_ids
+            values[found] = patients[name][index[found]]
+        return values
+
+    def ages(self, patient_ids, on):
+        """Age in whole years on date `on` for each Patient pk (NaN if unknown)."""
+        return ages(self.patient_column('birthdate', patient_ids), on)
@@ -0,0 +1,95 @@
+"""
+Streamed responses for large result sets.
+
+A plain DRF list response materialises every row and the whole serialized body before
+sending anything. `stream_json` instead walks the queryset in keyset chunks (each one
+an index range query starting after the last row of the previous chunk, see
+`keyset_chunks`), serializes one chunk at a time and yields it, so the server holds at
+most one chunk no matter how many rows match. The body is the same JSON array the
+unstreamed endpoint returns. export.py, snapshot.py and dedup.py read the same way.
+
+Not `.iterator(chunk_size=...)`: mysqlclient has no server-side cursors, so the driver
+would still read the whole result into memory before the first chunk.
+
+Under ASGI Django would buffer a synchronous iterator completely before sending it, so
+`streaming_response` hands it over as an async iterator that fetches one chunk at a
+time in the sync thread (where the database cursor lives), leaving the event loop free
+in between.
+"""
+
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from .pagination import keyset_filter
+
+STREAM_CHUNK_SIZE = 500
+
+
+def wants_stream(request):
+    """True for ?stream=1 (or true/yes)."""
+    return request.query_params.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+def keyset_chunks(queryset, ordering, chunk_size=STREAM_CHUNK_SIZE, key=None):
+    """
+    Lists of up to `chunk_size` rows of `queryset` in `ordering` (as for
+    pagination.keyset_filter: non-null columns ending in a unique one), one query each.
+    `key(row)` gives a row's ordering values; the default reads them off a model instance,
+    .values()/.values_list() rows need their own.
+    """
+    queryset = queryset.order_by(*ordering)
+    if key is None:
+        names = [field.lstrip('-') for field in ordering]
+
+        def key(row):
+            return [getattr(row, name) for name in names]
+    after = None
+    while True:
+        chunk = list((queryset if after is None else queryset.filter(keyset_filter(ordering, after)))[:chunk_size])
+        if chunk:
+            yield chunk
+        if len(chunk) < chunk_size:
+            return
+        after = key(chunk[-1])
+
+
+def iter_chunks(queryset, chunk_size=STREAM_CHUNK_SIZE):
+    """Lists of up to `chunk_size` model instances, in the queryset's ordering (default: by pk)."""
+    return keyset_chunks(queryset, tuple(queryset.query.order_by) or ('pk',), chunk_size)
+
+
+def _json_array(queryset, serializer_class, context, chunk_size):
+    yield '['
+    first = True
+    for chunk in iter_chunks(queryset, chunk_size):
+        body = json.dumps(serializer_class(chunk, many=True, context=context).data, cls=DjangoJSONEncoder)
+        yield ('' if first else ',') + body[1:-1]  # Items only; the brackets are ours
+        first = False
+    yield ']'
+
+
+async def _in_sync_thread(parts):
+    next_part = sync_to_async(next, thread_sensitive=True)
+    done = object()
+    while (part := await next_part(parts, done)) is not done:
+        yield part
+
+
+def streaming_response(request, parts, content_type):
+    """StreamingHttpResponse over an iterator of str chunks, unbuffered under WSGI and ASGI."""
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        parts = _in_sync_thread(iter(parts))
+    response = StreamingHttpResponse(parts, content_type=content_type)
+    response['X-Accel-Buffering'] = 'no'  # Don't let nginx buffer the whole body
+    return response
+
+
+def stream_json(request, queryset, serializer_class, context=None, chunk_size=STREAM_CHUNK_SIZE):
+    """Streamed response with the serialized queryset as one JSON array."""
+    return streaming_response(
+        request, _json_array(queryset, serializer_class, context or {}, chunk_size), 'application/json'
+    )
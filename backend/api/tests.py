@@ -1,3 +1,1093 @@
-from django.test import TestCase
+import json
+import random
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime, time as dt_time, timedelta
+from importlib import import_module
+from io import StringIO
+from unittest import mock
+
+import numpy as np
+from asgiref.sync import async_to_sync, sync_to_async
+from django.apps import apps as django_apps
+from django.core.management import call_command
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import ingest, queue_engine, views, wire_format
+from .export import export_rows, resolve_columns
+from .ingest import READING_QUERIES, READING_QUERIES_NEW
+from .models import DailySequence, IngestJob, MeasurementSession, Patient, QueueEntry, QueueEntryArchive, QueueVersion, ServiceTimeStat, TriageRuleSet, VitalSigns, VitalsRollup
+from .pagination import encode_cursor
+from .reduction import SAMPLE_PROFILES, reduce_samples, settling_index
+from .rollups import PERIODS, STAT_COLUMNS, rebuild_period
+from .search import search_patient_ids
+from .serializers import QueueEntrySerializer
+from .snapshot import SnapshotReader, write_snapshot
+from .streaming import iter_chunks
+from .triage import retriage_queue
+from .timeseries import MAX_CHUNK_SAMPLES, SampleError, append_samples, read_range, read_samples
+from .typeahead import get_prefix_index
+from .utils import compute_patient_priority
 
 # Create your tests here.
+
+class DailySequenceTests(TransactionTestCase):
+    """Patient IDs and queue numbers come from a per-day counter that never hands out a number twice."""
+
+    def test_concurrent_allocations_are_unique(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("SQLite's shared in-memory test database fails concurrent writers instead of waiting")
+        day = timezone.localdate()
+        allocated, errors = [], []
+
+        def allocate():
+            try:
+                for _ in range(10):
+                    allocated.append(DailySequence.objects.allocate('Q', day))
+            except Exception as e:  # Surfaced below; a thread can't fail the test itself
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=allocate) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(allocated), list(range(1, 81)))
+
+    def test_counter_resets_each_day(self):
+        today = timezone.localdate()
+        self.assertEqual(QueueEntry.allocate_numbers(2, today), ['Q001', 'Q002'])
+        self.assertEqual(QueueEntry.allocate_numbers(1, today), ['Q003'])
+        self.assertEqual(QueueEntry.allocate_numbers(1, today + timedelta(days=1)), ['Q001'])
+        tomorrow = (today + timedelta(days=1)).strftime('%Y%m%d')
+        self.assertEqual(Patient.allocate_ids(1, today + timedelta(days=1)), [f'P-{tomorrow}-001'])
+
+
+class ReceiveVitalsQueryBudgetTests(TestCase):
+    """receive-vitals/ must stay within the query budget documented on ingest.ingest_reading."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.patient = Patient.objects.create(first_name='Juan', last_name='Cruz', sex='Male', address='Manila', pin='1234')
+        # Today's queue counter already exists (only the day's first queue number creates it)
+        DailySequence.objects.create(prefix='Q', day=timezone.localdate(), last_value=0)
+        # Compiled triage rules are cached per process; the budget assumes a warm cache
+        TriageRuleSet.objects.invalidate()
+        TriageRuleSet.objects.current()
+
+    def post_reading(self, **vitals):
+        return self.client.post(
+            '/api/receive-vitals/', {'patient_id': self.patient.patient_id, **vitals}, format='json'
+        )
+
+    def test_new_queue_entry(self):
+        with self.assertNumQueries(READING_QUERIES_NEW):
+            response = self.post_reading(heart_rate=72, temperature=36.6)
+        self.assertEqual(response.status_code, 201)
+        entry = QueueEntry.objects.get(patient=self.patient)
+        self.assertEqual((entry.status, entry.priority, entry.queue_number), (QueueEntry.WAITING, 'NORMAL', 'Q001'))
+        self.assertEqual(entry.rule_version, 1)
+
+    def test_requeue_existing_entry(self):
+        self.post_reading(heart_rate=72)
+        with self.assertNumQueries(READING_QUERIES):
+            response = self.post_reading(heart_rate=130, oxygen_saturation=90)  # Abnormal: 3 + 4 -> CRITICAL
+        self.assertEqual(response.status_code, 201)
+        entry = QueueEntry.objects.get(patient=self.patient)
+        self.assertEqual((entry.priority, entry.priority_rank), ('CRITICAL', 1))
+
+    def test_one_waiting_entry_per_patient(self):
+        left = QueueEntry.objects.create(patient=self.patient, priority='NORMAL', entered_at=timezone.now() - timedelta(days=1))
+        with self.assertNumQueries(READING_QUERIES_NEW):
+            self.post_reading(heart_rate=72)  # Rollover hasn't run: yesterday's entry is still waiting
+        left.refresh_from_db()
+        self.assertEqual(left.status, QueueEntry.CANCELLED)
+        self.assertEqual(QueueEntry.objects.filter(patient=self.patient, status=QueueEntry.WAITING).count(), 1)
+
+        ingest.ingest_batch([{'patient_id': self.patient.patient_id, 'heart_rate': 80}] * 2)
+        self.assertEqual(QueueEntry.objects.filter(patient=self.patient, status=QueueEntry.WAITING).count(), 1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            QueueEntry.objects.create(patient=self.patient, priority='HIGH')
+
+    def test_budget_is_independent_of_history(self):
+        VitalSigns.objects.bulk_create([VitalSigns(patient=self.patient, heart_rate=70 + i) for i in range(50)])
+        self.post_reading(heart_rate=72)
+        with self.assertNumQueries(READING_QUERIES):
+            self.post_reading(heart_rate=73)
+        self.assertEqual(self.patient.vital_signs.count(), 52)
+
+    def test_scores_the_reading_just_sent(self):
+        # An older abnormal reading must not leak into the new score
+        VitalSigns.objects.create(patient=self.patient, heart_rate=150, date_time_recorded=timezone.now())
+        self.post_reading(heart_rate=72)
+        self.assertEqual(QueueEntry.objects.get(patient=self.patient).priority, 'NORMAL')
+
+    def test_rejected_reading_writes_nothing(self):
+        response = self.client.post('/api/receive-vitals/', {'patient_id': 'P-00000000-000', 'heart_rate': 72}, format='json')
+        self.assertEqual(response.status_code, 404)
+        response = self.post_reading(heart_rate='fast')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(VitalSigns.objects.exists())
+        self.assertFalse(QueueEntry.objects.exists())
+
+
+class BatchIngestTests(TestCase):
+    """receive-vitals/batch/ answers every reading by its index and re-scores each patient once."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.engine = queue_engine.get_queue_engine()
+        self.engine.reset()
+        self.addCleanup(self.engine.reset)
+        self.juan = Patient.objects.create(first_name='Juan', last_name='Cruz', sex='Male', address='Manila', pin='1234')
+        self.ana = Patient.objects.create(first_name='Ana', last_name='Reyes', sex='Female', address='Manila', pin='1234')
+
+    def test_mixed_batch(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            waiting = QueueEntry.objects.create(patient=self.juan, priority='NORMAL')
+        version = self.engine.snapshot_with_version()[0]
+        readings = [
+            {'patient_id': self.juan.patient_id, 'heart_rate': 72},
+            {'patient_id': self.ana.patient_id, 'heart_rate': 'fast'},
+            {'patient_id': 'P-00000000-000', 'heart_rate': 72},
+            {'patient_id': self.ana.patient_id, 'heart_rate': 75},
+            {'patient_id': self.juan.patient_id, 'heart_rate': 130, 'oxygen_saturation': 90},  # 3 + 4 -> CRITICAL
+            {'heart_rate': 70},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/receive-vitals/batch/', {'readings': readings}, format='json')
+        self.assertEqual(response.status_code, 207)
+        body = response.json()
+        self.assertEqual((body['saved'], body['failed']), (3, 3))
+        results = body['results']
+        self.assertEqual([(r['index'], r['status']) for r in results], list(enumerate([201, 400, 404, 201, 201, 400])))
+        self.assertEqual([r['id'] for r in results if r['status'] == 201], list(VitalSigns.objects.order_by('id').values_list('id', flat=True)))
+        self.assertEqual(results[2]['patient_id'], 'P-00000000-000')
+
+        # One queue change per patient, from their newest reading in the batch
+        queued = QueueEntry.objects.get(patient=self.ana)
+        _, deltas = self.engine.changes_since(version)
+        self.assertEqual([(event, data['id']) for _, event, data in deltas], [('reprioritize', waiting.pk), ('insert', queued.pk)])
+        waiting.refresh_from_db()
+        self.assertEqual((waiting.priority, queued.priority), ('CRITICAL', 'NORMAL'))
+
+    def test_ids_without_returned_rows(self):
+        # As on MySQL: bulk_create leaves the pks unset
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            batch = self.client.post('/api/receive-vitals/batch/', [{'patient_id': self.ana.patient_id, 'heart_rate': 70}], format='json')
+            readings = [{'seq': seq, 'patient_id': self.ana.patient_id, 'heart_rate': 70 + seq} for seq in (1, 2)]
+            sync = self.client.post('/api/devices/rpi-1/sync/', {'readings': readings}, format='json')
+        self.assertEqual(batch.json()['results'][0]['id'], None)
+        synced = VitalSigns.objects.filter(device_id='rpi-1').order_by('device_seq').values_list('id', flat=True)
+        self.assertEqual([r['id'] for r in sync.json()['results']], list(synced))
+
+
+class IngestJournalTests(TestCase):
+    """Journaled readings are ingested in batches; one bad job doesn't fail the jobs batched with it."""
+
+    def setUp(self):
+        self.patient = Patient.objects.create(first_name='Juan', last_name='Cruz', sex='Male', address='Manila', pin='1234')
+
+    def enqueue(self, count, device_id='rpi-1'):
+        job, errors = ingest.enqueue_readings(
+            [{'patient_id': self.patient.patient_id, 'device_id': device_id, 'heart_rate': 70 + n} for n in range(count)]
+        )
+        self.assertEqual(errors, [])
+        return job
+
+    def test_results_are_indexed_per_job(self):
+        first, second = self.enqueue(2), self.enqueue(3)
+        self.assertEqual(ingest.process_pending(), 5)
+        for job, count in [(first, 2), (second, 3)]:
+            job.refresh_from_db()
+            self.assertEqual(job.status, IngestJob.DONE)
+            self.assertEqual([result['index'] for result in job.results], list(range(count)))
+        self.assertEqual(VitalSigns.objects.count(), 5)
+
+    def test_bad_job_fails_alone(self):
+        good, bad, other = self.enqueue(2), self.enqueue(1, device_id='broken'), self.enqueue(3)
+        ingest_batch = ingest.ingest_batch
+
+        def failing(readings):
+            if any(reading['device_id'] == 'broken' for reading in readings):
+                raise DatabaseError('boom')
+            return ingest_batch(readings)
+
+        with mock.patch.object(ingest, 'ingest_batch', failing):
+            self.assertEqual(ingest.process_pending(), 5)
+            for job in (good, other):
+                job.refresh_from_db()
+                self.assertEqual((job.status, len(job.results)), (IngestJob.DONE, job.reading_count))
+            bad.refresh_from_db()
+            self.assertEqual((bad.status, bad.attempts, bad.error), (IngestJob.PENDING, 1, 'boom'))
+
+            for _ in range(ingest.MAX_JOB_ATTEMPTS - 1):
+                with self.assertRaises(DatabaseError):
+                    ingest.process_pending()
+            bad.refresh_from_db()
+            self.assertEqual(bad.status, IngestJob.FAILED)
+        self.assertEqual(VitalSigns.objects.count(), 5)
+
+
+class DeviceSyncTests(TestCase):
+    """devices/<id>/sync/ stores each numbered reading once, however often a chunk is re-sent."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.patient = Patient.objects.create(first_name='Juan', last_name='Cruz', sex='Male', address='Manila', pin='1234')
+
+    def sync(self, seqs):
+        readings = [
+            {'seq': seq, 'patient_id': self.patient.patient_id, 'heart_rate': 70 + seq,
+             'recorded_at': (timezone.now() - timedelta(minutes=10 - seq)).isoformat()}
+            for seq in seqs
+        ]
+        response = self.client.post('/api/devices/rpi-1/sync/', {'readings': readings}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_resent_chunk_is_idempotent(self):
+        first = self.sync([1, 2, 3])
+        self.assertEqual((first['high_water_mark'], first['stored'], first['duplicates']), (3, 3, 0))
+        again = self.sync([1, 2, 3])
+        self.assertEqual((again['high_water_mark'], again['stored'], again['duplicates']), (3, 0, 3))
+        overlap = self.sync([3, 4, 5])
+        self.assertEqual((overlap['high_water_mark'], overlap['stored'], overlap['duplicates']), (5, 2, 1))
+        self.assertEqual(
+            list(VitalSigns.objects.order_by('device_seq').values_list('device_seq', flat=True)), [1, 2, 3, 4, 5]
+        )
+        self.assertEqual(self.client.get('/api/devices/rpi-1/sync/').json()['high_water_mark'], 5)
+
+    def test_out_of_order_chunk(self):
+        self.sync([1, 2])
+        # 3-4 are delayed; 5-6 get here first and are stored, but the mark waits for the gap
+        ahead = self.sync([5, 6])
+        self.assertEqual((ahead['high_water_mark'], ahead['stored']), (2, 2))
+        late = self.sync([3, 4])
+        self.assertEqual((late['high_water_mark'], late['stored'], late['duplicates']), (6, 2, 0))
+        again = self.sync([4, 5, 6, 7])
+        self.assertEqual((again['high_water_mark'], again['stored'], again['duplicates']), (7, 1, 3))
+        self.assertEqual(
+            list(VitalSigns.objects.order_by('device_seq').values_list('device_seq', flat=True)), [1, 2, 3, 4, 5, 6, 7]
+        )
+
+    def test_device_seq_is_not_client_input(self):
+        self.sync([1])
+        reading = {'patient_id': self.patient.patient_id, 'device_id': 'rpi-1', 'device_seq': 1, 'heart_rate': 72}
+        self.assertEqual(self.client.post('/api/receive-vitals/', reading, format='json').status_code, 201)
+        response = self.client.post('/api/receive-vitals/batch/', {'readings': [{**reading, 'device_seq': 'abc'}]}, format='json')
+        self.assertEqual(response.json()['results'][0]['status'], 201)
+        self.assertEqual(VitalSigns.objects.filter(device_seq__isnull=True).count(), 2)
+
+
+class WireFormatTests(TestCase):
+    """The compact RPi format decodes to the JSON readings it encodes, and rejects corrupt uploads cleanly."""
+
+    READINGS = [
+        {'patient_id': 'P-20250101-001', 'heart_rate': 72, 'temperature': 36.6, 'oxygen_saturation': 98.5,
+         'weight': 61.2, 'height': 1.58, 'recorded_at': '2025-01-01T08:30:00.250000+00:00', 'seq': 7},
+        {'patient_id': 'P-20250101-002', 'heart_rate': None, 'temperature': 37.2, 'oxygen_saturation': None,
+         'weight': None, 'height': None},
+    ]
+
+    def post(self, body):
+        return APIClient().post('/api/receive-vitals/batch/', body, content_type=wire_format.MEDIA_TYPE)
+
+    def test_round_trip(self):
+        decoded = wire_format.decode_readings(wire_format.encode_readings(self.READINGS, device_id='rpi-1'))
+        self.assertEqual(decoded, [{**reading, 'device_id': 'rpi-1'} for reading in self.READINGS])
+
+    def test_malformed_payloads(self):
+        body = wire_format.encode_readings(self.READINGS, device_id='rpi-1')
+        self.assertEqual(self.post(b'JUNK' + body[4:]).status_code, 400)
+        self.assertEqual(self.post(body[:-1]).status_code, 400)
+        header = wire_format.HEADER.size
+        self.assertEqual(self.post(body[:7] + b'\xff' + body[8:]).status_code, 400)  # Non-ASCII device_id
+
+        record = bytearray(body[header:header + wire_format.RECORD.size])
+        record[0] = 0xFF  # Non-ASCII patient_id
+        bad_id = wire_format.HEADER.pack(b'ESPV', wire_format.VERSION, 1, b'rpi-1') + bytes(record)
+        far_future = wire_format.HEADER.pack(b'ESPV', wire_format.VERSION, 1, b'rpi-1') + wire_format.RECORD.pack(
+            b'P-20250101-001', 72, *[wire_format.MISSING] * 4, 2 ** 62, 0
+        )
+        for upload in (bad_id, far_future):
+            response = self.post(upload)
+            self.assertEqual(response.status_code, 207)  # Per-item results
+            self.assertEqual(response.json()['results'][0]['status'], 400)
+
+
+class MeasurementSessionTests(TestCase):
+    """Sample streams are appended idempotently by offset and read back across chunk boundaries."""
+
+    def setUp(self):
+        patient = Patient.objects.create(first_name='Juan', last_name='Cruz', sex='Male', address='Manila', pin='1234')
+        self.session = MeasurementSession.objects.create(patient=patient, signal='ppg', sample_rate=100, dtype='int32')
+        self.samples = np.arange(25_000, dtype=np.int32)
+
+    def append(self, start, end, offset):
+        session, stored = append_samples(self.session.pk, self.samples[start:end].tolist(), offset)
+        return session.sample_count, stored
+
+    def test_offset_append_is_idempotent(self):
+        self.assertEqual(self.append(0, 20_000, 0), (20_000, 20_000))
+        self.assertEqual(self.append(0, 20_000, 0), (20_000, 0))  # Resent after a lost response
+        self.assertEqual(self.append(15_000, 25_000, 15_000), (25_000, 5_000))  # Overlaps what is stored
+        with self.assertRaises(SampleError) as gap:
+            append_samples(self.session.pk, [1, 2, 3], offset=25_010)
+        self.assertEqual(gap.exception.status_code, 409)
+        self.assertEqual(self.session.chunks.count(), 3)
+        self.session.refresh_from_db()
+        np.testing.assert_array_equal(read_samples(self.session, 0, 25_000), self.samples)
+
+    def test_range_read_across_chunks(self):
+        self.append(0, 25_000, 0)
+        self.session.refresh_from_db()
+        edge = MAX_CHUNK_SAMPLES
+        np.testing.assert_array_equal(read_samples(self.session, edge - 5, edge + 5), self.samples[edge - 5:edge + 5])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(read_samples(self.session, 100, 200)), 100)
+        self.assertEqual(len(queries), 1)
+
+        page = read_range(self.session, start=99, end=101, max_points=10, mode='minmax')  # Seconds: samples 9900-10100
+        self.assertEqual((page['samples'], page['step'], page['min'][0], page['max'][-1]), (200, 20, 9900, 10099))
+
+
+class SampleReductionTests(TestCase):
+    """Raw sample series are reduced to one value: warm-up skipped, spikes rejected."""
+
+    WARMING_UP = [35.0, 35.5, 35.9, 36.2, 36.4]
+
+    def test_settling_index(self):
+        profile = SAMPLE_PROFILES['temperature']
+        series = np.array(self.WARMING_UP + [36.6] * 10)
+        self.assertEqual(settling_index(series, profile.settle_window, profile.settle_tolerance), 5)
+        self.assertIsNone(settling_index(np.linspace(35, 37, 30), profile.settle_window, profile.settle_tolerance))
+
+    def test_spike_rejection(self):
+        estimate, quality = reduce_samples(self.WARMING_UP + [36.6] * 8 + [40.0] + [36.6] * 6, SAMPLE_PROFILES['temperature'])
+        self.assertEqual(estimate, 36.6)
+        self.assertEqual((quality['settled_at'], quality['used'], quality['rejected']), (5, 14, 1))
+        estimate, quality = reduce_samples([72, 73, 72, 140, 72, 71, 72, 73, 72, 72, 71, 72], SAMPLE_PROFILES['heart_rate'])
+        self.assertEqual((estimate, quality['rejected']), (72.0, 1))
+
+    def test_reading_with_samples(self):
+        patient = Patient.objects.create(first_name='Juan', last_name='Cruz', sex='Male', address='Manila', pin='1234')
+        response = APIClient().post('/api/receive-vitals/', {
+            'patient_id': patient.patient_id, 'temperature': 39.9,  # Overridden by the samples
+            'samples': {'temperature': self.WARMING_UP + [36.6] * 10},
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        reading = VitalSigns.objects.get()
+        self.assertEqual((reading.temperature, reading.sample_quality['temperature']['settled_at']), (36.6, 5))
+
+
+class LatestVitalsTests(TestCase):
+    """Patient.latest_vitals/triage_snapshot can be rebuilt from history and spare the readers a vitals query."""
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.patients = Patient.objects.bulk_create([
+            Patient(patient_id=f'P-20250101-{i:03d}', first_name=f'Ana{i}', last_name='Cruz', sex='Female', address='Manila', pin='1234')
+            for i in range(5)
+        ])
+
+    def test_rebuild_command(self):
+        # Imported straight into the table: no pointers yet, and the last patient has no readings
+        VitalSigns.objects.bulk_create([
+            VitalSigns(patient=patient, heart_rate=60 + i * 10 + minutes, date_time_recorded=self.now - timedelta(minutes=minutes))
+            for i, patient in enumerate(self.patients[:4])
+            for minutes in (0, 30)
+        ])
+        older = VitalSigns.objects.get(patient=self.patients[0], heart_rate=90)
+        Patient.objects.filter(pk=self.patients[0].pk).update(latest_vitals=older, triage_snapshot=older.snapshot())  # Stale
+
+        out = StringIO()
+        call_command('rebuild_latest_vitals', batch_size=2, stdout=out)
+        self.assertIn('Checked 5 patients; fixed 4', out.getvalue())
+        for patient in Patient.objects.all():
+            newest = patient.vital_signs.order_by('-date_time_recorded').first()
+            self.assertEqual(patient.latest_vitals, newest)
+            self.assertEqual(patient.triage_snapshot, newest.snapshot() if newest else None)
+        self.assertEqual(Patient.objects.get(pk=self.patients[0].pk).latest_reading().heart_rate, 60)
+
+        out = StringIO()
+        call_command('rebuild_latest_vitals', stdout=out)
+        self.assertIn('fixed 0', out.getvalue())
+
+    def test_readers_skip_the_vitals_table(self):
+        for patient in self.patients:
+            ingest.ingest_reading({'patient_id': patient.patient_id, 'heart_rate': 72, 'temperature': 36.6})
+        entries = list(QueueEntry.objects.select_related('patient'))
+        with self.assertNumQueries(0):
+            data = QueueEntrySerializer(entries, many=True).data
+        self.assertEqual({row['patient']['triage_snapshot']['heart_rate'] for row in data}, {72})
+
+        client = APIClient()
+        session = client.session
+        session.update({'user_type': 'patient', 'patient_id': self.patients[0].patient_id})
+        session.save()
+        with self.assertNumQueries(2):  # The session and the patient
+            profile = client.get('/api/patient/profile/').json()
+        self.assertEqual(profile['latest_vitals'], self.patients[0].vital_signs.get().pk)
+        self.assertEqual(profile['triage_snapshot']['temperature'], 36.6)
+
+
+class RetriageTests(TestCase):
+    """The vectorized bulk re-triage gives every entry the tier compute_patient_priority would."""
+
+    def setUp(self):
+        rng = random.Random(3)
+        today = timezone.localdate()
+        self.entries = []
+        for n in range(60):
+            patient = Patient.objects.create(
+                first_name=f'Ana{n}', last_name='Cruz', sex='Female', address='Manila', pin='1234',
+                birthdate=None if n % 7 == 0 else today.replace(year=today.year - rng.randint(1, 90)),
+            )
+            if n % 5:  # Some patients have no vitals at all
+                VitalSigns.objects.create(patient=patient, **{
+                    field: None if rng.random() < 0.2 else rng.uniform(low, high)
+                    for field, (low, high) in {
+                        'heart_rate': (40, 140), 'temperature': (34.5, 40), 'oxygen_saturation': (85, 100),
+                        'blood_pressure_systolic': (80, 180), 'blood_pressure_diastolic': (50, 110),
+                    }.items()
+                })
+                patient.refresh_latest_vitals()
+            self.entries.append(QueueEntry.objects.create(patient=patient, priority='NORMAL', rule_version=0))
+        self.manual = self.entries[-1]
+        QueueEntry.objects.filter(pk=self.manual.pk).update(priority='CRITICAL', priority_rank=1, rule_version=None)
+        TriageRuleSet.objects.invalidate()
+
+    def test_matches_per_entry_scoring(self):
+        rules = TriageRuleSet.objects.current()
+        summary = retriage_queue()
+        self.assertEqual(summary['checked'], len(self.entries) - 1)
+        for entry in self.entries[:-1]:
+            entry.refresh_from_db()
+            patient = Patient.objects.get(pk=entry.patient_id)
+            self.assertEqual(entry.priority, compute_patient_priority(patient, rules), patient.triage_snapshot)
+            self.assertEqual((entry.rule_version, entry.priority_rank), (rules.version, QueueEntry.rank_for(entry.priority)))
+        self.assertGreater(len({entry.priority for entry in self.entries}), 2)
+
+    def test_manual_priority_is_kept(self):
+        retriage_queue()
+        self.manual.refresh_from_db()
+        self.assertEqual((self.manual.priority, self.manual.rule_version), ('CRITICAL', None))
+        retriage_queue(include_manual=True)
+        self.manual.refresh_from_db()
+        self.assertEqual(self.manual.rule_version, TriageRuleSet.objects.current().version)
+
+
+class TriageRuleVersionTests(TestCase):
+    """Every score records the rule version behind it, and old versions still reproduce old scores."""
+
+    def rules(self, threshold, weight):
+        return [{'group': 'heart_rate', 'field': 'heart_rate', 'operator': 'gt', 'threshold': threshold, 'weight': weight}]
+
+    def post_reading(self, patient, heart_rate):
+        TriageRuleSet.objects.invalidate()  # Publishing invalidates on commit, which TestCase never reaches
+        response = APIClient().post('/api/receive-vitals/', {'patient_id': patient.patient_id, 'heart_rate': heart_rate}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return QueueEntry.objects.get(patient=patient, status=QueueEntry.WAITING)
+
+    def test_versions_reproduce_their_scores(self):
+        patient = Patient.objects.create(first_name='Juan', last_name='Cruz', sex='Male', address='Manila', pin='1234')
+        v1 = TriageRuleSet.objects.create_version(self.rules(110, 3))
+        entry = self.post_reading(patient, 105)
+        self.assertEqual((entry.priority, entry.rule_version), ('NORMAL', v1.version))
+
+        entry.finish(QueueEntry.SERVED)
+        QueueEntry.objects.filter(pk=entry.pk).update(entered_at=timezone.now() - timedelta(days=1))
+        call_command('rollover_queue', stdout=StringIO())
+        archived = QueueEntryArchive.objects.get(original_id=entry.pk)
+        self.assertEqual(archived.rule_version, v1.version)
+
+        v2 = TriageRuleSet.objects.create_version(self.rules(100, 6), note='Lower tachycardia threshold')
+        entry = self.post_reading(patient, 105)
+        self.assertEqual((entry.priority, entry.rule_version), ('CRITICAL', v2.version))
+
+        reading = Patient.objects.get(pk=patient.pk).latest_reading()
+        rescored = TriageRuleSet.objects.get(version=archived.rule_version).compile().priority(reading, patient.age)
+        self.assertEqual(rescored, archived.priority)
+
+
+class VitalsRollupTests(TestCase):
+    """Incrementally maintained rollups equal a from-scratch aggregate of the raw readings."""
+
+    def rollups(self):
+        return {
+            (row['patient_id'], row['period'], row['period_start']): {
+                key: round(value, 6) if isinstance(value, float) else value for key, value in row.items()
+            }
+            for row in VitalsRollup.objects.values('patient_id', 'period', 'period_start', 'readings', *STAT_COLUMNS)
+        }
+
+    def assert_matches_rebuild(self):
+        incremental = self.rollups()
+        for period in PERIODS:
+            rebuild_period(period)
+        self.assertEqual(incremental, self.rollups())
+
+    def test_insert_and_delete(self):
+        rng = random.Random(5)
+        client = APIClient()
+        patients = [
+            Patient.objects.create(first_name=f'Ana{n}', last_name='Cruz', sex='Female', address='Manila', pin='1234')
+            for n in range(3)
+        ]
+        now = timezone.now()
+        readings = [
+            {
+                'patient_id': rng.choice(patients).patient_id,
+                'recorded_at': (now - timedelta(days=rng.randint(0, 45), minutes=rng.randint(0, 600))).isoformat(),
+                'heart_rate': rng.choice([None, rng.randint(50, 130)]), 'temperature': round(rng.uniform(35.5, 39.5), 1),
+                'weight': rng.choice([None, round(rng.uniform(40, 90), 1)]), 'height': 1.6,
+            }
+            for _ in range(40)
+        ]
+        response = client.post('/api/receive-vitals/batch/', {'readings': readings[:30]}, format='json')
+        self.assertEqual(response.json()['saved'], 30)
+        for reading in readings[30:]:
+            self.assertEqual(client.post('/api/receive-vitals/', reading, format='json').status_code, 201)
+        self.assertEqual(sum(row['readings'] for row in self.rollups().values() if row['period'] == 'day'), 40)
+        self.assert_matches_rebuild()
+
+        for vital_signs in VitalSigns.objects.order_by('?')[:8]:
+            self.assertEqual(client.delete(f'/api/vitals/{vital_signs.pk}/').status_code, 204)
+        self.assertEqual(sum(row['readings'] for row in self.rollups().values() if row['period'] == 'month'), 32)
+        self.assert_matches_rebuild()
+
+
+class PriorityRankBackfillTests(TestCase):
+    """Migration 0026 gives the entries that predate priority_rank the tier of their priority."""
+
+    def test_backfill(self):
+        migration = import_module('api.migrations.0026_queueentry_priority_rank')
+        patients = Patient.objects.bulk_create([
+            Patient(patient_id=f'P-20250101-{i:03d}', first_name='Ana', last_name='Cruz', sex='Female', address='Manila', pin='1234')
+            for i in range(5)
+        ])
+        # As the AddField left them: every row at the column default
+        QueueEntry.objects.bulk_create([
+            QueueEntry(patient=patient, priority=priority, priority_rank=QueueEntry.DEFAULT_RANK, queue_number=f'Q{i:03d}')
+            for i, (patient, priority) in enumerate(zip(patients, ['CRITICAL', 'HIGH', 'MEDIUM', 'NORMAL', None]))
+        ])
+        migration.backfill_priority_rank(django_apps, None)
+        self.assertEqual(
+            dict(QueueEntry.objects.values_list('priority', 'priority_rank')),
+            {'CRITICAL': 1, 'HIGH': 2, 'MEDIUM': 3, 'NORMAL': 4, None: QueueEntry.DEFAULT_RANK},
+        )
+        self.assertEqual(set(migration.PRIORITY_RANKS.items()), set(QueueEntry.PRIORITY_RANKS.items()))
+
+
+class QueueEngineTests(TestCase):
+    """current_queue is served from memory, and reloads when another process bumps QueueVersion."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.engine = queue_engine.get_queue_engine()
+        self.engine.reset()
+        self.addCleanup(self.engine.reset)
+        self.patient = Patient.objects.create(first_name='Juan', last_name='Cruz', sex='Male', address='Manila', pin='1234')
+
+    def queue_numbers(self):
+        return [row['queue_number'] for row in self.client.get('/api/queue/current_queue/').json()]
+
+    @mock.patch.object(queue_engine, 'RECHECK_SECONDS', 0)
+    def test_reloads_after_bump(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            QueueEntry.objects.create(patient=self.patient, priority='NORMAL')
+        self.assertEqual(self.queue_numbers(), ['Q001'])
+        # As an ingest worker would: a bulk write that this process's signals never see
+        other = Patient.objects.create(first_name='Pedro', last_name='Reyes', sex='Male', address='Manila', pin='1234')
+        QueueEntry.objects.bulk_create([QueueEntry(patient=other, priority='CRITICAL', priority_rank=1, queue_number='Q002')])
+        self.assertEqual(self.queue_numbers(), ['Q001'])
+        QueueVersion.objects.bump()
+        self.assertEqual(self.queue_numbers(), ['Q002', 'Q001'])
+
+    def test_reads_between_checks_stay_in_memory(self):
+        self.engine.snapshot()
+        with self.assertNumQueries(0):
+            self.engine.snapshot()
+
+
+class QueueServeTests(TestCase):
+    """An entry is finished once, however many stations press serve, and serve_next skips stale heads."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.engine = queue_engine.get_queue_engine()
+        self.engine.reset()
+        self.addCleanup(self.engine.reset)
+        juan = Patient.objects.create(first_name='Juan', last_name='Cruz', sex='Male', address='Manila', pin='1234')
+        pedro = Patient.objects.create(first_name='Pedro', last_name='Reyes', sex='Male', address='Manila', pin='1234')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first = QueueEntry.objects.create(patient=juan, priority='HIGH')
+            self.second = QueueEntry.objects.create(patient=pedro, priority='NORMAL')
+
+    def test_second_serve_conflicts(self):
+        stale = QueueEntry.objects.get(pk=self.first.pk)  # What the other station loaded
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(f'/api/queue/{self.first.pk}/serve/').status_code, 200)
+        self.assertFalse(stale.finish(QueueEntry.SERVED))
+        response = self.client.post(f'/api/queue/{self.first.pk}/serve/')
+        self.assertEqual((response.status_code, response.json()), (409, {'error': 'Queue entry is already served'}))
+        self.assertEqual(ServiceTimeStat.objects.get(tier=2).samples, 1)
+        self.assertEqual([row['id'] for row in self.engine.snapshot()], [self.second.pk])
+
+    def test_serve_next_skips_stale_head(self):
+        # Another process served the head; this engine hasn't heard yet
+        QueueEntry.objects.filter(pk=self.first.pk).update(status=QueueEntry.SERVED)
+        response = self.client.post('/api/queue/serve_next/')
+        self.assertEqual((response.status_code, response.json()['id']), (200, self.second.pk))
+        self.assertEqual(self.client.post('/api/queue/serve_next/').status_code, 404)
+
+    def test_serve_next_skips_deleted_head(self):
+        QueueEntry.objects.filter(pk=self.first.pk).delete()
+        response = self.client.post('/api/queue/serve_next/')
+        self.assertEqual((response.status_code, response.json()['id']), (200, self.second.pk))
+
+
+class QueueStreamTests(TestCase):
+    """/api/queue/stream/ sends a snapshot, then deltas; a reconnect resumes from its last event id."""
+
+    def setUp(self):
+        self.engine = queue_engine.get_queue_engine()
+        self.engine.reset()
+        self.addCleanup(self.engine.reset)
+
+    def enqueue(self, priority='NORMAL', first_name='Juan'):
+        with self.captureOnCommitCallbacks(execute=True):
+            patient = Patient.objects.create(first_name=first_name, last_name='Cruz', sex='Male', address='Manila', pin='1234')
+            return QueueEntry.objects.create(patient=patient, priority=priority)
+
+    @staticmethod
+    def parse(frames):
+        """[(id, event, data)] of the SSE events in `frames`, skipping retry and heartbeat frames."""
+        events = []
+        for frame in ''.join(frames).split('\n\n'):
+            fields = dict(line.split(': ', 1) for line in frame.splitlines() if not line.startswith(':'))
+            if 'event' in fields:
+                events.append((int(fields['id']), fields['event'], json.loads(fields['data'])))
+        return events
+
+    def stream(self, since=None, **headers):
+        response = self.client.get('/api/queue/stream/', {} if since is None else {'since': since}, headers=headers)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return self.parse(part.decode() for part in response)  # Consumes the async stream as WSGI would
+
+    def test_resumes_from_last_event(self):
+        first = self.enqueue()
+        [(version, event, data)] = self.stream()
+        self.assertEqual((event, [row['id'] for row in data]), ('snapshot', [first.pk]))
+
+        second = self.enqueue('CRITICAL', 'Pedro')
+        with self.captureOnCommitCallbacks(execute=True):
+            first.finish(QueueEntry.CANCELLED)
+        missed = self.stream(since=version)
+        self.assertEqual([(event, data['id']) for _, event, data in missed], [('insert', second.pk), ('cancel', first.pk)])
+        self.assertEqual([event_id for event_id, _, _ in missed], [version + 1, version + 2])
+        self.assertEqual(self.stream(**{'Last-Event-ID': str(version + 1)})[0][2]['id'], first.pk)
+        self.assertEqual(self.stream(since=version + 2), [])  # Up to date: nothing until the next change
+
+    def test_snapshot_when_cursor_is_older_than_log(self):
+        self.engine.snapshot()  # Loads; the change log starts here
+        floor = self.engine.snapshot_with_version()[0]
+        entry = self.enqueue()
+        [(version, event, data)] = self.stream(since=floor - 1)
+        self.assertEqual((version, event, [row['id'] for row in data]), (floor + 1, 'snapshot', [entry.pk]))
+
+    @mock.patch('api.views.STREAM_POLL_SECONDS', 0)
+    def test_open_stream_sends_live_deltas(self):
+        # As under ASGI: the connection stays open and later changes arrive on it
+        async def read(events):
+            frames = []
+            async for frame in events:
+                frames.append(frame)
+                if frame.startswith('id:'):
+                    if len(frames) == 2:  # Snapshot; now change the queue
+                        await sync_to_async(self.enqueue)()
+                    else:
+                        await events.aclose()
+            return frames
+
+        frames = async_to_sync(read)(views._queue_events(self.engine, None, keep_open=True))
+        [(version, snapshot, rows), (delta_version, insert, data)] = self.parse(frames)
+        self.assertEqual((snapshot, rows, insert, delta_version), ('snapshot', [], 'insert', version + 1))
+        self.assertEqual(data['queue_number'], 'Q001')
+
+
+class ServiceTimeTests(TestCase):
+    """Serves feed the per-tier rolling service time, which current_queue's estimates add up."""
+
+    def setUp(self):
+        self.engine = queue_engine.get_queue_engine()
+        self.engine.reset()
+        self.addCleanup(self.engine.reset)
+        self.noon = timezone.make_aware(datetime.combine(timezone.localdate(), dt_time(12)))
+
+    def enqueue(self, priority, minutes):
+        with self.captureOnCommitCallbacks(execute=True):
+            patient = Patient.objects.create(first_name='Juan', last_name='Cruz', sex='Male', address='Manila', pin='1234')
+            return QueueEntry.objects.create(patient=patient, priority=priority,
+                                             entered_at=self.noon + timedelta(minutes=minutes))
+
+    def serve(self, entry, minutes):
+        with mock.patch.object(timezone, 'now', return_value=self.noon + timedelta(minutes=minutes)):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertTrue(entry.finish(QueueEntry.SERVED))
+
+    def waits(self):
+        return [(row['id'], row['estimated_wait_seconds']) for row in APIClient().get('/api/queue/current_queue/').json()]
+
+    def test_estimates_follow_serves(self):
+        self.assertEqual(self.waits(), [])  # Loaded now, so the serves below are mirrored into it
+        first, second = self.enqueue('NORMAL', -10), self.enqueue('NORMAL', -5)
+        self.serve(first, 0)  # 10 minutes since it queued: the tier's first sample
+        self.serve(second, 2)  # 2 minutes since the previous serve
+        stat = ServiceTimeStat.objects.get(tier=QueueEntry.rank_for('NORMAL'))
+        self.assertEqual((stat.samples, stat.mean_seconds), (2, 600 + ServiceTimeStat.objects.SMOOTHING * (120 - 600)))
+
+        normal, critical, later = self.enqueue('NORMAL', 1), self.enqueue('CRITICAL', 3), self.enqueue('NORMAL', 4)
+        # CRITICAL has no serves yet, so it counts the default
+        expected = [(critical.pk, 0), (normal.pk, queue_engine.DEFAULT_SERVICE_SECONDS),
+                    (later.pk, queue_engine.DEFAULT_SERVICE_SECONDS + 504)]
+        self.assertEqual(self.waits(), expected)  # Mirrored by set_service_time
+        self.engine.reset()  # Stats come back from the database
+        self.assertEqual(self.waits(), expected)
+
+    def test_first_serves_use_seeded_rows(self):
+        self.assertEqual(sorted(ServiceTimeStat.objects.values_list('tier', 'samples')), [(1, 0), (2, 0), (3, 0), (4, 0)])
+        self.serve(self.enqueue('HIGH', -3), 0)
+        self.assertEqual(ServiceTimeStat.objects.count(), 4)
+        self.assertEqual(ServiceTimeStat.objects.get(tier=2).mean_seconds, 180)
+
+
+class RolloverTests(TestCase):
+    """rollover_queue archives finished and leftover entries and leaves only today's waiting ones."""
+
+    def test_archives_and_clears(self):
+        patient = Patient.objects.create(first_name='Juan', last_name='Cruz', sex='Male', address='Manila', pin='1234')
+        yesterday = timezone.now() - timedelta(days=1)
+        served = QueueEntry.objects.create(patient=patient, priority='HIGH', entered_at=yesterday)
+        served.finish(QueueEntry.SERVED)
+        left = QueueEntry.objects.create(patient=patient, priority='NORMAL', entered_at=yesterday)
+        other = Patient.objects.create(first_name='Pedro', last_name='Reyes', sex='Male', address='Manila', pin='1234')
+        waiting = QueueEntry.objects.create(patient=other, priority='NORMAL')
+
+        call_command('rollover_queue', stdout=StringIO())
+
+        self.assertEqual(list(QueueEntry.objects.values_list('id', flat=True)), [waiting.pk])
+        archived = {row.original_id: row for row in QueueEntryArchive.objects.all()}
+        self.assertEqual(set(archived), {served.pk, left.pk})
+        self.assertEqual((archived[served.pk].status, archived[served.pk].priority), (QueueEntry.SERVED, 'HIGH'))
+        self.assertEqual(archived[left.pk].status, QueueEntry.CANCELLED)  # Left without being seen
+        self.assertEqual(archived[served.pk].queue_number, served.queue_number)
+
+
+class PaginationTests(TestCase):
+    """List endpoints return bounded, cursor-linked pages that together hold every row once."""
+
+    def setUp(self):
+        self.client = APIClient()
+        Patient.objects.bulk_create([
+            Patient(patient_id=f'P-20250101-{i:03d}', first_name=f'Ana{i % 3}', last_name=f'Cruz{i % 4}', sex='Female', address='Manila', pin='1234')
+            for i in range(11)
+        ])
+
+    def walk(self, url, **params):
+        pages, ids, cursor = 0, [], None
+        while True:
+            response = self.client.get(url, {**params, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            pages += 1
+            ids += [row['id'] for row in response.json()]
+            cursor = response.headers.get('X-Next-Cursor')
+            if not cursor:
+                self.assertNotIn('Link', response.headers)
+                return pages, ids
+            self.assertIn(f'cursor={cursor}', response.headers['Link'])
+
+    @override_settings(REST_FRAMEWORK={'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination', 'PAGE_SIZE': 4})
+    def test_default_page_size(self):
+        by_name = list(Patient.objects.order_by('last_name', 'first_name', 'id').values_list('id', flat=True))
+        self.assertEqual(self.walk('/api/patients/'), (3, by_name))
+        self.assertEqual(self.walk('/api/all-patients/'), (3, by_name))
+
+    @override_settings(API_MAX_PAGE_SIZE=5)
+    def test_page_size_is_capped(self):
+        pages, ids = self.walk('/api/patients/', page_size=1000)
+        self.assertEqual((pages, len(set(ids))), (3, 11))
+
+    def test_queue_pages_across_ties_and_inserts(self):
+        engine = queue_engine.get_queue_engine()
+        engine.reset()
+        self.addCleanup(engine.reset)
+        patients = iter(Patient.objects.order_by('id'))
+        noon = timezone.make_aware(datetime.combine(timezone.localdate(), dt_time(12)))
+
+        def enqueue(priority, minutes):
+            with self.captureOnCommitCallbacks(execute=True):
+                return QueueEntry.objects.create(patient=next(patients), priority=priority, entered_at=noon + timedelta(minutes=minutes))
+
+        # Same tier and same entered_at: only the id tells them apart
+        tied = [enqueue('HIGH', 0) for _ in range(4)]
+        normal = [enqueue('NORMAL', 0), enqueue('NORMAL', 5)]
+        seen, cursor, inserted = [], None, []
+        while True:
+            response = self.client.get('/api/queue/current_queue/', {'page_size': 2, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            seen += [row['id'] for row in response.json()]
+            cursor = response.headers.get('X-Next-Cursor')
+            if not cursor:
+                break
+            if not inserted:
+                # Between pages: one lands behind the cursor (the next pages don't show it),
+                # one ahead of it (they do), and nothing shifts or repeats
+                inserted = [enqueue('CRITICAL', 1), enqueue('HIGH', 0), enqueue('NORMAL', 1)]
+        critical, tie, late = inserted
+        self.assertEqual(seen, [entry.pk for entry in tied + [tie, normal[0], late, normal[1]]])
+        self.assertNotIn(critical.pk, seen)
+
+    def test_malformed_cursors(self):
+        for url, values in [
+            ('/api/patients/', ['Cruz0', 'Ana0', 'x']),
+            ('/api/patients/', ['Cruz0', 'Ana0', 10 ** 30]),
+            ('/api/patients/', [None, 'Ana0', 1]),
+            ('/api/patients/', [['Cruz0'], 'Ana0', {'id': 1}]),
+            ('/api/patients/', ['Cruz0', 1]),
+            ('/api/vitals/', ['yesterday', 5]),
+            ('/api/vitals/', [1.5, 'x']),
+        ]:
+            response = self.client.get(url, {'cursor': encode_cursor(values)})
+            self.assertEqual(response.status_code, 404, values)
+            self.assertEqual(response.json(), {'detail': 'Invalid cursor'})
+        self.assertEqual(self.client.get('/api/patients/', {'cursor': 'not base64!'}).status_code, 404)
+        # Values that only need converting are fine
+        self.assertEqual(self.client.get('/api/patients/', {'cursor': encode_cursor(['Cruz0', 'Ana0', '3'])}).status_code, 200)
+
+
+class StreamingTests(TestCase):
+    """?stream=1 returns every row once, in the list ordering, however the keyset chunks fall."""
+
+    def test_chunks_follow_ordering_across_ties(self):
+        patient = Patient.objects.create(first_name='Ana', last_name='Cruz', sex='Female', address='Manila', pin='1234')
+        now = timezone.now()
+        VitalSigns.objects.bulk_create([
+            VitalSigns(patient=patient, heart_rate=60 + i, date_time_recorded=now - timedelta(minutes=i // 3))
+            for i in range(10)
+        ])
+        ordered = VitalSigns.objects.order_by('-date_time_recorded', '-id')
+        expected = list(ordered.values_list('id', flat=True))
+
+        chunks = list(iter_chunks(ordered, chunk_size=3))
+        self.assertEqual([len(chunk) for chunk in chunks], [3, 3, 3, 1])
+        self.assertEqual([vital_signs.id for chunk in chunks for vital_signs in chunk], expected)
+
+        response = APIClient().get('/api/vitals/', {'stream': '1'})
+        self.assertEqual([row['id'] for row in json.loads(b''.join(response.streaming_content))], expected)
+
+        rows = list(export_rows('vitals', resolve_columns('vitals', ['id', 'heart_rate']), chunk_size=4))
+        self.assertEqual(rows, list(VitalSigns.objects.order_by('date_time_recorded', 'id').values_list('id', 'heart_rate')))
+
+
+class SnapshotTests(TestCase):
+    """Snapshot partitions hold every reading of their day, in id order, read in chunks."""
+
+    @mock.patch('api.snapshot.SNAPSHOT_CHUNK_SIZE', 2)
+    def test_partitions_match_database(self):
+        patient = Patient.objects.create(first_name='Ana', last_name='Cruz', sex='Female', address='Manila', pin='1234',
+                                         birthdate=timezone.localdate().replace(year=1950))
+        VitalSigns.objects.bulk_create([VitalSigns(patient=patient, heart_rate=60 + i) for i in range(5)])
+        VitalSigns.objects.create(patient=patient, temperature=37.5)
+        with tempfile.TemporaryDirectory() as root:
+            stats = write_snapshot(root)
+            self.assertEqual((stats['partitions'], stats['rows'], stats['patients']), (1, 6, 1))
+            columns = SnapshotReader(root).vitals(['id', 'heart_rate'])
+            expected = list(VitalSigns.objects.order_by('id').values_list('id', 'heart_rate'))
+            self.assertEqual(columns['id'].tolist(), [row_id for row_id, _ in expected])
+            self.assertEqual(columns['heart_rate'][:5].tolist(), [heart_rate for _, heart_rate in expected[:5]])
+            self.assertTrue(np.isnan(columns['heart_rate'][5]))
+            self.assertEqual(write_snapshot(root)['partitions'], 0)
+
+
+class DedupTests(TestCase):
+    """Probable duplicates are grouped by blocking key, and merging folds one record into the other."""
+
+    def setUp(self):
+        birthdate = timezone.localdate().replace(year=1980)
+        self.keep, self.duplicate, self.other = [
+            Patient.objects.create(first_name=first_name, last_name=last_name, sex='Female', birthdate=birthdate,
+                                   address='Manila', pin='1234', contact=contact)
+            for first_name, last_name, contact in [
+                ('Maria', 'Santos', 'N/A'), ('María', 'Santos', '09171234567'), ('Mauro', 'Sanchez', 'N/A'),
+            ]
+        ]
+
+    def test_duplicate_report(self):
+        groups = APIClient().get('/api/patients/duplicate_report/').json()
+        self.assertEqual([[patient['id'] for patient in group['patients']] for group in groups],
+                         [[self.keep.pk, self.duplicate.pk]])
+
+    def test_merge_repoints_history(self):
+        VitalSigns.objects.create(patient=self.keep, heart_rate=70)
+        newer = VitalSigns.objects.create(patient=self.duplicate, heart_rate=80, date_time_recorded=timezone.now() + timedelta(minutes=1))
+        # Both records are waiting: the duplicate queued first, the kept one later at a higher tier
+        earlier = QueueEntry.objects.create(patient=self.duplicate, priority='NORMAL', entered_at=timezone.now() - timedelta(minutes=10))
+        later = QueueEntry.objects.create(patient=self.keep, priority='CRITICAL')
+        QueueEntryArchive.objects.create(original_id=1, patient=self.duplicate, priority='NORMAL', entered_at=timezone.now(),
+                                         status=QueueEntry.SERVED)
+
+        response = APIClient().post(f'/api/patients/{self.keep.pk}/merge/', {'duplicate': self.duplicate.pk}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['moved'], {'vital_signs': 1, 'queue_entries': 1, 'archived_queue_entries': 1,
+                                                    'measurement_sessions': 0})
+        self.assertFalse(Patient.objects.filter(pk=self.duplicate.pk).exists())
+        self.assertEqual(VitalSigns.objects.filter(patient=self.keep).count(), 2)
+        waiting = QueueEntry.objects.get(status=QueueEntry.WAITING)
+        self.assertEqual((waiting.pk, waiting.patient_id, waiting.priority_rank), (earlier.pk, self.keep.pk, 1))
+        self.assertEqual(QueueEntry.objects.get(pk=later.pk).status, QueueEntry.CANCELLED)
+        self.assertEqual(QueueEntryArchive.objects.get().patient_id, self.keep.pk)
+        self.keep.refresh_from_db()
+        self.assertEqual((self.keep.latest_vitals_id, self.keep.contact), (newer.pk, '09171234567'))
+
+
+class SparseFieldsTests(TestCase):
+    """?fields=/?omit= trim the response and the columns read to match."""
+
+    def setUp(self):
+        self.client = APIClient()
+        patient = Patient.objects.create(first_name='Juan', last_name='Cruz', sex='Male', address='Manila', pin='1234')
+        QueueEntry.objects.create(patient=patient, priority='NORMAL')
+
+    def test_queue_display_projection(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/queue/', {'fields': 'queue_number,patient.first_name,patient.last_name'})
+        self.assertEqual(response.json(), [{'patient': {'first_name': 'Juan', 'last_name': 'Cruz'}, 'queue_number': 'Q001'}])
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('address', queries[0]['sql'])
+        self.assertNotIn('triage_snapshot', queries[0]['sql'])
+
+    def test_omit_and_unknown_fields(self):
+        row = self.client.get('/api/patients/', {'omit': 'pin,address'}).json()[0]
+        self.assertNotIn('pin', row)
+        self.assertIn('age', row)
+        self.assertEqual(self.client.get('/api/patients/', {'fields': 'nope'}).status_code, 400)
+
+
+class SearchTests(TestCase):
+    """?search= ranks name and ID matches above address ones and ignores case, accents and punctuation."""
+
+    def setUp(self):
+        def patient(first_name, last_name, address='Manila'):
+            return Patient.objects.create(first_name=first_name, last_name=last_name, sex='Female', address=address, pin='1234')
+        self.juan = patient('Juan', 'Dela Cruz')
+        self.juana = patient('Juana', 'Cruzado')
+        self.luna = patient('Maria', 'Santos', address='12 Juan Luna St., Tondo')
+        self.pena = patient('Rosario', 'Peña')
+        self.santos = patient('Ana', 'Santos')
+
+    def test_ranking(self):
+        # Whole word in the name, then its start, then a whole word in the address
+        self.assertEqual(search_patient_ids('juan'), [self.juan.pk, self.juana.pk, self.luna.pk])
+        self.assertEqual(search_patient_ids('cruz'), [self.juan.pk, self.juana.pk])
+        # Equally good matches: newest patient first
+        self.assertEqual(search_patient_ids('santos'), [self.santos.pk, self.luna.pk])
+        response = APIClient().get('/api/patients/', {'search': 'Juan'})
+        self.assertEqual([row['id'] for row in response.json()], [self.juan.pk, self.juana.pk, self.luna.pk])
+
+    def test_accents_case_and_punctuation(self):
+        for query in ['pena', 'PEÑA', 'Peña, Ros', 'rosario pena']:
+            self.assertEqual(search_patient_ids(query), [self.pena.pk], query)
+        self.assertEqual(search_patient_ids('cruz, juan'), [self.juan.pk, self.juana.pk])
+        self.assertEqual(search_patient_ids(self.juan.patient_id.replace('-', ' ').lower()), [self.juan.pk])
+
+    def test_misspellings_and_partial_words(self):
+        self.assertEqual(search_patient_ids('Jaun'), [])  # Substring matching, like icontains: no typo tolerance
+        self.assertEqual(search_patient_ids('uzad'), [self.juana.pk])  # 3+ letters match inside a word
+        self.assertEqual(search_patient_ids('ua'), [])  # Shorter ones only at the start of one
+        self.assertIsNone(search_patient_ids(' -- '))
+
+
+class TypeaheadTests(TestCase):
+    """patients/typeahead/ answers from the in-memory prefix index, within its latency budget."""
+
+    PATIENTS = 20_000
+    P50_MS = 1.0
+    P99_MS = 5.0
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(7)
+        first = ['Juan', 'Maria', 'Jose', 'Ana', 'Pedro', 'Rosa', 'Carlos', 'Luz', 'Miguel', 'Elena']
+        last = ['Santos', 'Reyes', 'Dela Cruz', 'Bautista', 'Garcia', 'Mendoza', 'Peña', 'Villanueva']
+        Patient.objects.bulk_create([
+            Patient(
+                patient_id=f'P-20250101-{i:05d}', first_name=rng.choice(first), last_name=f'{rng.choice(last)}{i % 97}',
+                sex='Male', address='Manila', pin='1234',
+            )
+            for i in range(cls.PATIENTS)
+        ], batch_size=2000)
+        cls.patient = Patient.objects.create(
+            first_name='Juan', middle_initial='P', last_name='Dela Cruz', sex='Male', address='Manila', pin='4321',
+            birthdate='1990-05-01',
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        get_prefix_index().reset()
+
+    def lookup(self, q, **params):
+        response = self.client.get('/api/patients/typeahead/', {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_matches_names_and_ids(self):
+        expected = {
+            'id': self.patient.pk, 'patient_id': self.patient.patient_id,
+            'name': 'Juan P. Dela Cruz', 'birthdate': '1990-05-01',
+        }
+        for q in ['dela cruz ju', 'Cruz, Juan', 'juan dela cruz', self.patient.patient_id, self.patient.patient_id[2:]]:
+            self.assertIn(expected, self.lookup(q, limit=50), q)
+        self.assertEqual(len(self.lookup('ma', limit=5)), 5)
+        accented = self.lookup('pena')
+        self.assertTrue(accented and all('Peña' in row['name'] for row in accented))
+        self.assertEqual(self.lookup('zzz'), [])
+        self.assertEqual(self.lookup('--'), [])
+
+    def test_follows_writes(self):
+        self.lookup('x')  # Load the index
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patient.last_name = 'Zamora'
+            self.patient.save()
+        self.assertEqual([row['name'] for row in self.lookup('zamora')], ['Juan P. Zamora'])
+        self.assertNotIn(self.patient.pk, [row['id'] for row in self.lookup('juan dela cruz', limit=50)])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patient.delete()
+        self.assertEqual(self.lookup('zamora'), [])
+
+    def test_latency(self):
+        index = get_prefix_index()
+        index.ensure_loaded()
+        rng = random.Random(11)
+        names = [f'{first} {last}' for first, last in Patient.objects.values_list('first_name', 'last_name')[:2000]]
+        queries = [name[:rng.randint(1, len(name))] for name in rng.choices(names, k=2000)]
+        queries += [f'P-20250101-{rng.randrange(self.PATIENTS):05d}'[:rng.randint(3, 16)] for _ in range(500)]
+        timings = []
+        for q in queries:
+            start = time.perf_counter()
+            index.lookup(q)
+            timings.append((time.perf_counter() - start) * 1000)
+        percentiles = statistics.quantiles(timings, n=100)
+        p50, p99 = percentiles[49], percentiles[98]
+        self.assertLess(p50, self.P50_MS, f'p50 {p50:.3f} ms')
+        self.assertLess(p99, self.P99_MS, f'p99 {p99:.3f} ms')
@@ -0,0 +1,205 @@
+"""
+Storage for high-frequency sample streams (MeasurementSession / SampleChunk).
+
+A pulse-oximeter streaming at 50-100 Hz produces hundreds of thousands of samples per
+hour, far too many for one VitalSigns row each. Instead every append becomes one
+SampleChunk: the samples as a typed NumPy array in .npy format, zlib-compressed. Sample
+i of a session was taken at started_at + i / sample_rate, so no per-sample timestamps
+are stored.
+
+- `append_samples` locks the session row, so concurrent appends get consecutive
+  indexes. Devices may send the index of their first sample (`offset`) to make
+  retried appends idempotent, like the sync protocol's high-water mark.
+- `read_samples` only loads the chunks that overlap the requested range, and
+  `downsample` reduces them to at most `max_points` buckets (mean, or a min/max
+  envelope that keeps waveform peaks visible) with NumPy reductions.
+"""
+
+import io
+import zlib
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework.parsers import BaseParser
+
+from .models import MeasurementSession, SampleChunk
+
+MAX_CHUNK_SAMPLES = 10_000   # Larger appends are split so a range read never inflates much more than it needs
+MAX_APPEND_SAMPLES = 100_000
+MAX_READ_POINTS = 5000
+DEFAULT_READ_POINTS = 1000
+DOWNSAMPLE_MODES = ('mean', 'minmax')
+COMPRESSION_LEVEL = 6
+
+
+class SampleError(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def pack_samples(values):
+    """ndarray -> compressed .npy bytes (the dtype travels with the data)."""
+    buffer = io.BytesIO()
+    np.save(buffer, values, allow_pickle=False)
+    return zlib.compress(buffer.getvalue(), COMPRESSION_LEVEL)
+
+
+def unpack_samples(blob):
+    return np.load(io.BytesIO(zlib.decompress(bytes(blob))), allow_pickle=False)
+
+
+def coerce_samples(samples, dtype):
+    """
+    Turn an upload into a 1-D array of the session's dtype; raises SampleError.
+    `samples` is a list of numbers (JSON) or raw little-endian bytes (octet-stream).
+    """
+    dtype = np.dtype(dtype)
+    if isinstance(samples, (bytes, bytearray, memoryview)):
+        if len(samples) % dtype.itemsize:
+            raise SampleError(f"Raw sample body must be a multiple of {dtype.itemsize} bytes ({dtype.name})")
+        return np.frombuffer(samples, dtype=dtype.newbyteorder('<')).astype(dtype)
+    if not isinstance(samples, list):
+        raise SampleError("samples must be a list of numbers")
+    try:
+        values = np.asarray(samples, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise SampleError("samples must be a list of numbers")
+    if values.ndim != 1:
+        raise SampleError("samples must be a flat list")
+    if not np.isfinite(values).all():
+        raise SampleError("samples must be finite")
+    if dtype.kind == 'i':
+        info = np.iinfo(dtype)
+        if values.size and (values.min() < info.min or values.max() > info.max):
+            raise SampleError(f"samples out of range for {dtype.name}")
+        values = np.rint(values)
+    return values.astype(dtype)
+
+
+def append_samples(session_id, samples, offset=None):
+    """
+    Append samples to an open session. Returns (session, number of new samples stored).
+
+    With `offset` (index of the first sample in the upload), samples the server already
+    has are skipped, so a device can resend after a lost response; a gap is rejected.
+    """
+    with transaction.atomic():
+        try:
+            session = MeasurementSession.objects.select_for_update().get(pk=session_id)
+        except MeasurementSession.DoesNotExist:
+            raise SampleError("Session not found", 404)
+        if session.closed_at is not None:
+            raise SampleError("Session is closed", 409)
+
+        values = coerce_samples(samples, session.dtype)
+        if len(values) > MAX_APPEND_SAMPLES:
+            raise SampleError(f"At most {MAX_APPEND_SAMPLES} samples per append", 413)
+        if offset is not None:
+            if offset > session.sample_count:
+                raise SampleError(f"Gap in samples: expected offset {session.sample_count}", 409)
+            values = values[session.sample_count - offset:]  # Drop what was already stored
+        if not len(values):
+            return session, 0
+
+        start = session.sample_count
+        SampleChunk.objects.bulk_create([
+            SampleChunk(
+                session=session,
+                start_index=start + i,
+                sample_count=len(values[i:i + MAX_CHUNK_SAMPLES]),
+                data=pack_samples(values[i:i + MAX_CHUNK_SAMPLES]),
+            )
+            for i in range(0, len(values), MAX_CHUNK_SAMPLES)
+        ])
+        session.sample_count = start + len(values)
+        session.save(update_fields=['sample_count'])
+    return session, len(values)
+
+
+def close_session(session, vital_signs=None):
+    """Stop accepting appends; optionally link the summary reading."""
+    session.closed_at = session.closed_at or timezone.now()
+    fields = ['closed_at']
+    if vital_signs is not None:
+        session.vital_signs = vital_signs
+        fields.append('vital_signs')
+    session.save(update_fields=fields)
+    return session
+
+
+def read_samples(session, start_index=0, end_index=None):
+    """Samples [start_index, end_index) as one array, reading only the overlapping chunks."""
+    end_index = session.sample_count if end_index is None else min(end_index, session.sample_count)
+    start_index = max(0, start_index)
+    if start_index >= end_index:
+        return np.empty(0, dtype=session.dtype)
+
+    chunks = (
+        session.chunks
+        .alias(end=F('start_index') + F('sample_count'))
+        .filter(start_index__lt=end_index, end__gt=start_index)
+        .order_by('start_index')
+        .values_list('start_index', 'data')
+    )
+    parts = []
+    for chunk_start, data in chunks:
+        values = unpack_samples(data)
+        parts.append(values[max(0, start_index - chunk_start):end_index - chunk_start])
+    return np.concatenate(parts) if parts else np.empty(0, dtype=session.dtype)
+
+
+def downsample(values, max_points, mode='mean'):
+    """
+    Reduce to at most `max_points` buckets of `step` consecutive samples.
+    Returns (step, {'values': means}) or (step, {'min': ..., 'max': ...}).
+    """
+    n = len(values)
+    step = max(1, -(-n // max_points))  # ceil(n / max_points)
+    if step == 1:
+        return 1, {'values': values} if mode == 'mean' else {'min': values, 'max': values}
+    starts = np.arange(0, n, step)
+    if mode == 'minmax':
+        return step, {'min': np.minimum.reduceat(values, starts), 'max': np.maximum.reduceat(values, starts)}
+    counts = np.diff(np.append(starts, n))
+    return step, {'values': np.add.reduceat(values, starts, dtype=np.float64) / counts}
+
+
+def read_range(session, start=None, end=None, max_points=DEFAULT_READ_POINTS, mode='mean'):
+    """
+    JSON-ready range read. `start`/`end` are seconds from the session start; the
+    samples in between are downsampled to at most `max_points` points.
+    """
+    if mode not in DOWNSAMPLE_MODES:
+        raise SampleError(f"mode must be one of {', '.join(DOWNSAMPLE_MODES)}")
+    if not 1 <= max_points <= MAX_READ_POINTS:
+        raise SampleError(f"max_points must be between 1 and {MAX_READ_POINTS}")
+    start_index = int(start * session.sample_rate) if start is not None else 0
+    end_index = int(np.ceil(end * session.sample_rate)) if end is not None else None
+
+    values = read_samples(session, start_index, end_index)
+    step, series = downsample(values, max_points, mode)
+    start_index = max(0, start_index)
+    return {
+        'session': session.id,
+        'signal': session.signal,
+        'sample_rate': session.sample_rate,
+        'start_index': start_index,
+        'start_time': (session.started_at + timedelta(seconds=start_index / session.sample_rate)).isoformat(),
+        'samples': len(values),
+        'step': step,  # Samples per point
+        'interval': step / session.sample_rate,  # Seconds per point
+        'mode': mode,
+        **{key: array.tolist() for key, array in series.items()},
+    }
+
+
+class RawSamplesParser(BaseParser):
+    """Lets stations append samples as raw little-endian bytes in the session's dtype."""
+    media_type = 'application/octet-stream'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return stream.read()
@@ -0,0 +1,110 @@
+"""
+Bulk re-triage of the waiting queue.
+
+compute_priority scores one patient when a reading arrives, so a priority never changes
+when its other inputs do - a patient turning 65 overnight, or a new triage rule version.
+`retriage_queue` rescores everyone who is waiting at once:
+
+- one query loads every waiting entry with its patient's birthdate and the fields of
+  their latest reading that the active rules use (a join through
+  Patient.latest_vitals, no per-patient round trips);
+- the compiled rules (utils.TriageRules) are applied to whole columns with NumPy
+  comparisons: missing values are NaN, which compare false just like `None` does in
+  TriageRules.score, and each group adds the weight of its heaviest matching rule;
+- entries a staff member prioritised by hand (rule_version null) are left alone
+  unless `include_manual` is set;
+- entries whose tier or rule version changed are written back with one bulk_update
+  and mirrored into the queue engine on commit (QueueVersion is bumped, so the web
+  server's engines reload too).
+
+Run it from `manage.py retriage_queue`, e.g. nightly and after publishing new rules.
+"""
+
+from datetime import date
+
+import numpy as np
+from django.db import transaction
+
+from .models import QueueEntry, QueueVersion, TriageRuleSet
+from .queue_engine import get_queue_engine
+
+
+def load_waiting(fields, lock=False, include_manual=False):
+    """(entry ids, [(priority, rule_version)], birthdates, has-vitals mask, {field: float array}) in one query."""
+    entries = QueueEntry.objects.filter(status=QueueEntry.WAITING)
+    if not include_manual:
+        entries = entries.filter(rule_version__isnull=False)
+    if lock:
+        entries = entries.select_for_update(of=('self',))
+    rows = list(entries.values_list(
+        'id', 'priority', 'rule_version', 'patient__birthdate', 'patient__latest_vitals_id',
+        *(f'patient__latest_vitals__{field}' for field in fields)
+    ))
+    ids, priorities, versions, birthdates, latest_ids, *values = zip(*rows) if rows else [()] * (5 + len(fields))
+    columns = {field: np.array(column, dtype=np.float64) for field, column in zip(fields, values)}  # None -> NaN
+    has_vitals = np.array([latest_id is not None for latest_id in latest_ids], dtype=bool)
+    return list(ids), list(zip(priorities, versions)), np.array(birthdates, dtype='datetime64[D]'), has_vitals, columns
+
+
+def ages(birthdates, today):
+    """Age in whole years on `today`, for an array of datetime64[D] (NaT -> NaN, i.e. unknown)."""
+    months = birthdates.astype('datetime64[M]')
+    year = birthdates.astype('datetime64[Y]').astype(np.int64) + 1970
+    month_day = (months.astype(np.int64) % 12 + 1) * 100 + (birthdates - months).astype(np.int64) + 1
+    age = (today.year - year - (month_day > today.month * 100 + today.day)).astype(np.float64)
+    age[np.isnat(birthdates)] = np.nan
+    return age
+
+
+def score_tiers(rules, columns, has_vitals):
+    """Tier name per row; the vectorized form of TriageRules.priority."""
+    score = np.zeros(len(has_vitals), dtype=np.int64)
+    for checks in rules.groups:
+        group_score = np.zeros(len(has_vitals), dtype=np.int64)
+        for field, compare, threshold, weight in checks:
+            np.maximum(group_score, weight * compare(columns[field], threshold), out=group_score)
+        score += group_score
+    ascending = rules.tiers[::-1]
+    names = np.array(['NORMAL'] + [tier for tier, _ in ascending], dtype=object)
+    tiers = names[np.searchsorted([min_score for _, min_score in ascending], score, side='right')]
+    tiers[~has_vitals] = 'NORMAL'  # No vitals? Default to normal
+    return tiers
+
+
+def retriage_queue(dry_run=False, today=None, include_manual=False):
+    """
+    Rescore every waiting entry with the active rules and save the ones that changed.
+    Priorities set by hand are kept unless `include_manual`.
+    Returns {"checked": n, "changed": n, "rule_version": v, "tiers": {tier: count}}.
+    """
+    today = today or date.today()  # Patient.age uses the server's date too
+    rules = TriageRuleSet.objects.current()
+    with transaction.atomic():
+        ids, current, birthdates, has_vitals, columns = load_waiting(
+            rules.fields, lock=not dry_run, include_manual=include_manual
+        )
+        columns['age'] = ages(birthdates, today)
+        tiers = score_tiers(rules, columns, has_vitals).tolist()
+
+        changed = [
+            QueueEntry(pk=entry_id, priority=priority, priority_rank=QueueEntry.rank_for(priority),
+                       rule_version=rules.version)
+            for entry_id, (old_priority, old_version), priority in zip(ids, current, tiers)
+            if (old_priority, old_version) != (priority, rules.version)
+        ]
+        if changed and not dry_run:
+            QueueEntry.objects.bulk_update(changed, ['priority', 'priority_rank', 'rule_version'])
+            QueueVersion.objects.bump()
+            engine = get_queue_engine()
+
+            def mirror():
+                for entry in changed:
+                    engine.set_priority(entry.pk, entry.priority, rules.version)
+            transaction.on_commit(mirror)
+
+    return {
+        'checked': len(ids),
+        'changed': len(changed),
+        'rule_version': rules.version,
+        'tiers': {tier: tiers.count(tier) for tier in ['CRITICAL', 'HIGH', 'MEDIUM', 'NORMAL']},
+    }
@@ -0,0 +1,176 @@
+"""
+In-memory prefix index for the front desk's patient autocomplete (/patients/typeahead/).
+
+Each keystroke used to run a search and serialize whole patient rows (PIN included).
+Instead, every process keeps one sorted list of (key, patient pk) over normalized
+names and patient IDs, and a lookup is a bisect to the first key starting with the
+typed text plus a short forward scan. Results are small projections (pk, patient_id,
+display name, birthdate); reads never touch the database.
+
+Keys use the same normalization as search.py (lowercase, accents stripped, words joined
+by one space). A patient "Juan P. Dela Cruz", P-20251001-007, is found by typing the
+start of any of:
+
+    juan dela cruz / dela cruz juan / cruz juan / p 20251001 007 / 20251001 007
+
+so "dela cr", "Cruz, Ju" and "P-2025100" all work.
+
+- Saves and deletes are mirrored on commit (signals.py) with a few bisect inserts.
+- The index is built on first use and rebuilt after REFRESH_SECONDS, which bounds how
+  long a patient registered through another worker process can be missing.
+"""
+
+import bisect
+import threading
+import time
+
+from .models import Patient
+from .streaming import keyset_chunks
+from .utils import words
+
+TYPEAHEAD_RESULTS = 10
+MAX_TYPEAHEAD_RESULTS = 50
+REFRESH_SECONDS = 300
+
+PROJECTION = ('pk', 'patient_id', 'first_name', 'middle_initial', 'last_name', 'birthdate')
+
+
+def normalize(text):
+    """The form keys and queries are compared in."""
+    return ' '.join(words(text))
+
+
+def patient_keys(patient_id, first_name, last_name):
+    """Every key a patient can be typed as (see the module docstring)."""
+    first, last = words(first_name), words(last_name)
+    keys = {' '.join(first + last), ' '.join(last + first)}
+    keys.update(' '.join(last[i:] + first) for i in range(1, len(last)))
+    keys.update(' '.join(first[i:] + last) for i in range(1, len(first)))
+    id_words = words(patient_id)
+    keys.add(' '.join(id_words))
+    if len(id_words) > 1:
+        keys.add(' '.join(id_words[1:]))  # Without the "P-"
+    keys.discard('')
+    return keys
+
+
+def display_name(first_name, middle_initial, last_name):
+    """"Juan P. Dela Cruz", as the frontend shows it."""
+    return f"{first_name}{f' {middle_initial}.' if middle_initial else ''} {last_name}"
+
+
+class PrefixIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._keys = []       # sorted (key, patient pk)
+        self._patients = {}   # patient pk -> (keys, payload)
+        self._loaded_at = None
+
+    # ------------------------------------------------------------------ loading
+
+    def _is_current(self):
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < REFRESH_SECONDS
+
+    def ensure_loaded(self):
+        """Build from the database on first use, or when the index is older than REFRESH_SECONDS."""
+        if self._is_current():
+            return
+        with self._lock:
+            if not self._is_current():
+                self._load()
+
+    def _load(self):
+        patients = {}
+        keys = []
+        rows = Patient.objects.values_list(*PROJECTION)
+        for chunk in keyset_chunks(rows, ('pk',), 5000, key=lambda row: row[:1]):
+            for row in chunk:
+                patients[row[0]] = entry = self._entry(*row)
+                keys.extend((key, row[0]) for key in entry[0])
+        keys.sort()
+        self._keys, self._patients = keys, patients
+        self._loaded_at = time.monotonic()
+
+    def reset(self):
+        """Forget everything; the next lookup reloads from the database."""
+        with self._lock:
+            self._keys = []
+            self._patients = {}
+            self._loaded_at = None
+
+    @staticmethod
+    def _entry(pk, patient_id, first_name, middle_initial, last_name, birthdate):
+        payload = {
+            'id': pk,
+            'patient_id': patient_id,
+            'name': display_name(first_name, middle_initial, last_name),
+            # A freshly created instance may still hold the string it was given
+            'birthdate': birthdate.isoformat() if hasattr(birthdate, 'isoformat') else birthdate,
+        }
+        return tuple(sorted(patient_keys(patient_id, first_name, last_name))), payload
+
+    # -------------------------------------------------------------- mutations
+
+    def _drop(self, pk):
+        """Remove a patient's keys. The caller must hold the lock."""
+        current = self._patients.pop(pk, None)
+        if current is None:
+            return
+        for key in current[0]:
+            index = bisect.bisect_left(self._keys, (key, pk))
+            if index < len(self._keys) and self._keys[index] == (key, pk):
+                del self._keys[index]
+
+    def upsert(self, patient):
+        """Mirror a saved Patient."""
+        if self._loaded_at is None:
+            return  # Not loaded: the first lookup reads it from the database
+        keys, payload = self._entry(*(getattr(patient, field) for field in PROJECTION))
+        with self._lock:
+            current = self._patients.get(patient.pk)
+            if current is not None and current == (keys, payload):
+                return  # e.g. only last_visit changed
+            self._drop(patient.pk)
+            self._patients[patient.pk] = (keys, payload)
+            for key in keys:
+                bisect.insort(self._keys, (key, patient.pk))
+
+    def discard(self, pk):
+        """Mirror a deleted Patient."""
+        if self._loaded_at is None:
+            return
+        with self._lock:
+            self._drop(pk)
+
+    # ------------------------------------------------------------------- reads
+
+    def lookup(self, text, limit=TYPEAHEAD_RESULTS):
+        """Payloads of up to `limit` patients with a key starting with `text`, in key order."""
+        prefix = normalize(text)
+        if not prefix:
+            return []
+        self.ensure_loaded()
+        found = {}
+        with self._lock:
+            keys = self._keys
+            index = bisect.bisect_left(keys, (prefix,))
+            while index < len(keys) and len(found) < limit:
+                key, pk = keys[index]
+                if not key.startswith(prefix):
+                    break
+                if pk not in found:
+                    found[pk] = self._patients[pk][1]
+                index += 1
+        return list(found.values())
+
+    def __len__(self):
+        self.ensure_loaded()
+        return len(self._patients)
+
+
+_index = PrefixIndex()
+
+
+def get_prefix_index():
+    """Process-wide index shared by the view and the signal handlers."""
+    return _index
@@ -1,19 +1,28 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import PatientViewSet, VitalSignsViewSet, QueueViewSet, login, receive_vital_signs, get_all_patients, test_rpi_connection, logout, get_patient_profile
+from .views import PatientViewSet, VitalSignsViewSet, QueueViewSet, MeasurementSessionViewSet, TriageRuleSetViewSet, login, receive_vital_signs, receive_vital_signs_batch, receive_vital_signs_async, ingest_job_status, ingest_metrics_view, export_data, device_sync, get_all_patients, test_rpi_connection, logout, get_patient_profile, queue_stream
 
 router = DefaultRouter()
 router.register(r'patients', PatientViewSet)
 router.register(r'vitals', VitalSignsViewSet)
 router.register(r'queue', QueueViewSet)
+router.register(r'sessions', MeasurementSessionViewSet)
+router.register(r'triage-rules', TriageRuleSetViewSet)
 
 urlpatterns = [ # endpoints
     path('login/', login, name="login"),
     path('logout/', logout, name="logout"),
     path('patient/profile/', get_patient_profile, name='patient_profile'),
+    path('queue/stream/', queue_stream, name='queue_stream'),  # before the router so 'stream' isn't read as a pk
     path('', include(router.urls)), # includes the viewsets for patients and vitals
     path('all-patients/', get_all_patients, name='all_patients'),
     path('receive-vitals/', receive_vital_signs, name='receive_vitals'),
+    path('receive-vitals/batch/', receive_vital_signs_batch, name='receive_vitals_batch'),
+    path('receive-vitals/async/', receive_vital_signs_async, name='receive_vitals_async'),
+    path('ingest/jobs/<int:job_id>/', ingest_job_status, name='ingest_job_status'),
+    path('ingest/metrics/', ingest_metrics_view, name='ingest_metrics'),
+    path('export/<str:dataset>.<str:extension>', export_data, name='export_data'),
+    path('devices/<str:device_id>/sync/', device_sync, name='device_sync'),
     path('test-connection/', test_rpi_connection, name='test_connection'),
     # path('rpi/data/', receive_vital_signs, name='receive_vital_signs'),
     
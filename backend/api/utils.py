@@ -1,55 +1,130 @@
-from decimal import Decimal
-
-# Priority computation function (moved here for self-containment; can go to utils.py later)
-def is_abnormal_vital(vital_type, value):
-    """Check if a vital is abnormal using standard adult thresholds."""
-    if value is None:
-        return False
-    
-    if vital_type == 'heart_rate':
-        return value < 50 or value > 110
-    elif vital_type == 'temperature':
-        return value < 35.5 or value > 38.5
-    elif vital_type == 'oxygen_saturation':
-        return value < 92
-    elif vital_type == 'blood_pressure':
-        # Note: Your model doesn't have BP fields yet—add them if needed!
-        # For now, this will always return False; implement when you add systolic/diastolic.
-        return False
-    return False
-
-def compute_patient_priority(patient):
+import operator
+import re
+import unicodedata
+
+# Triage rules. The active rule set lives in the database (TriageRuleSet, versioned) and is
+# compiled into TriageRules; these built-in defaults (version 0) are only used when the
+# table is empty. Each rule is (group, field, operator, threshold, weight): a group adds the
+# weight of its heaviest matching rule, once, so e.g. high systolic and high diastolic
+# pressure together still count 3. `age` is the patient's age; other fields are VitalSigns.
+RULE_OPERATORS = {
+    'lt': operator.lt,
+    'le': operator.le,
+    'gt': operator.gt,
+    'ge': operator.ge,
+}
+DEFAULT_RULES = [
+    ('heart_rate', 'heart_rate', 'lt', 50, 3),
+    ('heart_rate', 'heart_rate', 'gt', 110, 3),
+    ('temperature', 'temperature', 'lt', 35.5, 2),
+    ('temperature', 'temperature', 'gt', 38.5, 2),
+    ('oxygen_saturation', 'oxygen_saturation', 'lt', 92, 4),  # Higher weight for oxygenation
+    ('blood_pressure', 'blood_pressure_systolic', 'lt', 90, 3),
+    ('blood_pressure', 'blood_pressure_systolic', 'gt', 140, 3),
+    ('blood_pressure', 'blood_pressure_diastolic', 'lt', 60, 3),
+    ('blood_pressure', 'blood_pressure_diastolic', 'gt', 90, 3),
+    ('senior', 'age', 'ge', 65, 2),  # Senior bonus
+    ('obesity', 'BMI', 'ge', 30, 1),  # BMI factor (using your computed BMI)
+]
+# Lowest score for each tier; anything below the last one is NORMAL
+DEFAULT_TIERS = [('CRITICAL', 6), ('HIGH', 3), ('MEDIUM', 1)]
+
+class TriageRules:
+    """
+    A rule set compiled for scoring: nested tuples of (field, comparison, threshold,
+    weight), heaviest rule first within each group, so scoring a reading is a couple of
+    tight loops with no lookups or allocations beyond getattr.
+    """
+    __slots__ = ('version', 'groups', 'tiers', 'fields')
+
+    def __init__(self, version, rules, tiers):
+        grouped = {}
+        for group, field, op, threshold, weight in rules:
+            grouped.setdefault(group, []).append((field, RULE_OPERATORS[op], threshold, weight))
+        self.version = version
+        self.groups = tuple(
+            tuple(sorted(checks, key=lambda check: -check[3])) for checks in grouped.values()
+        )
+        self.tiers = tuple(sorted(tiers, key=lambda tier: -tier[1]))
+        # VitalSigns columns the rules read (for bulk loaders, see triage.py)
+        self.fields = tuple(sorted({check[0] for checks in self.groups for check in checks} - {'age'}))
+
+    def score(self, reading, age):
+        total = 0
+        for checks in self.groups:
+            for field, compare, threshold, weight in checks:
+                value = age if field == 'age' else getattr(reading, field, None)
+                if value is not None and compare(value, threshold):
+                    total += weight
+                    break
+        return total
+
+    def tier_for(self, score):
+        for tier, min_score in self.tiers:
+            if score >= min_score:
+                return tier
+        return 'NORMAL'
+
+    def priority(self, reading, age):
+        if not reading:
+            return 'NORMAL'  # No vitals? Default to normal
+        return self.tier_for(self.score(reading, age))
+
+DEFAULT_TRIAGE_RULES = TriageRules(0, DEFAULT_RULES, DEFAULT_TIERS)
+
+def compute_patient_priority(patient, rules=None):
     """Compute priority score and map to tier based on latest vitals and age."""
-    # Get latest vitals
-    latest_vitals = patient.vital_signs.order_by('-date_time_recorded').first()
-    if not latest_vitals:
-        return 'NORMAL'  # No vitals? Default to normal
-    score = 0
-    is_senior = patient.is_senior()
-    # Check core vitals (adapt if you add BP later)
-    if is_abnormal_vital('heart_rate', latest_vitals.heart_rate):
-        score += 3
-    if is_abnormal_vital('temperature', latest_vitals.temperature):
-        score += 2
-    if is_abnormal_vital('oxygen_saturation', latest_vitals.oxygen_saturation):
-        score += 4  # Higher weight for oxygenation
-    
-    # Note: No BP in your model yet—add fields like:
-    # blood_pressure_systolic = models.IntegerField(null=True, blank=True)
-    # blood_pressure_diastolic = models.IntegerField(null=True, blank=True)
-    # Then: if is_abnormal_vital('blood_pressure', {'systolic': ..., 'diastolic': ...}): score += 3
-    # Senior bonus
-    if is_senior:
-        score += 2
-    # BMI factor (using your computed BMI)
-    if latest_vitals.BMI and latest_vitals.BMI >= 30:
-        score += 1
-    # Map to tier
-    if score >= 6:
-        return 'CRITICAL'
-    elif score >= 3:
-        return 'HIGH'
-    elif score >= 1:
-        return 'MEDIUM'
-    else:
-        return 'NORMAL'
\ No newline at end of file
+    # Latest vitals, from the snapshot ingestion keeps on the patient (no query)
+    return compute_priority(patient.latest_reading(), patient.age, rules)
+
+def compute_priority(latest_vitals, age, rules=None):
+    """
+    Score one reading (e.g. one that was just inserted) without querying the database.
+    Pass the active rules (TriageRuleSet.objects.current()); defaults to the built-in ones.
+    """
+    return (rules or DEFAULT_TRIAGE_RULES).priority(latest_vitals, age)
+
+
+# Name matching (patient search, typeahead and duplicate detection)
+_WORD = re.compile(r'[a-z0-9]+')
+_SOUNDEX_CODES = {
+    **dict.fromkeys('bfpv', '1'), **dict.fromkeys('cgjkqsxz', '2'), **dict.fromkeys('dt', '3'),
+    'l': '4', **dict.fromkeys('mn', '5'), 'r': '6',
+}
+BLOCKING_FIELDS = ('first_name', 'last_name', 'sex', 'birthdate')
+
+
+def words(text):
+    """Lowercase, accent-free alphanumeric words of `text`."""
+    text = text or ''
+    if not text.isascii():
+        decomposed = unicodedata.normalize('NFKD', text)
+        text = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return _WORD.findall(text.casefold())
+
+
+def soundex(text):
+    """American Soundex of the letters in `text` ("Dela Cruz" -> "D426"), '' if there are none."""
+    letters = ''.join(c for c in ''.join(words(text)) if c.isalpha())
+    if not letters:
+        return ''
+    code, previous = letters[0].upper(), _SOUNDEX_CODES.get(letters[0])
+    for c in letters[1:]:
+        digit = _SOUNDEX_CODES.get(c)
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        if c not in 'hw':  # H and W don't separate letters with the same code
+            previous = digit
+    return code.ljust(4, '0')
+
+
+def blocking_key(first_name, last_name, sex, birthdate):
+    """
+    Duplicate-detection block of a patient: sound-alike last and first name, sex and
+    birthdate, e.g. "D426J500M19900501". Spellings that sound the same ("Dela Cruz",
+    "Delacruz", "De la Cruz"; "Jon"/"John") share a block.
+    """
+    first = words(first_name)
+    return f"{soundex(last_name)}{soundex(first[0] if first else '')}{(sex or '')[:1]}{str(birthdate or '').replace('-', '')}"
@@ -1,23 +1,50 @@
+import asyncio
+import json
+from datetime import timedelta
+from asgiref.sync import sync_to_async
 from django.shortcuts import render  # Unused but kept if needed elsewhere
 from rest_framework import viewsets, status
 from rest_framework.permissions import AllowAny
-from rest_framework.decorators import action, api_view
+from rest_framework.decorators import action, api_view, parser_classes, renderer_classes
 from rest_framework.response import Response
-from .models import Patient, VitalSigns, HCStaff, QueueEntry
-from .serializers import PatientSerializer, VitalSignsSerializer, QueueEntrySerializer 
-from django.db.models import Q, Case, When, IntegerField  # For queue sorting
+from rest_framework.exceptions import NotFound
+from .models import Patient, VitalSigns, VitalsRollup, HCStaff, QueueEntry, QueueEntryArchive, IngestJob, Device, MeasurementSession, TriageRuleSet
+from .serializers import PatientSerializer, VitalSignsSerializer, QueueEntrySerializer, QueueEntryArchiveSerializer, MeasurementSessionSerializer, TriageRuleSetSerializer
+from django.db import transaction
+from django.db.models import Case, When
 from django.utils import timezone  
-from .utils import compute_patient_priority
+from django.utils.dateparse import parse_date, parse_datetime
+from .utils import BLOCKING_FIELDS
+from .queue_engine import get_queue_engine
+from .pagination import KeysetPagination
+from .fieldsets import SparseFieldsViewMixin, project, requested_fieldsets, shape, trim
+from .streaming import stream_json, streaming_response, wants_stream
+from .export import ExportError, export
+from .search import search_patient_ids
+from .dedup import duplicate_groups, find_duplicates, merge_patients
+from .typeahead import MAX_TYPEAHEAD_RESULTS, TYPEAHEAD_RESULTS, get_prefix_index
+from .rollups import PERIODS, add_reading, pick_period, rebuild_buckets, trends
+from .wire_format import CompactVitalsParser, CompactVitalsRenderer
+from .timeseries import DEFAULT_READ_POINTS, RawSamplesParser, SampleError, append_samples, close_session, read_range
+from rest_framework.settings import api_settings
+from .ingest import MAX_BATCH_SIZE, MAX_SYNC_CHUNK, ReadingError, enqueue_readings, ingest_batch, ingest_metrics, ingest_reading, sync_device
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.decorators import api_view
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponseNotAllowed, StreamingHttpResponse
 
 
 # Create your views here.
 
-class PatientViewSet(viewsets.ModelViewSet):
+PATIENT_ORDERING = ('last_name', 'first_name', 'id')  # Served by patient_name_idx
+
+
+class PatientViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     queryset = Patient.objects.all()
     serializer_class = PatientSerializer
     permission_classes = [AllowAny] 
+    keyset_ordering = PATIENT_ORDERING
     
     @action(detail=False, methods=['get'])  # Custom action to get patient by PIN
     def by_pin(self, request):  # GET /patients/by_pin/?pin=1234
@@ -31,24 +58,88 @@ class PatientViewSet(viewsets.ModelViewSet):
         except Patient.DoesNotExist:
             return Response({"error": "Patient not found"}, status=status.HTTP_404_NOT_FOUND)
         
+    def create(self, request, *args, **kwargs):
+        """Register a patient, unless they probably are already (409 with the candidates; ?allow_duplicate=1 overrides)."""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if request.query_params.get('allow_duplicate', '').lower() not in ('1', 'true', 'yes'):
+            duplicates = find_duplicates(*(serializer.validated_data.get(field) for field in BLOCKING_FIELDS))
+            if duplicates:
+                return Response(
+                    {"error": "This patient may already be registered", "duplicates": duplicates},
+                    status=status.HTTP_409_CONFLICT,
+                )
+        self.perform_create(serializer)
+        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=self.get_success_headers(serializer.data))
+
+    @action(detail=False, methods=['get'])
+    def duplicates(self, request):  # GET /patients/duplicates/?first_name=Juan&last_name=Dela%20Cruz&sex=Male&birthdate=1990-05-01
+        """Registered patients who are probably the person described (dedup.py)."""
+        params = request.query_params
+        if not (params.get('first_name') and params.get('last_name')):
+            return Response({"error": "first_name and last_name are required"}, status=status.HTTP_400_BAD_REQUEST)
+        birthdate = params.get('birthdate') or None
+        if birthdate and parse_date(birthdate) is None:
+            return Response({"error": "birthdate must be YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(find_duplicates(params['first_name'], params['last_name'], params.get('sex'), birthdate))
+
+    @action(detail=False, methods=['get'])
+    def duplicate_report(self, request):  # GET /patients/duplicate_report/
+        """Every group of probable duplicates, one per blocking key."""
+        return Response(list(duplicate_groups()))
+
+    @action(detail=True, methods=['post'])
+    def merge(self, request, pk=None):  # POST /patients/<id>/merge/ {"duplicate": <id>}
+        """Fold another record of the same person into this one (readings, queue history, sessions) and delete it."""
+        keep = self.get_object()
+        try:
+            duplicate = Patient.objects.get(pk=request.data['duplicate'])
+        except KeyError:
+            return Response({"error": "duplicate is required"}, status=status.HTTP_400_BAD_REQUEST)
+        except (Patient.DoesNotExist, ValueError, TypeError):
+            return Response({"error": "Duplicate patient not found"}, status=status.HTTP_404_NOT_FOUND)
+        if duplicate.pk == keep.pk:
+            return Response({"error": "Can't merge a patient into itself"}, status=status.HTTP_400_BAD_REQUEST)
+        moved = merge_patients(keep, duplicate)
+        return Response({"patient": self.get_serializer(keep).data, "moved": moved})
+
+    @action(detail=False, methods=['get'])
+    def typeahead(self, request):  # GET /patients/typeahead/?q=dela%20cr&limit=10
+        """Autocomplete by the start of a name or patient ID, from the in-memory index (typeahead.py)."""
+        try:
+            limit = min(max(1, int(request.query_params.get('limit', TYPEAHEAD_RESULTS))), MAX_TYPEAHEAD_RESULTS)
+        except ValueError:
+            limit = TYPEAHEAD_RESULTS
+        return Response(get_prefix_index().lookup(request.query_params.get('q', ''), limit))
+
     def get_queryset(self): 
         queryset = Patient.objects.all()
 
-        # General search filter
+        # General search filter: ranked matches on name, address and patient_id (search.py)
         if self.request.query_params.get('search'):
-            search_term = self.request.query_params.get('search')
-            queryset = queryset.filter(
-                Q(first_name__icontains=search_term) | 
-                Q(last_name__icontains=search_term) | 
-                Q(address__icontains=search_term) | 
-                Q(patient_id__icontains=search_term) 
-            )
+            ids = search_patient_ids(self.request.query_params['search'])
+            if ids is None:
+                return queryset.none()  # Nothing searchable in it, e.g. only punctuation
+            ranking = Case(*(When(pk=pk, then=position) for position, pk in enumerate(ids)), default=len(ids))
+            queryset = queryset.filter(pk__in=ids).order_by(ranking)
         return queryset
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('search'):
+            # Ranked, and already capped at search.SEARCH_RESULTS: one page, in rank order
+            return Response(self.get_serializer(self.filter_queryset(self.get_queryset()), many=True).data)
+        return super().list(request, *args, **kwargs)
          
-class VitalSignsViewSet(viewsets.ModelViewSet):
+class VitalSignsViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
+    """
+    Readings, newest first, in pages (?page_size=100, then ?cursor=<X-Next-Cursor>; see
+    pagination.py), or streamed in one response with constant server memory (?stream=1,
+    see streaming.py); both work for the list and by_patient.
+    """
     queryset = VitalSigns.objects.all()
     serializer_class = VitalSignsSerializer
     permission_classes = [AllowAny]
+    keyset_ordering = ('-date_time_recorded', '-id')  # vitals_patient_recorded_idx for one patient, else vitals_recorded_idx
     
     def get_queryset(self):  # Filtering vital signs by patient_id and date range
         queryset = VitalSigns.objects.all()
@@ -67,20 +158,201 @@ class VitalSignsViewSet(viewsets.ModelViewSet):
         if date_to:
             queryset = queryset.filter(date_time_recorded__lte=date_to)
             
-        return queryset.select_related('patient').order_by('-date_time_recorded')  # Fixed: correct field
+        return queryset.select_related('patient').order_by(*self.keyset_ordering)  # Fixed: correct field
+
+    def list_or_stream(self, queryset):
+        """Streamed (?stream=1) or paginated response for `queryset`."""
+        if wants_stream(self.request):
+            return stream_json(self.request, queryset, self.get_serializer_class(), self.get_serializer_context())
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    def list(self, request, *args, **kwargs):
+        return self.list_or_stream(self.filter_queryset(self.get_queryset()))
+    
+    # Hand edits and deletes can change which reading is the newest and what the trend
+    # rollups hold; ingestion keeps both current on its own (see ingest.py)
+    @transaction.atomic
+    def perform_create(self, serializer):
+        vital_signs = serializer.save()
+        add_reading(vital_signs)
+        vital_signs.patient.refresh_latest_vitals()
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        old_patient_id = serializer.instance.patient_id
+        old_day = timezone.localdate(serializer.instance.date_time_recorded)
+        vital_signs = serializer.save()
+        rebuild_buckets(old_patient_id, old_day)
+        rebuild_buckets(vital_signs.patient_id, timezone.localdate(vital_signs.date_time_recorded))
+        vital_signs.patient.refresh_latest_vitals()
+        if old_patient_id != vital_signs.patient_id:
+            Patient.objects.get(pk=old_patient_id).refresh_latest_vitals()
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        patient, day = instance.patient, timezone.localdate(instance.date_time_recorded)
+        instance.delete()
+        rebuild_buckets(patient.pk, day)
+        patient.refresh_latest_vitals()
     
     @action(detail=False, methods=['get'])  # Simplified: Use query params
     def by_patient(self, request):
         patient_id = request.query_params.get('patient_id')  # GET /vitals/by_patient/?patient_id=ABC
         if not patient_id:
             return Response({"error": "patient_id is required"}, status=status.HTTP_400_BAD_REQUEST)
-        vitals = VitalSigns.objects.filter(patient__patient_id=patient_id)
-        serializer = self.get_serializer(vitals, many=True)
-        return Response(serializer.data)
+        vitals = VitalSigns.objects.filter(patient__patient_id=patient_id).select_related('patient')
+        return self.list_or_stream(self.project(vitals.order_by(*self.keyset_ordering)))
+
+    @action(detail=False, methods=['get'])
+    def trends(self, request):
+        """
+        Per-day/week/month count, min, max and mean of each vital, from the rollups
+        (rollups.py), never the raw readings:
+
+        GET /vitals/trends/?patient_id=P001&date_from=2025-01-01&date_to=2025-06-30&period=week&fields=heart_rate,weight
+
+        date_to defaults to today and date_from to 90 days before it; period (day, week or
+        month) defaults to whichever gives at most about a month of points.
+        """
+        params = request.query_params
+        patient_id = params.get('patient_id')
+        if not patient_id:
+            return Response({"error": "patient_id is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            patient = Patient.objects.get(patient_id=patient_id)
+        except Patient.DoesNotExist:
+            return Response({"error": "Patient not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        date_to = parse_date(params['date_to']) if params.get('date_to') else timezone.localdate()
+        date_from = parse_date(params['date_from']) if params.get('date_from') else date_to - timedelta(days=89)
+        if date_from is None or date_to is None or date_from > date_to:
+            return Response({"error": "date_from and date_to must be YYYY-MM-DD, date_from first"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        period = params.get('period') or pick_period(date_from, date_to)
+        if period not in PERIODS:
+            return Response({"error": f"period must be one of {', '.join(PERIODS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        fields = params['fields'].split(',') if params.get('fields') else VitalsRollup.FIELDS
+        unknown = [field for field in fields if field not in VitalsRollup.FIELDS]
+        if unknown:
+            return Response({"error": f"No trends for: {', '.join(unknown)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "patient_id": patient.patient_id,
+            "period": period,
+            "date_from": date_from,
+            "date_to": date_to,
+            "buckets": trends(patient, period, date_from, date_to, fields),
+        })
     
+class MeasurementSessionViewSet(viewsets.ModelViewSet):
+    """
+    High-frequency sample streams (e.g. pulse-oximeter waveforms), see timeseries.py
+
+    POST /sessions/                 {"patient_id": "P001", "signal": "ppg", "sample_rate": 100, "dtype": "int16"}
+    POST /sessions/<id>/samples/    {"samples": [512, 530, ...], "offset": 0} or raw little-endian bytes
+                                    (Content-Type: application/octet-stream, ?offset=0)
+    GET  /sessions/<id>/samples/?start=10&end=70&max_points=1000&mode=minmax   (seconds from the start)
+    POST /sessions/<id>/close/      {"vital_signs": 123} links the summary reading
+    """
+    queryset = MeasurementSession.objects.all()
+    serializer_class = MeasurementSessionSerializer
+    permission_classes = [AllowAny]
+    keyset_ordering = ('-started_at', '-id')  # Served by session_started_idx
+
+    def get_queryset(self):
+        queryset = MeasurementSession.objects.all()
+        patient_id = self.request.query_params.get('patient_id')
+        if patient_id:
+            queryset = queryset.filter(patient__patient_id=patient_id)
+        signal = self.request.query_params.get('signal')
+        if signal:
+            queryset = queryset.filter(signal=signal)
+        return queryset
+
+    @action(detail=True, methods=['get', 'post'], parser_classes=api_settings.DEFAULT_PARSER_CLASSES + [RawSamplesParser])
+    def samples(self, request, pk=None):
+        try:
+            if request.method == 'GET':
+                params = request.query_params
+                try:
+                    start = float(params['start']) if params.get('start') else None
+                    end = float(params['end']) if params.get('end') else None
+                    max_points = int(params.get('max_points', DEFAULT_READ_POINTS))
+                except ValueError:
+                    return Response({"error": "start, end and max_points must be numbers"}, status=status.HTTP_400_BAD_REQUEST)
+                return Response(read_range(self.get_object(), start, end, max_points, params.get('mode', 'mean')))
+
+            data = request.data
+            if isinstance(data, dict):
+                samples, offset = data.get('samples'), data.get('offset')
+            else:
+                samples, offset = data, request.query_params.get('offset')
+            try:
+                offset = int(offset) if offset is not None else None
+            except (TypeError, ValueError):
+                offset = -1
+            if offset is not None and offset < 0:
+                return Response({"error": "offset must be a non-negative integer"}, status=status.HTTP_400_BAD_REQUEST)
+            session, stored = append_samples(pk, samples, offset)
+        except SampleError as e:
+            return Response({"error": str(e)}, status=e.status_code)
+        return Response({
+            "session": session.id,
+            "stored": stored,
+            "sample_count": session.sample_count,  # The next append's offset
+        }, status=status.HTTP_201_CREATED if stored else status.HTTP_200_OK)
+
+    @action(detail=True, methods=['post'])
+    def close(self, request, pk=None):
+        session = self.get_object()
+        vital_signs = None
+        vital_signs_id = request.data.get('vital_signs')
+        if vital_signs_id is not None:
+            try:
+                vital_signs = VitalSigns.objects.get(pk=vital_signs_id, patient_id=session.patient_id)
+            except (VitalSigns.DoesNotExist, ValueError, TypeError):
+                return Response({"error": "Vital signs not found for this patient"}, status=status.HTTP_404_NOT_FOUND)
+        close_session(session, vital_signs)
+        return Response(self.get_serializer(session).data)
+
+
+class TriageRuleSetViewSet(viewsets.ModelViewSet):
+    """
+    Versioned triage rules (see utils.TriageRules) - GET /triage-rules/, GET /triage-rules/<version>/
+
+    POST /triage-rules/ publishes a new version, which every process picks up within
+    TriageRuleSetManager.RECHECK_SECONDS. Versions can't be edited or deleted, so each
+    QueueEntry.rule_version still says how its score was computed. Run
+    `manage.py retriage_queue` to rescore the waiting queue with the new rules.
+    {
+        "note": "Raise fever threshold",
+        "critical_min": 6, "high_min": 3, "medium_min": 1,
+        "rules": [{"group": "temperature", "field": "temperature", "operator": "gt", "threshold": 38.0, "weight": 2}, ...]
+    }
+    """
+    queryset = TriageRuleSet.objects.prefetch_related('rules')
+    serializer_class = TriageRuleSetSerializer
+    permission_classes = [AllowAny]  # Restrict in production
+    lookup_field = 'version'
+    http_method_names = ['get', 'post', 'head', 'options']
+
+    @action(detail=False, methods=['get'])
+    def active(self, request):  # GET /triage-rules/active/
+        rules = TriageRuleSet.objects.current()
+        rule_set = TriageRuleSet.objects.prefetch_related('rules').filter(version=rules.version).first()
+        if rule_set is None:
+            return Response({"version": 0, "note": "Built-in defaults (no rule sets saved)"})
+        return Response(self.get_serializer(rule_set).data)
     
 
+# RPi endpoints also speak the compact binary format (see wire_format.py)
+RPI_PARSERS = api_settings.DEFAULT_PARSER_CLASSES + [CompactVitalsParser]
+RPI_RENDERERS = api_settings.DEFAULT_RENDERER_CLASSES + [CompactVitalsRenderer]
+
 @api_view(['POST'])
+@parser_classes(RPI_PARSERS)
+@renderer_classes(RPI_RENDERERS)
 def receive_vital_signs(request):  # FOR RPi
     """
     FOR RPi - Receives vital signs data from Raspberry Pi
@@ -92,52 +364,38 @@ def receive_vital_signs(request):  # FOR RPi
         "temperature": 36.5,
         "oxygen_saturation": 98,
         "weight": 65.5,
-        "height": 170.0
+        "height": 170.0,
+        "blood_pressure_systolic": 120,  # optional, mmHg
+        "blood_pressure_diastolic": 80
         # BMI optional: auto-computed from height/weight
     }
+    Instead of a value, a vital can be sent as raw samples and reduced here:
+    "samples": {"temperature": [35.2, 36.1, 36.5, 36.6, ...], "heart_rate": [...]}
     """
     
     try:
         data = request.data  # Expecting JSON data
+        if isinstance(data, list):  # Compact uploads always parse to a list of readings
+            if len(data) != 1:
+                return Response(
+                    {"error": "Send exactly one reading here; use receive-vitals/batch/ for more"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            data = data[0]
         
-        patient_id = data.get('patient_id')
-        if not patient_id:
-            return Response(
-                {"error": "patient_id is required"}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )        
+        # Validate, save the vitals, bump last_visit and (re)queue the patient in one
+        # transaction with a fixed number of queries (see ingest.ingest_reading)
         try:
-            patient = Patient.objects.get(patient_id=patient_id)
-        except Patient.DoesNotExist:
-            return Response(
-                {
-                    "error": "Patient not found",
-                    "patient_id": patient_id
-                }, 
-                status=status.HTTP_404_NOT_FOUND
-            )
-            
-        # Create vital signs (no 'timestamp'; auto_now_add handles it. BMI auto-computed)
-        vital_signs = VitalSigns.objects.create(
-            patient=patient,
-            device_id=data.get('device_id'),  # Optional from RPi
-            heart_rate=data.get('heart_rate'),
-            temperature=data.get('temperature'),
-            oxygen_saturation=data.get('oxygen_saturation'),
-            weight=data.get('weight'),
-            height=data.get('height'),
-            # BMI: Auto-computed in model.save()
-            # Add BP if implemented: blood_pressure_systolic=data.get('systolic'), etc.
-        )
-        
-        # UPDATE LAST VISIT
-        patient.last_visit = timezone.now()
-        patient.save()
-        
-        queue_entry, created = QueueEntry.objects.get_or_create(patient=patient)
-        queue_entry.priority = compute_patient_priority(patient)
-        queue_entry.save()
+            patient, vital_signs = ingest_reading(data)
+        except ReadingError as e:
+            if e.status_code == status.HTTP_404_NOT_FOUND:
+                return Response({"error": str(e), "patient_id": data.get('patient_id')}, status=e.status_code)
+            return Response({"error": str(e)}, status=e.status_code)
         
+        # Compact clients only need the ack, so skip the serializer entirely
+        if isinstance(request.accepted_renderer, CompactVitalsRenderer):
+            return Response({"id": vital_signs.id}, status=status.HTTP_201_CREATED)
+
         # Serialize and return
         serializer = VitalSignsSerializer(vital_signs)
         patient_name = f"{patient.first_name} {patient.last_name}".strip()
@@ -156,6 +414,183 @@ def receive_vital_signs(request):  # FOR RPi
             "details": str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['POST'])
+@parser_classes(RPI_PARSERS)
+@renderer_classes(RPI_RENDERERS)
+def receive_vital_signs_batch(request):  # FOR RPi
+    """
+    FOR RPi - Receives a backlog of readings (e.g. after a Wi-Fi drop) in one request
+
+    Expected JSON format (or a bare list of readings):
+    {
+        "readings": [
+            {"patient_id": "P001", "heart_rate": 72, "temperature": 36.5, ...},
+            {"patient_id": "P002", "oxygen_saturation": 95, ...}
+        ]
+    }
+
+    Returns one result per reading, in order. Valid readings are saved even if others fail.
+    A saved reading's "id" is null on MySQL, which returns no ids from a bulk insert; use
+    devices/<device_id>/sync/ where the device needs them.
+    """
+    data = request.data
+    readings = data.get('readings') if isinstance(data, dict) else data
+    if not isinstance(readings, list) or not readings:
+        return Response({"error": "readings must be a non-empty list"}, status=status.HTTP_400_BAD_REQUEST)
+    if len(readings) > MAX_BATCH_SIZE:
+        return Response(
+            {"error": f"At most {MAX_BATCH_SIZE} readings per request"},
+            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+
+    results = ingest_batch(readings)
+    saved = sum(1 for result in results if result['status'] == 201)
+    return Response({
+        "success": saved == len(results),
+        "saved": saved,
+        "failed": len(results) - saved,
+        "results": results,
+    }, status=status.HTTP_201_CREATED if saved == len(results) else status.HTTP_207_MULTI_STATUS)
+
+@api_view(['POST'])
+@parser_classes(RPI_PARSERS)
+@renderer_classes(RPI_RENDERERS)
+def receive_vital_signs_async(request):  # FOR RPi
+    """
+    FOR RPi - Write-behind ingestion: validates and journals the reading(s), then returns 202
+
+    Accepts the same body as receive-vitals/ (one reading) or receive-vitals/batch/.
+    The background workers (`python manage.py run_ingest_workers`) save the vitals and
+    update the queue; poll the returned status_url for per-reading results.
+    """
+    data = request.data
+    if isinstance(data, dict) and 'readings' in data:
+        readings = data['readings']
+    elif isinstance(data, list):
+        readings = data
+    else:
+        readings = [data]
+    if not isinstance(readings, list) or not readings:
+        return Response({"error": "readings must be a non-empty list"}, status=status.HTTP_400_BAD_REQUEST)
+    if len(readings) > MAX_BATCH_SIZE:
+        return Response(
+            {"error": f"At most {MAX_BATCH_SIZE} readings per request"},
+            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+
+    job, errors = enqueue_readings(readings)
+    if job is None:
+        return Response({"error": "No valid readings", "results": errors}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({
+        "success": True,
+        "job_id": job.id,
+        "queued": job.reading_count,
+        "rejected": errors,
+        "status_url": request.build_absolute_uri(f"/api/ingest/jobs/{job.id}/"),
+    }, status=status.HTTP_202_ACCEPTED)
+
+@api_view(['GET'])
+def ingest_job_status(request, job_id):
+    """Status and per-reading results of a journaled upload"""
+    try:
+        job = IngestJob.objects.get(pk=job_id)
+    except IngestJob.DoesNotExist:
+        return Response({"error": "Job not found"}, status=status.HTTP_404_NOT_FOUND)
+    return Response({
+        "job_id": job.id,
+        "status": job.status,
+        "readings": job.reading_count,
+        "attempts": job.attempts,
+        "received_at": job.received_at,
+        "finished_at": job.finished_at,
+        "results": job.results,
+        "error": job.error or None,
+    })
+
+@api_view(['GET'])
+def export_data(request, dataset, extension):
+    """
+    Streamed bulk export - GET /api/export/<patients|vitals|queue>.<csv|ndjson>
+    ?date_from=2025-01-01&date_to=2025-01-31&columns=patient_id,recorded_at,heart_rate
+
+    Rows are read in keyset chunks and sent as they are formatted, so memory
+    stays constant however long the range (see export.py). For very large exports on a
+    WSGI server prefer `manage.py export_data`, which doesn't hold a web worker.
+    """
+    params = request.query_params
+    try:
+        date_from = parse_date(params['date_from']) if params.get('date_from') else None
+        date_to = parse_date(params['date_to']) if params.get('date_to') else None
+    except ValueError:
+        date_from = date_to = None
+    if (params.get('date_from') and date_from is None) or (params.get('date_to') and date_to is None):
+        return Response({"error": "date_from and date_to must be YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
+    columns = [name for name in params.get('columns', '').split(',') if name]
+    try:
+        content_type, parts = export(dataset, extension, columns, date_from, date_to)
+    except ExportError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    response = streaming_response(request, parts, content_type)
+    filename = f"{dataset}-{date_from or 'start'}-{date_to or timezone.localdate()}.{extension}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@api_view(['GET'])
+def ingest_metrics_view(request):
+    """Write-behind journal lag and throughput (?window=300 seconds)"""
+    try:
+        window = max(1, int(request.query_params.get('window', 300)))
+    except ValueError:
+        window = 300
+    return Response(ingest_metrics(timedelta(seconds=window)))
+
+@api_view(['GET', 'POST'])
+@parser_classes(RPI_PARSERS)
+@renderer_classes(RPI_RENDERERS)
+def device_sync(request, device_id):  # FOR RPi
+    """
+    FOR RPi - Store-and-forward sync for vitals devices
+
+    GET  -> {"device_id": ..., "high_water_mark": 41}: the device uploads everything after it
+    POST -> upload the next chunk, oldest first:
+    {
+        "readings": [
+            {"seq": 42, "recorded_at": "2025-11-03T08:15:00+08:00", "patient_id": "P001", "heart_rate": 72, ...},
+            ...
+        ]
+    }
+    Re-sending a chunk is safe: readings at or below the high-water mark, or already stored,
+    are acknowledged as duplicates and not stored again. The mark only advances over
+    contiguous seqs, so after an out-of-order chunk it stays below the missing readings.
+    """
+    if request.method == 'GET':
+        device = Device.objects.filter(device_id=device_id).first()
+        return Response({
+            "device_id": device_id,
+            "high_water_mark": device.high_water_mark if device else 0,
+            "last_seen_at": device.last_seen_at if device else None,
+        })
+
+    data = request.data
+    readings = data.get('readings') if isinstance(data, dict) else data
+    if not isinstance(readings, list) or not readings:
+        return Response({"error": "readings must be a non-empty list"}, status=status.HTTP_400_BAD_REQUEST)
+    if len(readings) > MAX_SYNC_CHUNK:
+        return Response(
+            {"error": f"At most {MAX_SYNC_CHUNK} readings per chunk"},
+            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+
+    high_water_mark, results = sync_device(device_id, readings)
+    return Response({
+        "device_id": device_id,
+        "high_water_mark": high_water_mark,
+        "stored": sum(1 for result in results if result['status'] == 201),
+        "duplicates": sum(1 for result in results if result.get('duplicate')),
+        "results": results,
+    })
+
 @api_view(['GET'])
 def test_rpi_connection(request):
     """
@@ -247,30 +682,183 @@ def logout(request):
 @api_view(['GET'])
 def get_all_patients(request):
     # Add auth check if needed (e.g., permission_classes = [IsAuthenticated])
-    patients = Patient.objects.all()
-    serializer = PatientSerializer(patients, many=True)
-    return Response(serializer.data)
+    context = {'request': request}  # For ?fields=/?omit= (fieldsets.py)
+    patients = project(Patient.objects.all(), PatientSerializer(context=context), PATIENT_ORDERING)
+    if wants_stream(request):  # ?stream=1: same list, in constant memory (spreadsheets: /export/patients.csv)
+        return stream_json(request, patients.order_by('id'), PatientSerializer, context)
+    paginator = KeysetPagination()  # Pages like /patients/ (follow the Link header)
+    page = paginator.paginate_queryset(patients, request, ordering=PATIENT_ORDERING)
+    return paginator.get_paginated_response(PatientSerializer(page, many=True, context=context).data)
 
-class QueueViewSet(viewsets.ModelViewSet):
-    queryset = QueueEntry.objects.all()
+class QueueViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
+    queryset = QueueEntry.objects.select_related('patient')
     serializer_class = QueueEntrySerializer
     permission_classes = [AllowAny]  # Restrict in production
+    keyset_ordering = ('priority_rank', 'entered_at', 'id')  # Served by queue_rank_entered_idx
     
     @action(detail=False, methods=['get'])
     def current_queue(self, request):
-        """Get sorted queue: Prioritize by priority level, then entered_at (earliest first)."""
-        queue = QueueEntry.objects.all().select_related(
-            'patient', 'patient__vital_signs'  # Fixed: correct related_name
-        ).annotate(
-            priority_order=Case(
-                When(priority='CRITICAL', then=1),
-                When(priority='HIGH', then=2),
-                When(priority='MEDIUM', then=3),
-                default=4,
-                output_field=IntegerField()
-            )
-        ).order_by('priority_order', 'entered_at')
-        
-        serializer = self.get_serializer(queue, many=True)
-        return Response(serializer.data)
- 
\ No newline at end of file
+        """Get sorted queue: Prioritize by priority level, then entered_at (earliest first).
+
+        Served from the in-memory queue engine, so polling this does not hit the database.
+        Each entry includes estimated_wait_seconds and estimated_call_time, based on the
+        rolling service time of each priority tier ahead of it.
+        Pass ?page_size=20 (and then ?cursor=...) for keyset pages, e.g. "next 20 patients";
+        without them it returns the whole waiting queue, which only holds today's entries.
+        """
+        engine = get_queue_engine()
+        paginator = self.paginator
+        if not paginator.is_requested(request):
+            return Response(self.trim(engine.snapshot()))
+
+        after = paginator.get_cursor(request)
+        if after is not None:
+            try:
+                rank, entered_at, entry_id = after
+                after = (int(rank), parse_datetime(entered_at), int(entry_id))
+            except (TypeError, ValueError):
+                raise NotFound("Invalid cursor")
+            if after[1] is None:
+                raise NotFound("Invalid cursor")
+        entries, last_key = engine.page(after, paginator.get_page_size(request))
+        paginator.set_next(request, last_key)
+        return paginator.get_paginated_response(self.trim(entries))
+
+    def trim(self, entries):
+        """Apply ?fields=/?omit= to engine payloads (already serialized, so nothing is read anyway)."""
+        fields, omit = requested_fieldsets(self.request)
+        if fields is None and not omit:
+            return entries
+        allowed = {**shape(QueueEntrySerializer()), 'estimated_wait_seconds': None, 'estimated_call_time': None}
+        return trim(entries, allowed, fields, omit)
+
+    def _finish(self, entry, status_value):
+        if not entry.finish(status_value):
+            entry.refresh_from_db(fields=['status'])
+            return Response({"error": f"Queue entry is already {entry.status.lower()}"}, status=status.HTTP_409_CONFLICT)
+        return Response(self.get_serializer(entry).data)
+
+    @action(detail=True, methods=['post'])
+    def serve(self, request, pk=None):  # POST /queue/<id>/serve/
+        return self._finish(self.get_object(), QueueEntry.SERVED)
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):  # POST /queue/<id>/cancel/
+        return self._finish(self.get_object(), QueueEntry.CANCELLED)
+
+    @action(detail=False, methods=['post'])
+    def serve_next(self, request):  # POST /queue/serve_next/ - serves whoever is at the head of the queue
+        # The engine's order may be a moment stale (another station just served the head,
+        # or it was deleted): finish() only changes a row that is still waiting, so on a
+        # miss try the next one
+        for head in get_queue_engine().snapshot():
+            entry = QueueEntry.objects.select_related('patient').filter(pk=head['id']).first()
+            if entry is not None and entry.finish(QueueEntry.SERVED):
+                return Response(self.get_serializer(entry).data)
+        return Response({"error": "Queue is empty"}, status=status.HTTP_404_NOT_FOUND)
+
+    @action(detail=False, methods=['get'])
+    def history(self, request):
+        """Archived (served/cancelled) entries for reports - GET /queue/history/?date_from=&date_to=&patient_id="""
+        archive = QueueEntryArchive.objects.select_related('patient')
+
+        patient_id = request.query_params.get('patient_id')
+        if patient_id:
+            archive = archive.filter(patient__patient_id=patient_id)
+
+        date_from = request.query_params.get('date_from')
+        date_to = request.query_params.get('date_to')
+        if date_from:
+            archive = archive.filter(entered_at__gte=date_from)
+        if date_to:
+            archive = archive.filter(entered_at__lte=date_to)
+
+        ordering = ('-entered_at', '-id')  # Served by the entered_at index
+        context = self.get_serializer_context()
+        archive = project(archive, QueueEntryArchiveSerializer(context=context), ordering)
+        page = self.paginator.paginate_queryset(archive, request, ordering=ordering)
+        return self.paginator.get_paginated_response(QueueEntryArchiveSerializer(page, many=True, context=context).data)
+
+
+STREAM_POLL_SECONDS = 0.5    # How often the stream checks the engine for new deltas (memory only)
+STREAM_HEARTBEAT_SECONDS = 15  # Keeps proxies from closing an idle connection
+STREAM_RETRY_MS = 3000
+
+
+def _sse(event, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, cls=DjangoJSONEncoder)}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def _queue_events(engine, cursor, keep_open):
+    """Yield SSE frames: a snapshot (or missed deltas) first, then live deltas."""
+    yield f"retry: {STREAM_RETRY_MS}\n\n"
+
+    deltas = None
+    if cursor is not None:
+        version, deltas = await sync_to_async(engine.changes_since)(cursor)
+    if deltas is None:
+        version, snapshot = await sync_to_async(engine.snapshot_with_version)()
+        yield _sse('snapshot', snapshot, version)
+    else:
+        for change_version, event, data in deltas:
+            yield _sse(event, data, change_version)
+    cursor = version
+
+    idle = 0.0
+    while keep_open:
+        await asyncio.sleep(STREAM_POLL_SECONDS)
+        # Every engine call goes to the sync thread: it takes the engine's lock, which a
+        # reload holds while querying, and may query the database itself (day rolled over,
+        # or time to check QueueVersion). A reload clears the change log, so the client
+        # then gets a fresh snapshot
+        version, deltas = await sync_to_async(engine.changes_since)(cursor)
+        if deltas is None:
+            cursor, snapshot = await sync_to_async(engine.snapshot_with_version)()
+            yield _sse('snapshot', snapshot, cursor)
+            idle = 0.0
+        elif deltas:
+            for change_version, event, data in deltas:
+                yield _sse(event, data, change_version)
+            cursor = version
+            idle = 0.0
+        else:
+            idle += STREAM_POLL_SECONDS
+            if idle >= STREAM_HEARTBEAT_SECONDS:
+                yield ": heartbeat\n\n"
+                idle = 0.0
+
+
+async def queue_stream(request):
+    """
+    Server-Sent Events stream of queue changes - GET /api/queue/stream/
+
+    The first frame is a `snapshot` of the current queue; after that the stream sends
+    `insert`, `reprioritize`, `update`, `serve`, `cancel` and `remove` events, each with
+    the queue version as its SSE id. A reconnecting display resumes with `?since=<version>` (browsers send
+    the Last-Event-ID header automatically) and only receives the changes it missed,
+    or a new snapshot if it has been away longer than the change log reaches.
+
+    Needs an ASGI server (e.g. `uvicorn backend.asgi:application`). Under WSGI the
+    response ends after the first batch and the client's EventSource reconnects.
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+
+    cursor = request.GET.get('since') or request.headers.get('Last-Event-ID')
+    try:
+        cursor = int(cursor) if cursor is not None else None
+    except ValueError:
+        cursor = None
+
+    response = StreamingHttpResponse(
+        _queue_events(get_queue_engine(), cursor, keep_open=isinstance(request, ASGIRequest)),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Don't let nginx buffer the stream
+    return response
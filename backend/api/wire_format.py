@@ -0,0 +1,178 @@
+"""
+Compact binary format for RPi vitals uploads (media type application/vnd.esperanza.vitals).
+
+JSON readings are ~150 bytes each and go through DRF's JSON parser; the stations' links
+are slow, so they can post fixed-layout records instead (41 bytes per reading):
+
+    header  <4sBH50s   magic b'ESPV', version 1, reading count, device_id (NUL-padded)
+    record  <15sHHHHHqQ
+            patient_id (NUL-padded ASCII),
+            heart_rate (bpm), temperature (0.01 °C), oxygen_saturation (0.1 %),
+            weight (0.1 kg), height (mm) - unsigned fixed-point, 0xFFFF = missing,
+            recorded_at (Unix epoch milliseconds, 0 = arrival time),
+            seq (device reading number for the sync protocol, 0 = none)
+
+Fixed-point integers can't be negative, NaN or infinite, so the validator (compiled once
+at import time) only has to check the patient ID (present, ASCII) and that the timestamp
+is a representable date. The parser unpacks the
+body with one struct.iter_unpack call and returns the same list of readings the JSON
+endpoints accept, without going through a serializer. Records that fail validation
+become {'_error': ...} so ingestion reports them per item.
+
+Responses can be requested in the same media type (Accept header). They are acks:
+
+    header  <4sBH      magic b'ESPA', version 1, count
+    record  <HQ        HTTP status of the item, id (VitalSigns / job id, 0 if none)
+"""
+
+import struct
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+
+MEDIA_TYPE = 'application/vnd.esperanza.vitals'
+VERSION = 1
+
+HEADER = struct.Struct('<4sBH50s')
+RECORD = struct.Struct('<15sHHHHHqQ')
+ACK_HEADER = struct.Struct('<4sBH')
+ACK_RECORD = struct.Struct('<HQ')
+
+MISSING = 0xFFFF
+
+# Reading fields in record order (after patient_id) and their fixed-point scale
+SCALED_FIELDS = (
+    ('heart_rate', 1),
+    ('temperature', 100),
+    ('oxygen_saturation', 10),
+    ('weight', 10),
+    ('height', 1000),
+)
+
+
+def _compile_validator():
+    """Build the per-record check once; returns a function(record tuple) -> error or None."""
+    epoch = datetime.fromtimestamp(0, tz=dt_timezone.utc)
+    max_ms = (datetime.max.replace(tzinfo=dt_timezone.utc) - epoch) // timedelta(milliseconds=1)
+
+    def validate(record):
+        if not record[0] or record[0][0] == 0:
+            return "patient_id is required"
+        if not record[0].isascii():
+            return "patient_id must be ASCII"
+        if not 0 <= record[6] <= max_ms:
+            return "recorded_at must be a positive epoch timestamp"
+        return None
+
+    return validate
+
+
+def _compile_decoder():
+    """Build the record -> reading conversion once, with the field layout baked in."""
+    (hr, _), (temp, temp_scale), (spo2, spo2_scale), (weight, weight_scale), (height, height_scale) = SCALED_FIELDS
+    epoch = datetime.fromtimestamp(0, tz=dt_timezone.utc)
+
+    def decode(record, device_id):
+        patient_id, hr_v, temp_v, spo2_v, weight_v, height_v, recorded_ms, seq = record
+        reading = {
+            'patient_id': patient_id.rstrip(b'\0').decode('ascii'),
+            'device_id': device_id,
+            hr: None if hr_v == MISSING else hr_v,
+            # Dividing the integer gives back exactly what the station sent (3660 -> 36.6)
+            temp: None if temp_v == MISSING else temp_v / temp_scale,
+            spo2: None if spo2_v == MISSING else spo2_v / spo2_scale,
+            weight: None if weight_v == MISSING else weight_v / weight_scale,
+            height: None if height_v == MISSING else height_v / height_scale,
+        }
+        if recorded_ms:
+            reading['recorded_at'] = (epoch + timedelta(milliseconds=recorded_ms)).isoformat()
+        if seq:
+            reading['seq'] = seq
+        return reading
+
+    return decode
+
+
+validate_record = _compile_validator()
+decode_record = _compile_decoder()
+
+
+def decode_readings(body):
+    """Unpack an upload into a list of readings."""
+    if len(body) < HEADER.size:
+        raise ParseError("Compact vitals payload is too short")
+    magic, version, count, device_id = HEADER.unpack_from(body)
+    if magic != b'ESPV' or version != VERSION:
+        raise ParseError("Not a compact vitals payload (bad magic or version)")
+    if len(body) != HEADER.size + count * RECORD.size:
+        raise ParseError(f"Expected {count} records of {RECORD.size} bytes")
+    try:
+        device_id = device_id.rstrip(b'\0').decode('ascii') or None
+    except UnicodeDecodeError:
+        raise ParseError("device_id must be ASCII")
+
+    readings = []
+    for record in RECORD.iter_unpack(memoryview(body)[HEADER.size:]):
+        error = validate_record(record)
+        # Invalid records keep their position so per-item results line up with the upload
+        readings.append({'_error': error} if error else decode_record(record, device_id))
+    return readings
+
+
+def encode_readings(readings, device_id=''):
+    """Pack readings (dicts in the JSON format) into an upload body - used by RPi clients and benchmarks."""
+    parts = [HEADER.pack(b'ESPV', VERSION, len(readings), (device_id or '').encode('ascii'))]
+    for reading in readings:
+        recorded_at = reading.get('recorded_at')
+        if isinstance(recorded_at, str):
+            recorded_at = datetime.fromisoformat(recorded_at)
+        values = [
+            MISSING if reading.get(field) is None else round(reading[field] * scale)
+            for field, scale in SCALED_FIELDS
+        ]
+        parts.append(RECORD.pack(
+            reading['patient_id'].encode('ascii'),
+            *values,
+            int(recorded_at.timestamp() * 1000) if recorded_at else 0,
+            reading.get('seq') or 0,
+        ))
+    return b''.join(parts)
+
+
+def decode_acks(body):
+    """Unpack a compact response into [(status, id), ...]."""
+    magic, version, count = ACK_HEADER.unpack_from(body)
+    if magic != b'ESPA' or version != VERSION:
+        raise ValueError("Not a compact vitals ack")
+    return list(ACK_RECORD.iter_unpack(body[ACK_HEADER.size:ACK_HEADER.size + count * ACK_RECORD.size]))
+
+
+class CompactVitalsParser(BaseParser):
+    """Parses compact uploads into a list of readings (what the batch endpoints accept)."""
+    media_type = MEDIA_TYPE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return decode_readings(stream.read())
+
+
+class CompactVitalsRenderer(BaseRenderer):
+    """Renders ingestion responses as fixed-size acks instead of JSON."""
+    media_type = MEDIA_TYPE
+    format = 'compact'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        status_code = response.status_code if response is not None else 200
+        if isinstance(data, dict) and isinstance(data.get('results'), list):
+            acks = [(item.get('status', status_code), item.get('id') or 0) for item in data['results']]
+        elif isinstance(data, dict):
+            acks = [(status_code, data.get('id') or data.get('job_id') or 0)]
+        else:
+            acks = [(status_code, 0)]
+        return ACK_HEADER.pack(b'ESPA', VERSION, len(acks)) + b''.join(
+            ACK_RECORD.pack(code, ident) for code, ident in acks
+        )
@@ -10,7 +10,13 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 import os
 
 from django.core.asgi import get_asgi_application
+from dotenv import load_dotenv
 
+# Load environment variables from .env file (same as wsgi.py)
+load_dotenv()
+
+# Serves the API plus the long-lived queue stream (/api/queue/stream/), e.g.:
+#   uvicorn backend.asgi:application --host 0.0.0.0 --port 8000
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_asgi_application()
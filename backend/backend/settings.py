@@ -36,7 +36,11 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.AllowAny",
     ],
+    # Every list endpoint is cursor-paginated (api/pagination.py)
+    "DEFAULT_PAGINATION_CLASS": "api.pagination.KeysetPagination",
+    "PAGE_SIZE": 50,
 }
+API_MAX_PAGE_SIZE = 500  # Largest ?page_size= a client may ask for
 
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=30),
@@ -106,6 +110,10 @@ DATABASES = {
     }
 }
 
+# MySQL skips conditional unique constraints (QueueEntry's one waiting entry per patient);
+# ingest locks the patient row instead, so the warning is expected
+SILENCED_SYSTEM_CHECKS = ['models.W036']
+
 # DATABASES = {
 #     'default': {
 #         'ENGINE': 'django.db.backends.sqlite3',
@@ -162,6 +170,7 @@ CORS_ALLOWED_ORIGINS = [
     "http://192.168.1.31:3000"
 ]
 CORS_ALLOW_CREDENTIALS = True  # Fixed typo
+CORS_EXPOSE_HEADERS = ['Link', 'X-Next-Cursor']  # Cursor pagination headers (api/pagination.py)
 
 # CSRF settings for session auth:
 CSRF_TRUSTED_ORIGINS = [
@@ -177,4 +186,6 @@ SESSION_COOKIE_HTTPONLY = True  # Prevents JavaScript from accessing the cookie
 SESSION_COOKIE_SECURE = False  # Set to True when you use HTTPS in production
 SESSION_COOKIE_SAMESITE = 'Lax'  # CSRF protection
 SESSION_COOKIE_AGE = 86400  # Session expires after 24 hours (in seconds)
-SESSION_COOKIE_DOMAIN = None  # Allow cookies on both localhost and 127.0.0.1
\ No newline at end of file
+SESSION_COOKIE_DOMAIN = None  # Allow cookies on both localhost and 127.0.0.1
+# Columnar analytics snapshot of the vitals (api/snapshot.py, `manage.py snapshot_vitals`)
+ANALYTICS_SNAPSHOT_DIR = BASE_DIR / 'analytics'
@@ -24,6 +24,7 @@ export default function PatientRecords() {
   const [latestVitals, setLatestVitals] = useState(null)
   const [history, setHistory] = useState([])
   const [bpInput, setBpInput] = useState('')
+  const [nextCursor, setNextCursor] = useState(null) // Lists come in pages; the server sends where the next one starts
 
   const constructName = (patient) => {
     if (patient.name) return patient.name
@@ -40,18 +41,20 @@ export default function PatientRecords() {
     fetchPatients(searchTerm)
   }, [searchParams])
 
-  const fetchPatients = async (searchTerm = '') => {
+  const fetchPatients = async (searchTerm = '', cursor = null) => {
     setLoading(true)
     try {
-      const url = searchTerm
-        ? `http://localhost:8000/patients/?search=${encodeURIComponent(searchTerm)}`
-        : `http://localhost:8000/patients/`
+      const params = new URLSearchParams()
+      if (searchTerm) params.set('search', searchTerm)
+      if (cursor) params.set('cursor', cursor)
+      const url = `http://localhost:8000/patients/${params.toString() ? `?${params}` : ''}`
       const res = await fetch(url, {
         credentials: 'include',
       })
       if (!res.ok) throw new Error('Failed to fetch patients')
       const data = await res.json()
-      setPatients(data)
+      setPatients(prev => (cursor ? [...prev, ...data] : data))
+      setNextCursor(res.headers.get('X-Next-Cursor'))
     } catch (err) {
       console.error('Failed to fetch patients:', err)
       alert('Failed to fetch patients')
@@ -75,7 +78,8 @@ export default function PatientRecords() {
           fetchVitals(firstPatient.id)
         }
       } else {
-        const firstPatient = patients[0]
+        // Keep the selection when more patients are loaded below it
+        const firstPatient = patients.find(p => p.id === currentPatient?.id) || patients[0]
         setCurrentPatient(firstPatient)
         if (firstPatient) {
            fetchVitals(firstPatient.id)
@@ -640,6 +644,18 @@ export default function PatientRecords() {
             )}
           </div>
         ))}
+
+        {nextCursor && !loading && (
+          <div className="text-center">
+            <button
+              onClick={() => fetchPatients(searchParams.get('q') || '', nextCursor)}
+              className="rounded-xl border px-4 py-2 font-semibold"
+              style={{ color: BRAND.text, background: BRAND.bg, borderColor: BRAND.border }}
+            >
+              Load more patients
+            </button>
+          </div>
+        )}
       </div>
 
       
@@ -85,12 +85,25 @@ export default function Register() {
 
     try {
       // Register the patient
-      const registerRes = await fetch('http://localhost:8000/patients/', {
+      const register = (allowDuplicate) => fetch(
+        `http://localhost:8000/patients/${allowDuplicate ? '?allow_duplicate=1' : ''}`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json'},
         credentials: 'include',
         body: JSON.stringify(patientProfile),
       })
+      let registerRes = await register(false)
+
+      // The server found patients who are probably the same person
+      if (registerRes.status === 409) {
+        const { duplicates } = await registerRes.json()
+        const names = duplicates.map(p => `${p.first_name} ${p.last_name} (${p.patient_id}, born ${p.birthdate || 'unknown'})`)
+        if (!window.confirm("This patient may already be registered:\n" + names.join('\n') + "\n\nRegister a new record anyway?")) {
+          setCreating(false)
+          return
+        }
+        registerRes = await register(true)
+      }
       
       if (!registerRes.ok) {
         const err = await registerRes.json()
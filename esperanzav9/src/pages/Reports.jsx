@@ -25,6 +25,7 @@ export default function Reports() {
   const [query, setQuery] = useState(searchParams.get('q') || '') // ✅ Initialize query from URL
   const [patients, setPatients] = useState([])
   const [loading, setLoading] = useState(true)
+  const [nextCursor, setNextCursor] = useState(null) // Lists come in pages; the server sends where the next one starts
 
   useEffect(() => {
     fetchPatients()
@@ -51,15 +52,19 @@ export default function Reports() {
   }
   // ✅ End of helper functions
 
-  const fetchPatients = async () => {
+  const fetchPatients = async (cursor = null) => {
     setLoading(true)
     try {
-      const res = await fetch('http://localhost:8000/patients/', {
+      const url = cursor
+        ? `http://localhost:8000/patients/?cursor=${encodeURIComponent(cursor)}`
+        : 'http://localhost:8000/patients/'
+      const res = await fetch(url, {
         credentials: 'include',
       })
       if (!res.ok) throw new Error('Failed to fetch patients')
       const data = await res.json()
-      setPatients(data)
+      setPatients(prev => (cursor ? [...prev, ...data] : data))
+      setNextCursor(res.headers.get('X-Next-Cursor'))
     } catch (err) {
       console.error('Failed to fetch patients:', err)
       alert('Failed to fetch patient records')
@@ -200,7 +205,7 @@ export default function Reports() {
               </tr>
             </thead>
             <tbody style={{ background: TABLE_BG, color: TEAL }}>
-              {loading ? (
+              {loading && patients.length === 0 ? (
                 <tr>
                   <td className="px-4 py-6 text-center" colSpan={8}>
                     Loading patient records...
@@ -229,6 +234,17 @@ export default function Reports() {
             </tbody>
           </table>
         </div>
+        {nextCursor && !loading && (
+          <div className="mt-4 text-center">
+            <button
+              onClick={() => fetchPatients(nextCursor)}
+              className="px-4 py-2 rounded-lg font-semibold"
+              style={{ color: TEAL, background: TABLE_BG }}
+            >
+              Load more patients
+            </button>
+          </div>
+        )}
         <div className="h-4" />
       </div>
     </section>